@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Carrega as variáveis de ambiente do arquivo .env que está na pasta 'backend'
@@ -12,6 +13,114 @@ class Settings:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL")
     SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_KEY")
 
+    # Logs: nível, formato (text ou json), escrita em fila por uma thread, valores de
+    # variáveis nas exceções e fração das requisições com eventos DEBUG registrados
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text").lower()
+    LOG_ENQUEUE: bool = os.getenv("LOG_ENQUEUE", "true").lower() == "true"
+    LOG_QUEUE_MAX_SIZE: int = int(os.getenv("LOG_QUEUE_MAX_SIZE", "10000"))
+    LOG_DIAGNOSE: bool = os.getenv("LOG_DIAGNOSE", "false").lower() == "true"
+    LOG_DEBUG_SAMPLE_RATE: float = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+    # Pool de conexões HTTP compartilhado com o Supabase/PostgREST
+    SUPABASE_POOL_SIZE: int = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+    SUPABASE_POOL_KEEPALIVE: int = int(os.getenv("SUPABASE_POOL_KEEPALIVE", "10"))
+    SUPABASE_KEEPALIVE_EXPIRY: float = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+    SUPABASE_TIMEOUT: float = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+    SUPABASE_CONNECT_TIMEOUT: float = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+
+    # Cache de embeddings (memória LRU + TTL; o caminho em disco é opcional)
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+    EMBEDDING_CACHE_TTL_SECONDS: float = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+    EMBEDDING_CACHE_DISK_PATH: str = os.getenv("EMBEDDING_CACHE_DISK_PATH", "")
+
+    # Pipeline de ingestão da base de conhecimento
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "100"))
+    INGEST_EMBED_CONCURRENCY: int = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+    INGEST_MAX_RETRIES: int = int(os.getenv("INGEST_MAX_RETRIES", "5"))
+    INGEST_RETRY_BACKOFF_SECONDS: float = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "2"))
+
+    # Divisão estrutural em chunks (um por artigo/cláusula; maiores que o máximo são
+    # divididos, menores que o mínimo são agrupados com os vizinhos da mesma seção)
+    STATUTE_CHUNK_MAX_CHARS: int = int(os.getenv("STATUTE_CHUNK_MAX_CHARS", "2000"))
+    STATUTE_CHUNK_MIN_CHARS: int = int(os.getenv("STATUTE_CHUNK_MIN_CHARS", "600"))
+    CONTRACT_CHUNK_MAX_CHARS: int = int(os.getenv("CONTRACT_CHUNK_MAX_CHARS", "1500"))
+    CONTRACT_CHUNK_MIN_CHARS: int = int(os.getenv("CONTRACT_CHUNK_MIN_CHARS", "300"))
+
+    # Extração de PDFs (processos usados e mínimo de páginas para paralelizar)
+    PDF_EXTRACTION_WORKERS: int = int(os.getenv("PDF_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+
+    # Processamento de contratos em segundo plano
+    UPLOAD_JOB_WORKERS: int = int(os.getenv("UPLOAD_JOB_WORKERS", "2"))
+    UPLOAD_JOB_TTL_SECONDS: float = float(os.getenv("UPLOAD_JOB_TTL_SECONDS", "3600"))
+
+    # Cache em disco dos índices FAISS de contratos (endereçado pelo conteúdo)
+    CONTRACT_INDEX_CACHE_DIR: str = os.getenv(
+        "CONTRACT_INDEX_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mmdireito_contract_indexes")
+    )
+    CONTRACT_INDEX_CACHE_MAX_BYTES: int = int(os.getenv("CONTRACT_INDEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    CONTRACT_INDEX_CACHE_MAX_IN_MEMORY: int = int(os.getenv("CONTRACT_INDEX_CACHE_MAX_IN_MEMORY", "32"))
+
+    # Sessões dos agentes (limites em memória e backend persistente: sqlite, redis ou none)
+    SESSION_MAX_SESSIONS: int = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+    SESSION_IDLE_TTL_SECONDS: float = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+    SESSION_MAX_BYTES: int = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "sqlite")
+    SESSION_SQLITE_PATH: str = os.getenv(
+        "SESSION_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "mmdireito_sessions.sqlite3")
+    )
+    SESSION_REDIS_URL: str = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+    SESSION_PERSIST_TTL_SECONDS: float = float(os.getenv("SESSION_PERSIST_TTL_SECONDS", str(7 * 24 * 3600)))
+
+    # Histórico enviado ao LLM (orçamento em tokens, turnos mantidos na íntegra e resumo)
+    HISTORY_MAX_TOKENS: int = int(os.getenv("HISTORY_MAX_TOKENS", "2000"))
+    HISTORY_AGENT_BUDGETS: str = os.getenv("HISTORY_AGENT_BUDGETS", "")  # ex.: "contract:3000,civil:2000"
+    HISTORY_KEEP_TURNS: int = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+    HISTORY_SUMMARY_MODEL: str = os.getenv("HISTORY_SUMMARY_MODEL", "gemini-2.5-flash")
+
+    # Contexto de RAG enviado ao LLM (orçamento em tokens e limiar de quase-duplicatas)
+    CONTEXT_MAX_TOKENS: int = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+    CONTEXT_AGENT_BUDGETS: str = os.getenv("CONTEXT_AGENT_BUDGETS", "")  # ex.: "contract:4000,penal:2500"
+    CONTEXT_DEDUP_THRESHOLD: float = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85"))
+
+    # Cache semântico de respostas (primeiro turno, sem histórico) e releitura da versão da base
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+    KB_VERSION_REFRESH_SECONDS: float = float(os.getenv("KB_VERSION_REFRESH_SECONDS", "60"))
+
+    # Controle de admissão das chamadas aos agentes (vagas por agente/modelo, fila e espera máxima);
+    # limites no formato "nome:em_andamento/fila", onde nome é um agente ou um modelo
+    GOVERNOR_ENABLED: bool = os.getenv("GOVERNOR_ENABLED", "true").lower() == "true"
+    GOVERNOR_DEFAULT_MAX_IN_FLIGHT: int = int(os.getenv("GOVERNOR_DEFAULT_MAX_IN_FLIGHT", "8"))
+    GOVERNOR_DEFAULT_MAX_QUEUE: int = int(os.getenv("GOVERNOR_DEFAULT_MAX_QUEUE", "16"))
+    GOVERNOR_MAX_QUEUE_WAIT_SECONDS: float = float(os.getenv("GOVERNOR_MAX_QUEUE_WAIT_SECONDS", "10"))
+    GOVERNOR_LIMITS: str = os.getenv("GOVERNOR_LIMITS", "contract-analyzer:2/4,gemini-2.5-pro:3/6")
+
+    # Prazo por requisição e orçamento de cada etapa (segundos); hedging das chamadas de
+    # embedding/recuperação que passam do percentil de latência observado
+    REQUEST_DEADLINE_SECONDS: float = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+    STAGE_TIMEOUT_EMBEDDING_SECONDS: float = float(os.getenv("STAGE_TIMEOUT_EMBEDDING_SECONDS", "5"))
+    STAGE_TIMEOUT_RETRIEVAL_SECONDS: float = float(os.getenv("STAGE_TIMEOUT_RETRIEVAL_SECONDS", "5"))
+    STAGE_TIMEOUT_LLM_SECONDS: float = float(os.getenv("STAGE_TIMEOUT_LLM_SECONDS", "45"))
+    DEADLINE_SYNC_WORKERS: int = int(os.getenv("DEADLINE_SYNC_WORKERS", "8"))
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_MIN_DELAY_SECONDS: float = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.05"))
+
+    # Diagnóstico do RAG (validade do resultado em cache e timeout de cada sonda)
+    RAG_HEALTH_MAX_AGE_SECONDS: float = float(os.getenv("RAG_HEALTH_MAX_AGE_SECONDS", "300"))
+    RAG_HEALTH_PROBE_TIMEOUT_SECONDS: float = float(os.getenv("RAG_HEALTH_PROBE_TIMEOUT_SECONDS", "15"))
+
+    # Índice vetorial local dos códigos (gerado por scripts/sync_local_index.py)
+    LOCAL_INDEX_ENABLED: bool = os.getenv("LOCAL_INDEX_ENABLED", "true").lower() == "true"
+    LOCAL_INDEX_DIR: str = os.getenv(
+        "LOCAL_INDEX_DIR", os.path.join(os.path.dirname(__file__), '..', 'knowledge_base', 'index')
+    )
+
 settings = Settings()
 
 # Validação para garantir que as variáveis de ambiente foram carregadas
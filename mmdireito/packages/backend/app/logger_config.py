@@ -1,15 +1,30 @@
+import atexit
+import json
+import queue
+import random
+import re
 import sys
+import threading
+import traceback
+import uuid
+
 from loguru import logger
 
+from app.config import settings
+
 # Remove o handler padrão para ter controle total sobre a configuração
 logger.remove()
 
+# Valores padrão dos campos de contexto (fora de uma requisição)
+logger.configure(extra={"request_id": "-", "debug_sampled": True})
+
 # Define o formato do log, alinhado com o documento LOGS.md
 # Usamos uma função para formatar o contexto de forma condicional
 def formatter(record):
     log_format = (
         "[{time:YYYY-MM-DDTHH:mm:ss.SSS}Z] "
         "[{level: <7}] "
+        "[{extra[request_id]}] "
         "[{name}:{function}:{line}] - "
         "{message}"
     )
@@ -18,18 +33,109 @@ def formatter(record):
         log_format += " :: {extra[context]}\n"
     else:
         log_format += "\n"
-    
+    if record["exception"]:
+        log_format += "{exception}"
+
     return log_format
 
-# Adiciona um novo sink (saída) para o console com o formato e cores definidos
-logger.add(
-    sys.stderr,
-    format=formatter,
-    level="DEBUG",  # Nível mínimo de log a ser exibido
-    colorize=True,
-    backtrace=True, # Exibe stack traces completos em caso de erro
-    diagnose=True   # Adiciona informações de diagnóstico em exceções
-)
+def json_formatter(record):
+    """Uma linha JSON por evento (para coletores de log); o contexto vai como campo."""
+    payload = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "request_id": record["extra"].get("request_id"),
+        "logger": f"{record['name']}:{record['function']}:{record['line']}",
+        "message": record["message"],
+    }
+    if record["extra"].get("context"):
+        payload["context"] = record["extra"]["context"]
+    if record["exception"]:
+        # O traceback vai dentro do JSON para o evento continuar sendo uma única linha
+        exc_type, exc_value, exc_tb = record["exception"]
+        payload["exception"] = "".join(traceback.format_exception(exc_type, exc_value, exc_tb))
+    record["extra"]["_json"] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+def sampling_filter(record) -> bool:
+    """
+    Amostragem dos eventos DEBUG: entram os das requisições sorteadas no middleware
+    (`debug_sampled`) e, para eventos muito frequentes, a taxa própria passada em
+    `logger.bind(sample=0.01)`.
+    """
+    if record["level"].no > 10:
+        return True
+    extra = record["extra"]
+    if not extra.get("debug_sampled", True):
+        return False
+    rate = extra.get("sample")
+    return rate is None or random.random() < rate
+
+
+class QueuedSink:
+    """
+    Sink não bloqueante: a requisição só coloca a linha já formatada em uma fila e
+    uma thread faz a escrita. Com a fila cheia a linha é descartada (e contada) em
+    vez de segurar a requisição.
+    """
+
+    def __init__(self, stream, max_size: int):
+        self.stream = stream
+        self.dropped = 0
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=max_size)
+        self._thread = threading.Thread(target=self._drain, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message: str) -> None:
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> None:
+        while True:
+            lines = [self._queue.get()]
+            # Escreve em lote o que já estiver acumulado
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.stream.write("".join(lines))
+                self.stream.flush()
+            except Exception:
+                pass
+            for _ in lines:
+                self._queue.task_done()
+
+    def join(self) -> None:
+        """Espera a fila esvaziar (usado no shutdown)."""
+        self._queue.join()
+
+
+def configure_logging(
+    level: str = settings.LOG_LEVEL,
+    log_format: str = settings.LOG_FORMAT,
+    enqueue: bool = settings.LOG_ENQUEUE,
+    stream=None,
+):
+    """(Re)configura o sink da aplicação; retorna o id do handler e o sink em fila, se houver."""
+    logger.remove()
+    stream = stream or sys.stderr
+    json_output = log_format == "json"
+    sink = QueuedSink(stream, settings.LOG_QUEUE_MAX_SIZE) if enqueue else stream
+    handler_id = logger.add(
+        sink,
+        format=json_formatter if json_output else formatter,
+        level=level,
+        filter=sampling_filter,
+        colorize=False if (json_output or enqueue) else None,
+        backtrace=True, # Exibe stack traces completos em caso de erro
+        diagnose=settings.LOG_DIAGNOSE  # Valores das variáveis nas exceções (caro e pode expor dados)
+    )
+    return handler_id, sink if enqueue else None
+
+_handler_id, queued_sink = configure_logging()
 
 # Configuração de cores e níveis para alinhar com LOGS.md
 logger.level("INFO", color="<blue>")
@@ -38,5 +144,50 @@ logger.level("WARNING", color="<yellow>")
 logger.level("ERROR", color="<red>")
 logger.level("CRITICAL", color="<bold><red>")
 
+
+_UNSAFE_REQUEST_ID = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class RequestContextMiddleware:
+    """
+    Middleware ASGI que associa um id de correlação a todos os logs da requisição
+    (inclusive os emitidos durante o streaming da resposta). Reaproveita o
+    cabeçalho X-Request-ID do cliente, se houver, e o devolve na resposta. Também
+    sorteia se os eventos DEBUG da requisição entram na amostra.
+    """
+
+    def __init__(self, app, sample_rate: float = settings.LOG_DEBUG_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        # Só caracteres seguros do id enviado pelo cliente (evita injeção de linhas no log)
+        request_id = _UNSAFE_REQUEST_ID.sub("", headers.get(b"x-request-id", b"").decode("latin-1"))[:64]
+        request_id = request_id or uuid.uuid4().hex[:16]
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        with logger.contextualize(request_id=request_id, debug_sampled=sampled):
+            await self.app(scope, receive, send_with_request_id)
+
+
+def shutdown_logging() -> None:
+    """Escreve o que ainda estiver na fila de logs."""
+    if queued_sink is not None:
+        queued_sink.join()
+
+# Scripts também encerram pela fila, sem perder as últimas linhas
+atexit.register(shutdown_logging)
+
 # Exporta o logger configurado para ser usado em outros módulos
-__all__ = ["logger"]
+__all__ = ["logger", "RequestContextMiddleware", "configure_logging", "shutdown_logging"]
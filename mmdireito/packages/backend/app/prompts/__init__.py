@@ -31,6 +31,17 @@ contextualize_q_prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}")
 ])
 
+# Prompt para resumir turnos antigos do histórico (gerado fora do caminho da requisição)
+history_summary_prompt = ChatPromptTemplate.from_messages([
+    ("system", """Você mantém o resumo de uma conversa jurídica entre um usuário e um assistente.
+Atualize o resumo existente incorporando os novos trechos da conversa. Preserve fatos do caso, partes envolvidas, valores, datas, artigos de lei e cláusulas citadas, conclusões já apresentadas e dúvidas em aberto. Seja conciso e escreva em português.
+
+Resumo atual:
+{summary}"""),
+    MessagesPlaceholder(variable_name="messages"),
+    ("human", "Escreva o resumo atualizado da conversa.")
+])
+
 # Prompt do Advogado do Diabo
 def load_devil_advocate_prompt():
     """Carrega o prompt do Advogado do Diabo do arquivo."""
@@ -1,14 +1,20 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from langchain_core.messages import SystemMessage
 
-from app.services.contract_chat_service import contract_chat_service
-from app.services.devil_advocate_service import devil_advocate_service
-from app.services.civil_agent_service import civil_agent_service
-from app.services.penal_agent_service import penal_agent_service
-from app.services.file_processing_service import extract_text_from_file
+from app.config import settings
+from app.services.concurrency_governor import Lease, OverloadedError, concurrency_governor
+from app.services.deadlines import DeadlineExceeded, deadline_after, request_deadline, set_deadline
+from app.services.metrics import agent_scope, current_agent, timed_stage
+from app.services.service_registry import services
+from app.services.file_processing_service import validate_upload
+from app.services.upload_job_service import upload_job_service
 from app.logger_config import logger
 
 # Cria um novo router para os endpoints do agente
@@ -33,16 +39,39 @@ class UploadResponse(BaseModel):
     """Modelo para a resposta do endpoint de upload."""
     filename: str
     message: str
+    job_id: str
+    status: str
     follow_up_question: Optional[str] = None
     suggested_actions: Optional[List[str]] = Field(default_factory=list)
 
-# Mapeamento de agentes para seus respectivos serviços
-agent_services = {
-    "contract-analyzer": contract_chat_service,
-    "devil-advocate": devil_advocate_service,
-    "agente-civil": civil_agent_service,
-    "agente-penal": penal_agent_service,
-}
+class UploadStatusResponse(BaseModel):
+    """Modelo para a resposta do endpoint de status do processamento de um upload."""
+    job_id: str
+    session_id: str
+    filename: str
+    status: str
+    stage: str
+    progress: float
+    error: Optional[str] = None
+
+def _overloaded(agent_name: str, error: OverloadedError) -> HTTPException:
+    """Resposta rápida de sobrecarga, com a sugestão de quando tentar de novo."""
+    return HTTPException(
+        status_code=429,
+        detail=f"O agente '{agent_name}' está com muitas requisições no momento. Tente novamente em instantes.",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def _deadline_exceeded(agent_name: str, error: DeadlineExceeded) -> JSONResponse:
+    logger.warning(f"Prazo da requisição esgotado para o agente '{agent_name}': {error}")
+    return JSONResponse(
+        status_code=504,
+        content={"detail": "O agente demorou demais para responder. Tente novamente."}
+    )
+
+# Mapeamento de agentes para seus respectivos serviços; cada agente (e suas
+# dependências pesadas) só é importado na primeira requisição que o utiliza
+agent_services = services
 
 @router.post("/chat/{agent_name}")
 async def chat_with_agent(agent_name: str, request: ChatRequest):
@@ -51,53 +80,151 @@ async def chat_with_agent(agent_name: str, request: ChatRequest):
     """
     session_id = request.session_id
     user_message = request.message
-    logger.info(
-        f"Recebida requisição de chat para o agente '{agent_name}' na sessão: {session_id}",
-        context=f'message="{user_message[:50]}..."'
+    # Valores do usuário só na mensagem já formatada (sem kwargs, o loguru não chama .format)
+    logger.bind(context=f'message="{user_message[:50]}..."').info(
+        f"Recebida requisição de chat para o agente '{agent_name}' na sessão: {session_id}"
     )
-    logger.info(f"[DEBUG] Request completo - session_id: '{session_id}', message: '{user_message}'")
 
     # Verifica se o agente solicitado existe
     if agent_name not in agent_services:
         raise HTTPException(status_code=404, detail=f"Agente '{agent_name}' não encontrado.")
 
+    # Prazo da requisição, respeitado pelas etapas de embedding, busca e LLM; o
+    # agente rotula as métricas de etapa e de tokens geradas na requisição
+    with request_deadline(settings.REQUEST_DEADLINE_SECONDS), agent_scope(agent_name):
+        # Controle de admissão: espera uma vaga do agente/modelo ou recusa com 429
+        try:
+            lease = await concurrency_governor.acquire(agent_name)
+        except OverloadedError as e:
+            raise _overloaded(agent_name, e)
+
+        try:
+            # Seleciona o serviço do agente e processa a mensagem
+            async with lease:
+                with timed_stage("request"):
+                    service = agent_services.get(agent_name)
+                    response_content = await service.process_message(user_message, session_id)
+            return JSONResponse(content={"response": response_content})
+
+        except DeadlineExceeded as e:
+            return _deadline_exceeded(agent_name, e)
+        except Exception as e:
+            logger.bind(context=f'request="{request.model_dump_json()}"').opt(exception=True).error(
+                f"Erro crítico no endpoint de chat para o agente '{agent_name}' na sessão {session_id}: '{e}'"
+            )
+            return JSONResponse(
+                status_code=500, 
+                content={"detail": "Ocorreu um erro interno no servidor."}
+            )
+
+def _format_sse(event: str, data: dict) -> str:
+    """Serializa um evento no formato Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _stream_agent_events(
+    agent_name: str, user_message: str, session_id: str, http_request: Request, lease: Lease, deadline: float
+):
+    """
+    Consome o stream do agente e o converte em eventos SSE.
+
+    Eventos emitidos:
+        token: fragmento de texto da resposta ({"token": "..."}).
+        done:  resposta completa, enviada ao final ({"response": "..."}).
+        error: falha durante a geração ({"detail": "..."}).
+
+    A vaga obtida no controle de admissão (`lease`) é devolvida ao fim do stream;
+    o prazo (`deadline`) vale para o stream inteiro.
+    """
+    # O gerador roda no contexto da resposta, que termina com ele
+    set_deadline(deadline)
+    current_agent.set(agent_name)
+    try:
+        service = agent_services.get(agent_name)
+        stream = service.stream_message(user_message, session_id)
+    except BaseException:
+        lease.release()
+        raise
+    parts = []
     try:
-        # Seleciona o serviço do agente e processa a mensagem
-        service = agent_services[agent_name]
-        response_content = await service.process_message(user_message, session_id)
-        return JSONResponse(content={"response": response_content})
-    
+        async for token in stream:
+            if await http_request.is_disconnected():
+                logger.info(f"Cliente desconectou durante o stream do agente '{agent_name}' na sessão {session_id}")
+                return
+            parts.append(token)
+            yield _format_sse("token", {"token": token})
+
+        yield _format_sse("done", {"response": "".join(parts)})
+    except asyncio.CancelledError:
+        logger.info(f"Stream do agente '{agent_name}' cancelado na sessão {session_id} (conexão encerrada)")
+        raise
+    except DeadlineExceeded as e:
+        logger.warning(f"Prazo esgotado no stream do agente '{agent_name}' na sessão {session_id}: {e}")
+        yield _format_sse("error", {"detail": "O agente demorou demais para responder. Tente novamente."})
     except Exception as e:
-        logger.error(
-            f"Erro crítico no endpoint de chat para o agente '{agent_name}' na sessão {session_id}: '{e}'",
-            context=f'request="{request.model_dump_json()}"',
-            exc_info=True
-        )
-        return JSONResponse(
-            status_code=500, 
-            content={"detail": "Ocorreu um erro interno no servidor."}
+        logger.opt(exception=True).error(
+            f"Erro durante o stream do agente '{agent_name}' na sessão {session_id}: '{e}'"
         )
+        yield _format_sse("error", {"detail": "Ocorreu um erro interno no servidor."})
+    finally:
+        # Encerra o stream do LLM caso o cliente tenha saído antes do fim
+        await stream.aclose()
+        lease.release()
+
+@router.post("/chat/{agent_name}/stream")
+async def stream_chat_with_agent(agent_name: str, request: ChatRequest, http_request: Request):
+    """
+    Variante do endpoint de chat que transmite a resposta via Server-Sent Events,
+    reduzindo o tempo até o primeiro token.
+    """
+    session_id = request.session_id
+    logger.bind(context=f'message="{request.message[:50]}..."').info(
+        f"Recebida requisição de chat (stream) para o agente '{agent_name}' na sessão: {session_id}"
+    )
+
+    if agent_name not in agent_services:
+        raise HTTPException(status_code=404, detail=f"Agente '{agent_name}' não encontrado.")
+
+    # A admissão acontece antes do stream, para a recusa sair como 429 e não como evento SSE
+    deadline = deadline_after(settings.REQUEST_DEADLINE_SECONDS)
+    with request_deadline(settings.REQUEST_DEADLINE_SECONDS):
+        try:
+            lease = await concurrency_governor.acquire(agent_name)
+        except OverloadedError as e:
+            raise _overloaded(agent_name, e)
+
+    return StreamingResponse(
+        _stream_agent_events(agent_name, request.message, session_id, http_request, lease, deadline),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Garante a devolução da vaga mesmo se o corpo nunca chegar a ser iterado
+        background=BackgroundTask(lease.release)
+    )
 
-@router.post("/upload-contract", response_model=UploadResponse)
+@router.post("/upload-contract", response_model=UploadResponse, status_code=202)
 async def upload_contract(session_id: str = Form(...), file: UploadFile = File(...)):
     """
     Endpoint para fazer upload de um arquivo de contrato (PDF ou DOCX).
-    Extrai o texto e o adiciona ao histórico da sessão de chat.
+
+    O arquivo é validado e enfileirado para processamento em segundo plano; a
+    resposta traz o `job_id` para acompanhar o progresso em
+    `GET /agent/upload-contract/{job_id}`. O contrato fica disponível para o
+    analisador assim que o job é concluído.
     """
     logger.info(f"Recebido upload de arquivo para a sessão: {session_id}, arquivo: {file.filename}")
 
     try:
-        # 1. Extrai o texto do arquivo usando o serviço
-        extracted_text = extract_text_from_file(file)
-
-        # 2. Configura o retriever para a sessão, combinando o contrato com o Código Civil
-        setup_retriever_for_session(session_id, extracted_text)
+        # 1. Validação rápida (tipo/tamanho), ainda dentro da requisição
+        validate_upload(file)
+        content = await file.read()
 
-        logger.info(f"Retriever para o arquivo {file.filename} criado para a sessão {session_id}")
+        # 2. Extração, divisão e indexação seguem em segundo plano
+        job = upload_job_service.submit(session_id, file.filename, content, file.content_type)
 
         return UploadResponse(
             filename=file.filename,
-            message=f"O contrato '{file.filename}' foi carregado e está pronto para análise.",
+            message=f"O contrato '{file.filename}' foi recebido e está sendo processado.",
+            job_id=job.job_id,
+            status=job.status,
             follow_up_question="O que você gostaria de fazer com este contrato?",
             suggested_actions=[
                 "Faça uma análise detalhada de riscos",
@@ -110,6 +237,13 @@ async def upload_contract(session_id: str = Form(...), file: UploadFile = File(.
         # Erro de validação (tipo/tamanho)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        # Outros erros de extração
         logger.error(f"Erro crítico no endpoint de upload para a sessão {session_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/upload-contract/{job_id}", response_model=UploadStatusResponse)
+async def get_upload_status(job_id: str):
+    """Retorna o status e o progresso do processamento de um contrato enviado."""
+    job = upload_job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job de upload '{job_id}' não encontrado.")
+    return UploadStatusResponse(**job.to_dict())
@@ -0,0 +1,71 @@
+from fastapi import APIRouter
+
+from app.services.answer_cache import answer_cache
+from app.services.concurrency_governor import concurrency_governor
+from app.services.contract_index_cache import contract_index_cache
+from app.services.embedding_service import embedding_service
+from app.services.rag_health_service import rag_health_service
+from app.services import deadlines, single_flight
+from app.services.session_store import session_store
+from app.services.startup_service import startup_service
+from app.services.supabase_service import supabase_service
+
+# Router com endpoints de diagnóstico e ajuste de capacidade
+router = APIRouter(
+    prefix="/health",
+    tags=["Health"]
+)
+
+@router.get("/supabase")
+async def supabase_pool_stats():
+    """Retorna as estatísticas do pool de conexões compartilhado com o Supabase."""
+    return supabase_service.get_pool_stats()
+
+@router.get("/embeddings")
+async def embedding_cache_stats():
+    """Retorna os contadores de acerto/erro do cache de embeddings."""
+    return embedding_service.get_cache_stats()
+
+@router.get("/contract-indexes")
+async def contract_index_cache_stats():
+    """Retorna os contadores do cache de índices FAISS de contratos."""
+    return contract_index_cache.get_stats()
+
+@router.get("/sessions")
+async def session_store_stats():
+    """Retorna a ocupação do armazenamento de sessões dos agentes."""
+    return session_store.get_stats()
+
+@router.get("/answer-cache")
+async def answer_cache_stats():
+    """Retorna a ocupação e a taxa de acerto do cache semântico de respostas."""
+    return answer_cache.get_stats()
+
+@router.get("/governor")
+async def governor_stats():
+    """Retorna ocupação, fila, recusas e tempo de espera de cada bulkhead."""
+    return concurrency_governor.get_stats()
+
+@router.get("/deadlines")
+async def deadline_stats():
+    """Retorna latências (p50/p95/p99), estouros de prazo e hedges de cada etapa."""
+    return deadlines.get_stats()
+
+@router.get("/single-flight")
+async def single_flight_stats():
+    """Retorna quantas chamadas idênticas em andamento foram compartilhadas."""
+    return single_flight.get_stats()
+
+@router.get("/startup")
+async def startup_report():
+    """Retorna o tempo gasto em cada etapa da última inicialização."""
+    return startup_service.last_report
+
+@router.get("/rag")
+async def rag_health():
+    """
+    Retorna o último diagnóstico do RAG (conexão, embedding e busca por área) com
+    o tempo de cada sonda. O resultado vem do cache; se estiver velho, uma nova
+    rodada é agendada em segundo plano.
+    """
+    return rag_health_service.get_report()
@@ -0,0 +1,83 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services import single_flight
+from app.services.answer_cache import answer_cache
+from app.services.concurrency_governor import concurrency_governor
+from app.services.contract_index_cache import contract_index_cache
+from app.services.embedding_service import embedding_service
+from app.services.metrics import registry
+from app.services.session_store import session_store
+
+# Router com a exportação das métricas no formato do Prometheus
+router = APIRouter(tags=["Metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _cache_metrics():
+    """Acertos e erros dos caches, lidos dos contadores de cada serviço."""
+    embedding = embedding_service.get_cache_stats()
+    answers = answer_cache.get_stats()
+    indexes = contract_index_cache.get_stats()
+    hits = [
+        ({"cache": "embedding", "tier": "memory"}, embedding["hits"]),
+        ({"cache": "embedding", "tier": "disk"}, embedding["disk_hits"]),
+        ({"cache": "answer", "tier": "exact"}, answers["hits"] - answers["semantic_hits"]),
+        ({"cache": "answer", "tier": "semantic"}, answers["semantic_hits"]),
+        ({"cache": "contract_index", "tier": "memory"}, indexes["memory_hits"]),
+        ({"cache": "contract_index", "tier": "disk"}, indexes["disk_hits"]),
+    ]
+    misses = [
+        ({"cache": "embedding"}, embedding["misses"]),
+        ({"cache": "answer"}, answers["misses"]),
+        ({"cache": "contract_index"}, indexes["misses"]),
+    ]
+    entries = [
+        ({"cache": "embedding"}, embedding["entries"]),
+        ({"cache": "answer"}, answers["entries"]),
+        ({"cache": "contract_index"}, indexes["in_memory"]),
+    ]
+    yield "mmdireito_cache_hits_total", "counter", "Acertos dos caches, por cache e camada.", hits
+    yield "mmdireito_cache_misses_total", "counter", "Erros dos caches.", misses
+    yield "mmdireito_cache_entries", "gauge", "Entradas em memória de cada cache.", entries
+
+
+def _session_metrics():
+    stats = session_store.get_stats()
+    yield "mmdireito_sessions", "gauge", "Sessões em memória, por agente.", [
+        ({"agent": agent}, values["sessions"]) for agent, values in stats["agents"].items()
+    ]
+    yield "mmdireito_session_bytes", "gauge", "Tamanho estimado das sessões em memória, por agente.", [
+        ({"agent": agent}, values["bytes"]) for agent, values in stats["agents"].items()
+    ]
+
+
+def _governor_metrics():
+    bulkheads = concurrency_governor.get_stats()["bulkheads"]
+    yield "mmdireito_bulkhead_in_flight", "gauge", "Chamadas em andamento por bulkhead.", [
+        ({"bulkhead": name}, stats["in_flight"]) for name, stats in bulkheads.items()
+    ]
+    yield "mmdireito_bulkhead_queued", "gauge", "Requisições na fila por bulkhead.", [
+        ({"bulkhead": name}, stats["queued"]) for name, stats in bulkheads.items()
+    ]
+    yield "mmdireito_bulkhead_rejected_total", "counter", "Requisições recusadas (fila cheia ou espera esgotada).", [
+        ({"bulkhead": name}, stats["rejected"] + stats["timed_out"]) for name, stats in bulkheads.items()
+    ]
+
+
+def _single_flight_metrics():
+    flights = single_flight.get_stats()
+    yield "mmdireito_single_flight_shared_total", "counter", "Chamadas que aproveitaram outra idêntica em andamento.", [
+        ({"call": name}, stats["shared"]) for name, stats in flights.items()
+    ]
+
+
+for collector in (_cache_metrics, _session_metrics, _governor_metrics, _single_flight_metrics):
+    registry.register_collector(collector)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Exporta as métricas da aplicação no formato de texto do Prometheus."""
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,263 @@
+# app/services/answer_cache.py
+"""
+Cache semântico de respostas para perguntas de primeiro turno.
+
+Perguntas sem histórico ("qual a pena para homicídio culposo?") não dependem da
+sessão, então a resposta pode ser reaproveitada entre usuários. A pergunta é
+comparada com as já respondidas pelo mesmo agente, primeiro pelo texto
+normalizado e depois por similaridade de cosseno do embedding; acima do limiar,
+a resposta gravada é devolvida sem chamar o LLM.
+
+As entradas ficam em um namespace por agente, versão do prompt e versão da base
+de conhecimento das áreas consultadas: uma reindexação (ou mudança no prompt)
+torna as respostas antigas inalcançáveis, e o aviso de mudança de versão as
+remove da memória. Há limite de entradas (LRU) e TTL.
+
+O namespace inclui ainda a assinatura da pergunta: artigos citados (com o código),
+números e qualificadores como "culposo"/"doloso". Perguntas quase idênticas no
+texto que diferem nesses pontos ("art. 155 do CP" e "art. 157 do CP") têm
+embeddings muito próximos, mas respostas diferentes; assim nunca se encontram.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.article_index import other_statutes, parse_article_query
+from app.services.embedding_cache import normalize_text
+from app.services.embedding_service import embedding_service
+from app.services.knowledge_base_version import KnowledgeBaseVersions, knowledge_base_versions
+
+
+def prompt_version(*parts) -> str:
+    """Versão curta de um prompt (ou de qualquer configuração que altere a resposta)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+_NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Qualificadores que mudam a resposta sem mudar quase nada no texto da pergunta
+DISTINCTIVE_TERMS = frozenset({
+    "culposo", "culposa", "doloso", "dolosa", "dolo", "culpa",
+    "tentado", "tentada", "tentativa", "consumado", "consumada",
+    "simples", "qualificado", "qualificada", "privilegiado", "privilegiada",
+    "majorado", "majorada", "agravante", "atenuante",
+    "próprio", "própria", "proprio", "propria", "impróprio", "imprópria", "improprio", "impropria",
+    "ativo", "ativa", "passivo", "passiva", "omissivo", "omissiva", "comissivo", "comissiva",
+    "não", "nao", "sem",
+})
+
+
+def question_signature(question: str) -> str:
+    """Artigos citados (com o código), outras leis, números e qualificadores da pergunta."""
+    parts: List[str] = []
+    article_query = parse_article_query(question)
+    if article_query:
+        parts.extend(
+            f"{'+'.join(reference.identifiers)}@{reference.legal_area or '*'}"
+            for reference in article_query.references
+        )
+    parts.extend(sorted(other_statutes(question)))
+    parts.extend(sorted({number.replace(".", "").replace(",", ".") for number in _NUMBER_PATTERN.findall(question)}))
+    words = set(_WORD_PATTERN.findall(normalize_text(question, casefold=True)))
+    parts.extend(sorted(words & DISTINCTIVE_TERMS))
+    return "|".join(parts)
+
+
+class _Entry(NamedTuple):
+    namespace: str
+    question: str
+    embedding: np.ndarray
+    answer: str
+    legal_areas: Tuple[str, ...]
+    created_at: float
+
+
+class CacheProbe(NamedTuple):
+    """Resultado da consulta; reaproveitado em `store` para não gerar o embedding de novo."""
+    namespace: str
+    question: str
+    embedding: Optional[np.ndarray]
+    legal_areas: Tuple[str, ...]
+    answer: Optional[str] = None
+
+
+class AnswerCache:
+    """Respostas por namespace, com busca exata e por similaridade, LRU e TTL."""
+
+    def __init__(
+        self,
+        versions: KnowledgeBaseVersions = knowledge_base_versions,
+        max_entries: int = settings.ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = settings.ANSWER_CACHE_TTL_SECONDS,
+        threshold: float = settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        enabled: bool = settings.ANSWER_CACHE_ENABLED,
+    ):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.enabled = enabled
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._exact: Dict[Tuple[str, str], int] = {}
+        # Matriz de embeddings por namespace, reconstruída quando o namespace muda
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self._next_id = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        versions.on_change(self.invalidate)
+
+    # --- Estrutura interna --- #
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._exact.pop((entry.namespace, entry.question), None)
+        self._matrices.pop(entry.namespace, None)
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.time() - entry.created_at > self.ttl_seconds
+
+    def _matrix(self, namespace: str) -> Tuple[List[int], Optional[np.ndarray]]:
+        cached = self._matrices.get(namespace)
+        if cached is None:
+            ids = [entry_id for entry_id, entry in self._entries.items() if entry.namespace == namespace]
+            matrix = np.vstack([self._entries[i].embedding for i in ids]) if ids else None
+            cached = (ids, matrix)
+            self._matrices[namespace] = cached
+        return cached
+
+    def _touch(self, entry_id: int) -> Optional[_Entry]:
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._remove(entry_id)
+            return None
+        self._entries.move_to_end(entry_id)
+        return entry
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # --- API --- #
+
+    async def lookup(self, agent: str, question: str, version: str, legal_areas: Iterable[str] = ()) -> CacheProbe:
+        """Procura uma resposta para a pergunta; `probe.answer` é None se não houver."""
+        legal_areas = tuple(legal_areas)
+        kb_version = await self.versions.aget(legal_areas)
+        namespace = f"{agent}:{version}:{kb_version}:{question_signature(question)}"
+        normalized = normalize_text(question, casefold=True)
+        if not self.enabled:
+            return CacheProbe(namespace, normalized, None, legal_areas)
+
+        with self._lock:
+            entry_id = self._exact.get((namespace, normalized))
+            entry = self._touch(entry_id) if entry_id is not None else None
+            if entry:
+                self.hits += 1
+                return CacheProbe(namespace, normalized, entry.embedding, legal_areas, entry.answer)
+
+        try:
+            embedding = self._normalize(await embedding_service.aembed_query(question))
+        except Exception as e:
+            # O cache nunca deve derrubar a requisição: segue sem ele
+            logger.warning(f"Cache de respostas indisponível para esta pergunta: {e}")
+            return CacheProbe(namespace, normalized, None, legal_areas)
+
+        with self._lock:
+            ids, matrix = self._matrix(namespace)
+            if matrix is not None:
+                scores = matrix @ embedding
+                for position in np.argsort(-scores):
+                    if scores[position] < self.threshold:
+                        break
+                    entry = self._touch(ids[position])
+                    if entry:
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        logger.bind(
+                            context={"similarity": round(float(scores[position]), 4), "cached_question": entry.question}
+                        ).debug(f"Resposta reaproveitada do cache para '{agent}'")
+                        return CacheProbe(namespace, normalized, embedding, legal_areas, entry.answer)
+            self.misses += 1
+        return CacheProbe(namespace, normalized, embedding, legal_areas)
+
+    def store(self, probe: CacheProbe, answer: str) -> None:
+        """Grava a resposta gerada para a pergunta consultada em `lookup`."""
+        if not self.enabled or probe.embedding is None or not answer.strip():
+            return
+        with self._lock:
+            existing = self._exact.get((probe.namespace, probe.question))
+            if existing is not None:
+                self._remove(existing)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(
+                probe.namespace, probe.question, probe.embedding, answer, probe.legal_areas, time.time()
+            )
+            self._exact[(probe.namespace, probe.question)] = entry_id
+            self._matrices.pop(probe.namespace, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, legal_areas: Optional[List[str]] = None) -> int:
+        """Remove as respostas que dependem das áreas informadas (todas, se None)."""
+        with self._lock:
+            doomed = [
+                entry_id for entry_id, entry in self._entries.items()
+                if legal_areas is None or set(entry.legal_areas) & set(legal_areas)
+            ]
+            for entry_id in doomed:
+                self._remove(entry_id)
+            self.invalidated += len(doomed)
+        if doomed:
+            logger.bind(context={"legal_areas": legal_areas}).info(
+                f"Cache de respostas invalidado: {len(doomed)} respostas removidas"
+            )
+        return len(doomed)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidated": self.invalidated,
+                "threshold": self.threshold,
+            }
+
+
+# Instância global do serviço
+answer_cache = AnswerCache()
+
+
+def cache_generated(probe: Optional[CacheProbe], answer: str, degraded: bool = False) -> None:
+    """
+    Grava a resposta que o LLM acabou de gerar, com a mesma regra para todos os
+    agentes e caminhos (resposta completa ou stream): só o texto integral, antes de
+    qualquer truncamento de exibição, e nunca o de uma recuperação degradada.
+    """
+    if probe is None or degraded or not answer:
+        return
+    answer_cache.store(probe, answer)
@@ -0,0 +1,334 @@
+# app/services/article_index.py
+"""
+Identificadores de artigos e parágrafos dos códigos, para busca exata.
+
+Na ingestão, cada chunk recebe os identificadores dos dispositivos que contém
+("155", "155§4", "121-A", "1228§unico"). Como um artigo longo pode continuar no
+chunk seguinte, o último artigo visto é carregado de um chunk para o outro.
+
+Na consulta, referências como "art. 155 do CP", "arts. 155 e 157 do CP" ou
+"artigo 312, § 1º, do CPP" são reconhecidas e resolvidas por igualdade desses
+identificadores, sem gerar embedding da pergunta. Cada referência vale para o
+código citado logo depois dela; referências a outras leis (Constituição, CLT,
+"Lei nº 8.072/90"...) não são resolvidas nos códigos e a pergunta segue para a
+busca vetorial.
+"""
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+# Cabeçalho de artigo no texto da lei ("Art. 1.228.", "Art. 121-A.", "Art. 5º")
+_HEADING_PATTERN = re.compile(
+    r"\bArt\.\s*(?P<article>\d{1,4}(?:\.\d{3})*)\s*(?:º|°|o\b)?(?:\s*-\s*(?P<suffix>[A-Z])\b)?"
+    r"|§\s*(?P<paragraph>\d{1,3})\s*(?:º|°|o\b)?"
+    r"|(?P<single>Parágrafo\s+único)"
+)
+
+# Referência a artigo na pergunta do usuário
+_QUERY_PATTERN = re.compile(
+    r"\bart(?:igo)?s?\.?\s*(?P<article>\d{1,4}(?:\.\d{3})*)\s*(?:º|°|o\b)?(?:\s*-\s*(?P<suffix>[a-z])\b)?"
+    r"(?:\s*,?\s*(?:§\s*(?P<paragraph>\d{1,3})|par[aá]grafo\s+(?P<pnumber>\d{1,3}|[uú]nico)))?",
+    re.IGNORECASE
+)
+
+# Continuação de uma enumeração ("arts. 155, 157 e 158", "art. 155 e o 157")
+_ENUMERATION_PATTERN = re.compile(
+    r"(?:º|°)?\s*(?:,\s*(?:(?:e|ou)\b)?|(?:e|ou)\b)\s*(?:(?:o|os|do|dos|ao|aos)\s+)?(?:art(?:igo)?s?\.?\s*)?"
+    r"(?P<article>\d{1,4}(?:\.\d{3})*)\s*(?:º|°|o\b)?(?:\s*-\s*(?P<suffix>[a-z])\b)?"
+    r"(?!\s*(?:anos?|m[eê]s|meses|dias?|horas?|vezes|%))",
+    re.IGNORECASE
+)
+
+# Trecho depois da referência em que se procura o código citado ("... do CP")
+_CITATION_WINDOW_CHARS = 60
+
+# Divisões da lei acima do artigo, da mais geral para a mais específica
+# (o pypdf às vezes separa a primeira letra: "P ARTE GERAL")
+HIERARCHY_LEVELS = ["parte", "livro", "titulo", "capitulo", "secao", "subsecao"]
+_HIERARCHY_PATTERN = re.compile(
+    r"^\s*(?:(?P<parte>P\s?ARTE\s+(?:GERAL|ESPECIAL))"
+    r"|(?P<livro>LIVRO\s+[IVXLC]+)"
+    r"|(?P<titulo>T[ÍI]TULO\s+[IVXLC]+)"
+    r"|(?P<capitulo>CAP[ÍI]TULO\s+[IVXLC]+(?:-[A-Z])?)"
+    r"|(?P<subsecao>SUBSE[ÇC][ÃA]O\s+[IVXLC]+)"
+    r"|(?P<secao>SE[ÇC][ÃA]O\s+[IVXLC]+))\b",
+    re.IGNORECASE
+)
+
+# Início de parágrafo ou inciso ("§ 2o", "Parágrafo único", "IV –")
+_SUBDIVISION_PATTERN = re.compile(r"^\s*(?:§|Par[áa]grafo\s+[úu]nico|[IVXLC]+\s*[–-]\s)")
+
+# Rubrica (epígrafe) que antecede o artigo: linha curta, sem pontuação final
+_RUBRIC_MAX_CHARS = 80
+
+# Menções aos códigos -> área jurídica (CPP antes de CP)
+_CODE_PATTERNS = [
+    (re.compile(r"\bCPP\b|c[oó]digo\s+de\s+processo\s+penal|processo\s+penal", re.IGNORECASE), "processual_penal"),
+    (re.compile(r"\bCP\b|c[oó]digo\s+penal", re.IGNORECASE), "penal"),
+    (re.compile(r"\bCC\b|c[oó]digo\s+civil", re.IGNORECASE), "civil"),
+]
+
+# Nome de cada código, para rotular os trechos de áreas diferentes no contexto
+CODE_NAMES = {
+    "penal": "Código Penal",
+    "processual_penal": "Código de Processo Penal",
+    "civil": "Código Civil",
+}
+
+# Outras leis, que não estão na base de artigos ("art. 5º da CF", "Lei nº 11.343")
+OTHER_STATUTE = "outra_lei"
+_OTHER_STATUTE_PATTERN = re.compile(
+    r"\b(?:CF|CRFB|CPC|CPM|CPPM|CLT|CDC|CTN|CTB|ECA|LEP)\b"
+    r"|constitui[çc][ãa]o|\blei\s+(?:complementar\s+)?(?:n[º°o.]*\s*)?\d|decreto|estatuto"
+    r"|c[oó]digo\s+(?:penal\s+militar|de\s+processo\s+(?:civil|penal\s+militar)|de\s+defesa"
+    r"|tribut[áa]rio|eleitoral|de\s+tr[âa]nsito|comercial|florestal)"
+    r"|processo\s+civil|consolida[çc][ãa]o\s+das\s+leis",
+    re.IGNORECASE
+)
+# Número no fim da menção a uma lei ("lei nº 11")
+_LAW_NUMBER_PATTERN = re.compile(r"\s*(?:n[º°o.]*\s*)?\d+$")
+
+
+def _article_id(number: str, suffix: Optional[str]) -> str:
+    article = number.replace(".", "")
+    return f"{article}-{suffix.upper()}" if suffix else article
+
+
+def hierarchy_level(line: str) -> Optional[str]:
+    """Nível da divisão ("titulo", "capitulo"...) se a linha for um cabeçalho de divisão."""
+    match = _HIERARCHY_PATTERN.match(line)
+    return match.lastgroup if match else None
+
+
+def article_heading_id(line: str) -> Optional[str]:
+    """Identificador do artigo se a linha inicia um artigo ("Art. 155.  Subtrair...")."""
+    match = _HEADING_PATTERN.match(line.lstrip())
+    if not match or not match.group("article"):
+        return None
+    return _article_id(match.group("article"), match.group("suffix"))
+
+
+def is_article_heading(line: str) -> bool:
+    return article_heading_id(line) is not None
+
+
+def is_subdivision(line: str) -> bool:
+    return bool(_SUBDIVISION_PATTERN.match(line))
+
+
+def is_heading_line(line: str) -> bool:
+    """Cabeçalho de divisão ou rubrica: linhas que introduzem o artigo seguinte."""
+    stripped = line.strip()
+    if not stripped:
+        return True
+    if hierarchy_level(stripped):
+        return True
+    return (
+        len(stripped) <= _RUBRIC_MAX_CHARS
+        and stripped[-1] not in ".;:,–-"
+        and stripped[0].isupper()
+        and not is_subdivision(stripped)
+        and not is_article_heading(stripped)
+    )
+
+
+class ArticleTracker:
+    """Extrai os identificadores de chunks consecutivos, mantendo o artigo corrente."""
+
+    def __init__(self):
+        self.current: Optional[str] = None
+
+    def extract(self, text: str) -> List[str]:
+        identifiers: List[str] = []
+
+        def add(identifier: str) -> None:
+            if identifier not in identifiers:
+                identifiers.append(identifier)
+
+        first = _HEADING_PATTERN.search(text)
+        # Texto antes do primeiro cabeçalho ainda pertence ao artigo do chunk anterior,
+        # exceto quando é só o cabeçalho de divisão/rubrica do artigo seguinte
+        leading = text if first is None else text[:first.start()]
+        if self.current and not all(is_heading_line(line) for line in leading.splitlines()):
+            add(self.current)
+
+        for match in _HEADING_PATTERN.finditer(text):
+            if match.group("article"):
+                self.current = _article_id(match.group("article"), match.group("suffix"))
+                add(self.current)
+            elif self.current and match.group("paragraph"):
+                add(self.current)
+                add(f"{self.current}§{int(match.group('paragraph'))}")
+            elif self.current and match.group("single"):
+                add(self.current)
+                add(f"{self.current}§unico")
+        return identifiers
+
+
+def extract_identifiers(chunks: List[str]) -> List[List[str]]:
+    """Identificadores de cada chunk de uma sequência ordenada."""
+    tracker = ArticleTracker()
+    return [tracker.extract(chunk) for chunk in chunks]
+
+
+def _cited_source(text: str) -> Optional[str]:
+    """Primeira lei citada no texto: área do código, `OTHER_STATUTE` ou None."""
+    first: Optional[Tuple[int, str]] = None
+    # Outras leis primeiro: no empate ("Código Penal Militar") vence a mais específica
+    for pattern, source in [(_OTHER_STATUTE_PATTERN, OTHER_STATUTE)] + _CODE_PATTERNS:
+        match = pattern.search(text)
+        if match and (first is None or match.start() < first[0]):
+            first = (match.start(), source)
+    return first[1] if first else None
+
+
+def _cited_sources(text: str) -> List[str]:
+    """Todas as leis citadas no texto (áreas dos códigos e/ou `OTHER_STATUTE`)."""
+    sources: List[str] = []
+    remaining = text
+    for pattern, source in [(_OTHER_STATUTE_PATTERN, OTHER_STATUTE)] + _CODE_PATTERNS:
+        if pattern.search(remaining):
+            sources.append(source)
+            remaining = pattern.sub(" ", remaining)
+    return sources
+
+def other_statutes(text: str) -> List[str]:
+    """Menções a outras leis no texto ("cf", "clt", "lei"), normalizadas e sem repetição."""
+    mentions: List[str] = []
+    for match in _OTHER_STATUTE_PATTERN.finditer(text):
+        # O número da lei fica de fora ("Lei nº 11.343" -> "lei")
+        mention = _LAW_NUMBER_PATTERN.sub("", " ".join(match.group(0).casefold().split()))
+        if mention not in mentions:
+            mentions.append(mention)
+    return mentions
+
+
+class ArticleReference(NamedTuple):
+    """Artigos de uma referência ("arts. 155 e 157") e a área do código citado (None: não citado)."""
+    identifiers: List[str]
+    legal_area: Optional[str]
+
+
+class ArticleQuery(NamedTuple):
+    """Referências encontradas na pergunta, da mais específica para a mais geral."""
+    identifiers: List[str]
+    legal_areas: List[str]
+    references: List[ArticleReference] = []
+
+
+def _reference_identifiers(matches) -> List[str]:
+    """Parágrafos primeiro; o artigo inteiro entra como alternativa mais geral."""
+    identifiers: List[str] = []
+    articles: List[str] = []
+    for match in matches:
+        article = _article_id(match.group("article"), match.group("suffix"))
+        groups = match.groupdict()
+        paragraph = groups.get("paragraph") or groups.get("pnumber")
+        if paragraph:
+            paragraph = "unico" if paragraph.lower() in ("único", "unico") else str(int(paragraph))
+            identifiers.append(f"{article}§{paragraph}")
+        articles.append(article)
+    return identifiers + [article for article in articles if article not in identifiers]
+
+
+def parse_article_query(query: str) -> Optional[ArticleQuery]:
+    """
+    Reconhece referências a artigos na pergunta. `legal_areas` vem vazio quando
+    alguma referência não tem código citado; nesse caso valem as áreas do agente.
+    Devolve None quando todas as referências são de outras leis.
+    """
+    groups = []
+    position = 0
+    while True:
+        match = _QUERY_PATTERN.search(query, position)
+        if not match:
+            break
+        matches = [match]
+        end = match.end()
+        continuation = _ENUMERATION_PATTERN.match(query, end)
+        while continuation:
+            matches.append(continuation)
+            end = continuation.end()
+            continuation = _ENUMERATION_PATTERN.match(query, end)
+        groups.append((matches, end))
+        position = end
+
+    if not groups:
+        return None
+
+    # Referência sem código logo depois: vale a lei citada na pergunta, se for uma só
+    sources = _cited_sources(query)
+    default = sources[0] if len(sources) == 1 else None
+
+    references: List[ArticleReference] = []
+    for index, (matches, end) in enumerate(groups):
+        limit = groups[index + 1][0][0].start() if index + 1 < len(groups) else len(query)
+        source = _cited_source(query[end:min(limit, end + _CITATION_WINDOW_CHARS)]) or default
+        if source != OTHER_STATUTE:
+            references.append(ArticleReference(_reference_identifiers(matches), source))
+
+    if not references:
+        return None
+
+    identifiers: List[str] = []
+    # Parágrafos de todas as referências antes dos artigos inteiros
+    for paragraphs_first in (True, False):
+        for reference in references:
+            for identifier in reference.identifiers:
+                if ("§" in identifier) == paragraphs_first and identifier not in identifiers:
+                    identifiers.append(identifier)
+
+    legal_areas: List[str] = []
+    if all(reference.legal_area for reference in references):
+        for reference in references:
+            if reference.legal_area not in legal_areas:
+                legal_areas.append(reference.legal_area)
+    return ArticleQuery(identifiers, legal_areas, references)
+
+
+def resolve_areas(article_query: ArticleQuery, legal_areas: List[str]) -> List[str]:
+    """Áreas a consultar: as citadas na pergunta, restritas às disponíveis ao agente."""
+    if not article_query.legal_areas:
+        return list(legal_areas)
+    return [area for area in article_query.legal_areas if area in legal_areas]
+
+
+def select_rows(article_query: ArticleQuery, rows: List[dict], legal_areas: List[str]) -> List[dict]:
+    """
+    Mantém só as linhas do código de cada referência ("art. 155 do CP" não traz o
+    art. 155 do CPP) e ordena pela referência mais específica; sem código citado,
+    o mesmo artigo de códigos diferentes segue a ordem das áreas do agente.
+    """
+    def allowed(row: dict) -> List[str]:
+        return [
+            identifier
+            for reference in article_query.references
+            if reference.legal_area in (None, row.get("legal_area"))
+            for identifier in reference.identifiers
+        ]
+
+    def rank(row: dict) -> Tuple[int, int, int]:
+        row_ids = row.get("articles") or []
+        position = next(
+            (i for i, identifier in enumerate(article_query.identifiers) if identifier in row_ids),
+            len(article_query.identifiers)
+        )
+        area = row.get("legal_area")
+        area_rank = legal_areas.index(area) if area in legal_areas else len(legal_areas)
+        return position, area_rank, row.get("id") or 0
+
+    selected = [
+        row for row in rows
+        if not article_query.references or set(allowed(row)) & set(row.get("articles") or [])
+    ]
+    return sorted(selected, key=rank)
+
+
+def order_rows_by_priority(rows: List[dict], identifiers: List[str], key: str = "articles") -> List[dict]:
+    """Ordena linhas pela referência mais específica que contêm (parágrafo antes do artigo)."""
+    def rank(row: dict) -> Tuple[int, int]:
+        row_ids = row.get(key) or []
+        for position, identifier in enumerate(identifiers):
+            if identifier in row_ids:
+                return position, row.get("id") or 0
+        return len(identifiers), row.get("id") or 0
+    return sorted(rows, key=rank)
@@ -1,30 +1,38 @@
+from typing import AsyncIterator, Optional
+
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
 
 from app.config import settings
 from app.prompts import agente_civil_prompt
 from app.logger_config import logger
+from app.services.answer_cache import CacheProbe, answer_cache, cache_generated, prompt_version
+from app.services.deadlines import LLM_STAGE, DeadlineExceeded, iter_with_deadline, run_stage
+from app.services.history_manager import history_manager
+from app.services.single_flight import llm_flight
+from app.services.streaming import chunk_to_text
+from app.services.token_usage import token_usage_callback
 
 
 # --- Gerenciador de Sessão --- #
-# Em produção, usaríamos Redis ou similar.
-store = {}
+# Sessões ficam no armazenamento compartilhado (LRU/TTL com backend persistente);
+# a cadeia recebe apenas o resumo + turnos recentes dentro do orçamento de tokens
+SESSION_AGENT = "civil"
 
 def get_session_history(session_id: str):
     """Obtém o histórico da sessão ou cria um novo."""
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-        logger.info(f"Nova sessão criada para Agente Civil: {session_id}")
-    return store[session_id]
+    return history_manager.get_history(SESSION_AGENT, session_id)
 
 # --- Construção da Chain --- #
 
 # Inicializa o modelo de chat com gemini-2.5-flash
+CIVIL_MODEL = "gemini-2.5-flash"
 llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
+    model=CIVIL_MODEL,
     google_api_key=settings.GOOGLE_API_KEY,
-    temperature=0.1  # Mais preciso para questões jurídicas
+    temperature=0.1,  # Mais preciso para questões jurídicas
+    timeout=settings.STAGE_TIMEOUT_LLM_SECONDS,
+    callbacks=[token_usage_callback]
 )
 
 # Cria a cadeia de conversação simples
@@ -38,6 +46,34 @@ chain_with_history = RunnableWithMessageHistory(
     history_messages_key="chat_history",
 )
 
+# O agente não consulta a base de conhecimento: a resposta depende só do prompt e do modelo
+PROMPT_VERSION = prompt_version(agente_civil_prompt, CIVIL_MODEL)
+
+async def _cache_probe(user_message: str, session_id: str) -> Optional[CacheProbe]:
+    """Consulta o cache de respostas se a sessão ainda não tem histórico (primeiro turno)."""
+    if get_session_history(session_id).messages:
+        return None
+    return await answer_cache.lookup(SESSION_AGENT, user_message, PROMPT_VERSION)
+
+async def _first_turn_answer(probe: CacheProbe, user_message: str) -> str:
+    """
+    Gera a resposta de primeiro turno sem passar pelo histórico da sessão, de modo
+    que perguntas idênticas simultâneas de sessões diferentes compartilhem uma
+    única chamada ao LLM.
+    """
+    async def generate() -> str:
+        response = await run_stage(
+            LLM_STAGE, lambda: conversational_chain.ainvoke({"input": user_message, "chat_history": []})
+        )
+        return response.content
+
+    return await llm_flight.do((probe.namespace, probe.question), generate)
+
+def _record_cached_turn(session_id: str, user_message: str, answer: str) -> None:
+    history = get_session_history(session_id)
+    history.add_user_message(user_message)
+    history.add_ai_message(answer)
+
 class CivilAgentService:
     """Serviço para gerenciar a lógica do agente Especialista em Código Civil."""
 
@@ -46,18 +82,61 @@ class CivilAgentService:
         logger.debug(f"Processando mensagem para Agente Civil na sessão {session_id}")
         
         try:
+            probe = await _cache_probe(user_message, session_id)
+            if probe and probe.answer:
+                logger.debug(f"Resposta do Agente Civil obtida do cache para a sessão {session_id}")
+                _record_cached_turn(session_id, user_message, probe.answer)
+                return probe.answer
+
+            if probe:
+                answer = await _first_turn_answer(probe, user_message)
+                cache_generated(probe, answer)
+                _record_cached_turn(session_id, user_message, answer)
+                return answer
+
             config = {"configurable": {"session_id": session_id}}
-            response = await chain_with_history.ainvoke(
+            response = await run_stage(LLM_STAGE, lambda: chain_with_history.ainvoke(
                 {"input": user_message},
                 config=config
-            )
+            ))
             return response.content
+        except DeadlineExceeded:
+            # O router responde 504 quando o prazo da requisição acaba
+            raise
         except Exception as e:
-            logger.error(
-                f"Erro ao processar mensagem para Agente Civil na sessão {session_id}: {e}",
-                exc_info=True
+            logger.opt(exception=True).error(
+                f"Erro ao processar mensagem para Agente Civil na sessão {session_id}: {e}"
             )
             return "Desculpe, ocorreu um erro ao processar sua consulta sobre o Código Civil. Por favor, tente novamente."
 
+    async def stream_message(self, user_message: str, session_id: str) -> AsyncIterator[str]:
+        """
+        Transmite a resposta do agente token a token.
+
+        O histórico da sessão (e o cache de respostas) só é atualizado quando o
+        stream termina; se o consumidor interromper a iteração, o turno parcial é
+        descartado.
+        """
+        logger.debug(f"Iniciando stream para Agente Civil na sessão {session_id}")
+
+        probe = await _cache_probe(user_message, session_id)
+        if probe and probe.answer:
+            yield probe.answer
+            _record_cached_turn(session_id, user_message, probe.answer)
+            return
+
+        config = {"configurable": {"session_id": session_id}}
+        parts = []
+        async for chunk in iter_with_deadline(LLM_STAGE, chain_with_history.astream(
+            {"input": user_message},
+            config=config
+        )):
+            text = chunk_to_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+
+        cache_generated(probe, "".join(parts))
+
 # Instância única do serviço
 civil_agent_service = CivilAgentService()
@@ -0,0 +1,244 @@
+# app/services/concurrency_governor.py
+"""
+Controle de admissão das chamadas aos agentes (bulkheads).
+
+Todos os agentes dividem o mesmo event loop e a mesma cota do Gemini. Cada
+requisição de chat precisa de uma vaga no bulkhead do agente e outra no do
+modelo usado por ele: o agente limita o próprio consumo (uma rajada de análises
+de contrato não ocupa as vagas das perguntas rápidas do agente civil) e o modelo
+limita o total enviado à cota compartilhada.
+
+Sem vaga, a requisição espera em uma fila limitada; com a fila cheia (ou depois
+de `GOVERNOR_MAX_QUEUE_WAIT_SECONDS` na fila) ela é recusada na hora com
+`OverloadedError`, que as rotas convertem em 429 com `Retry-After`.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.deadlines import remaining
+from app.services.service_registry import AGENT_MODELS
+
+# Amostras de espera guardadas por bulkhead para calcular os percentis
+WAIT_SAMPLES = 1000
+
+# Limites do Retry-After sugerido (segundos)
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """Converte 'contract-analyzer:2/4,gemini-2.5-pro:4/8' em {nome: (em andamento, fila)}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.rpartition(":")
+        in_flight, _, queue = value.partition("/")
+        limits[name.strip()] = (int(in_flight), int(queue) if queue else settings.GOVERNOR_DEFAULT_MAX_QUEUE)
+    return limits
+
+
+class OverloadedError(Exception):
+    """Sem vaga e sem lugar na fila: a requisição deve ser repetida depois de `retry_after` segundos."""
+
+    def __init__(self, bulkhead: str, retry_after: int, reason: str = "queue_full"):
+        super().__init__(f"Capacidade esgotada em '{bulkhead}' ({reason}); tente novamente em {retry_after}s")
+        self.bulkhead = bulkhead
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Bulkhead:
+    """Limite de chamadas simultâneas com fila FIFO limitada."""
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        # Média móvel do tempo de uso de uma vaga, usada no Retry-After
+        self._avg_hold = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def retry_after(self) -> int:
+        """Estimativa de quando uma vaga deve abrir, pelo tempo médio de uso e pelo tamanho da fila."""
+        hold = self._avg_hold or MIN_RETRY_AFTER
+        estimate = hold * (self.queued + 1) / max(self.max_in_flight, 1)
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(estimate))))
+
+    async def acquire(self, timeout: float) -> None:
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            self._admit(0.0)
+            return
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise OverloadedError(self.name, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga chegou junto com o timeout/cancelamento: devolve para o próximo
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise OverloadedError(self.name, self.retry_after(), reason="queue_timeout") from None
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+        self._admit(time.monotonic() - started)
+
+    def _admit(self, waited: float) -> None:
+        self.admitted += 1
+        self._waits.append(waited)
+
+    def release(self, held: Optional[float] = None) -> None:
+        if held is not None:
+            self._avg_hold = held if not self._avg_hold else 0.8 * self._avg_hold + 0.2 * held
+        # A vaga passa direto para o primeiro da fila (in_flight não muda)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def get_stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 4) if waits else 0.0
+
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "queue_wait_avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+            "queue_wait_p95": percentile(0.95),
+            "queue_wait_max": round(waits[-1], 4) if waits else 0.0,
+            "avg_hold_seconds": round(self._avg_hold, 3),
+        }
+
+
+class Lease:
+    """Vagas obtidas para uma requisição; `release` pode ser chamado mais de uma vez."""
+
+    def __init__(self, bulkheads: List[Bulkhead]):
+        self._bulkheads = bulkheads
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        held = time.monotonic() - self._started
+        for bulkhead in reversed(self._bulkheads):
+            bulkhead.release(held)
+
+    async def __aenter__(self) -> "Lease":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+class ConcurrencyGovernor:
+    """Bulkheads por agente e por modelo, criados sob demanda a partir da configuração."""
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        default_max_in_flight: int = settings.GOVERNOR_DEFAULT_MAX_IN_FLIGHT,
+        default_max_queue: int = settings.GOVERNOR_DEFAULT_MAX_QUEUE,
+        max_queue_wait: float = settings.GOVERNOR_MAX_QUEUE_WAIT_SECONDS,
+        agent_models: Optional[Dict[str, str]] = None,
+        enabled: bool = settings.GOVERNOR_ENABLED,
+    ):
+        self.limits = limits if limits is not None else parse_limits(settings.GOVERNOR_LIMITS)
+        self.default_max_in_flight = default_max_in_flight
+        self.default_max_queue = default_max_queue
+        self.max_queue_wait = max_queue_wait
+        self.agent_models = agent_models if agent_models is not None else AGENT_MODELS
+        self.enabled = enabled
+        self._bulkheads: Dict[str, Bulkhead] = {}
+
+    def _bulkhead(self, kind: str, name: str) -> Bulkhead:
+        label = f"{kind}:{name}"
+        bulkhead = self._bulkheads.get(label)
+        if bulkhead is None:
+            max_in_flight, max_queue = self.limits.get(name, (self.default_max_in_flight, self.default_max_queue))
+            bulkhead = Bulkhead(label, max_in_flight, max_queue)
+            self._bulkheads[label] = bulkhead
+        return bulkhead
+
+    def _chain(self, agent: str) -> List[Bulkhead]:
+        chain = [self._bulkhead("agent", agent)]
+        model = self.agent_models.get(agent)
+        if model:
+            chain.append(self._bulkhead("model", model))
+        return chain
+
+    async def acquire(self, agent: str) -> Lease:
+        """Obtém as vagas do agente e do modelo, esperando na fila se preciso."""
+        if not self.enabled:
+            return Lease([])
+
+        # A espera na fila também consome o prazo da requisição; o limite vale para
+        # a cadeia inteira, não para cada fila
+        left = remaining()
+        budget = self.max_queue_wait if left is None else max(0.0, min(self.max_queue_wait, left))
+        deadline = time.monotonic() + budget
+
+        acquired: List[Bulkhead] = []
+        try:
+            # Ordem fixa (agente, depois modelo) para não haver espera circular
+            for bulkhead in self._chain(agent):
+                await bulkhead.acquire(max(0.0, deadline - time.monotonic()))
+                acquired.append(bulkhead)
+        except OverloadedError as e:
+            for bulkhead in reversed(acquired):
+                bulkhead.release()
+            logger.bind(
+                context={"bulkhead": e.bulkhead, "reason": e.reason, "retry_after": e.retry_after}
+            ).warning(f"Requisição recusada para o agente '{agent}': {e}")
+            raise
+        except BaseException:
+            for bulkhead in reversed(acquired):
+                bulkhead.release()
+            raise
+        return Lease(acquired)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_queue_wait_seconds": self.max_queue_wait,
+            "bulkheads": {name: bulkhead.get_stats() for name, bulkhead in sorted(self._bulkheads.items())},
+        }
+
+
+# Instância global do serviço
+concurrency_governor = ConcurrencyGovernor()
@@ -0,0 +1,219 @@
+# app/services/context_packer.py
+"""
+Montagem do contexto de RAG enviado ao LLM.
+
+Os trechos recuperados (Documents dos retrievers ou linhas das funções de busca)
+passam por quatro etapas antes de entrar no prompt:
+
+1. ordenação por relevância (similaridade, quando existe; senão a ordem do retriever);
+2. fusão de trechos sobrepostos (o fim de um é o começo do outro) ou adjacentes
+   (chunks consecutivos, pelo `chunk_index`, do mesmo documento);
+3. descarte de quase-duplicatas (trechos cujos trigramas de palavras já estão, em
+   quase sua totalidade, em um trecho mais relevante);
+4. preenchimento até o orçamento de tokens do agente, do mais relevante ao menos.
+"""
+import re
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Union
+
+from langchain_core.documents import Document
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.history_manager import estimate_tokens, parse_budgets
+from app.services.metrics import timed_stage
+
+# Menor sobreposição (em caracteres) considerada na fusão de trechos
+MIN_OVERLAP_CHARS = 40
+# Maior sobreposição procurada (o splitter antigo usava 200 caracteres)
+MAX_OVERLAP_CHARS = 400
+# Separador entre trechos no contexto final
+SEPARATOR = "\n\n---\n\n"
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class Passage(NamedTuple):
+    """Trecho candidato ao contexto."""
+    text: str
+    score: float
+    metadata: dict
+
+
+class PackedContext(NamedTuple):
+    text: str
+    passages: List[Passage]
+    tokens: int
+    dropped: int
+
+
+def _to_passages(items: Sequence[Union[Document, dict]]) -> List[Passage]:
+    raw = []
+    for item in items:
+        if isinstance(item, Document):
+            raw.append((item.page_content, dict(item.metadata)))
+        else:
+            raw.append((item.get("content", ""), {key: value for key, value in item.items() if key != "content"}))
+
+    # Similaridades só são comparáveis se todos os trechos tiverem uma (ex.: o
+    # MergerRetriever mistura o FAISS do contrato, sem score, com a busca nos
+    # códigos); caso contrário, a posição no resultado do retriever é a relevância
+    use_similarity = all(metadata.get("similarity") is not None for _, metadata in raw)
+    return [
+        Passage(text, float(metadata["similarity"]) if use_similarity else 1 - rank / len(raw), metadata)
+        for rank, (text, metadata) in enumerate(raw)
+        if text.strip()
+    ]
+
+
+def _overlap(first: str, second: str) -> int:
+    """Tamanho do sufixo de `first` que é prefixo de `second` (0 se não houver)."""
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = first.find(probe, max(0, len(first) - MAX_OVERLAP_CHARS))
+    while start != -1:
+        size = len(first) - start
+        if second.startswith(first[start:]):
+            return size
+        start = first.find(probe, start + 1)
+    return 0
+
+
+def _adjacent(first: Passage, second: Passage) -> bool:
+    """
+    Chunks consecutivos do mesmo documento, pela posição (`chunk_index`). Os ids
+    não servem: a reindexação incremental mantém os ids dos chunks inalterados.
+    """
+    first_index, second_index = first.metadata.get("chunk_index"), second.metadata.get("chunk_index")
+    if not isinstance(first_index, int) or not isinstance(second_index, int):
+        return False
+    document_id = first.metadata.get("document_id")
+    return (
+        document_id is not None
+        and document_id == second.metadata.get("document_id")
+        and second_index == first_index + 1
+    )
+
+
+def _merge(first: Passage, second: Passage) -> Optional[Passage]:
+    """Funde `second` depois de `first` se forem sobrepostos, contidos ou adjacentes."""
+    if second.text in first.text:
+        return first
+    size = _overlap(first.text, second.text)
+    if size:
+        text = first.text + second.text[size:]
+    elif _adjacent(first, second):
+        text = f"{first.text}\n{second.text}"
+    else:
+        return None
+    # O trecho fundido termina onde `second` termina (vale para a próxima fusão)
+    metadata = dict(
+        first.metadata,
+        id=second.metadata.get("id", first.metadata.get("id")),
+        chunk_index=second.metadata.get("chunk_index", first.metadata.get("chunk_index")),
+    )
+    return Passage(text, max(first.score, second.score), metadata)
+
+
+def _shingles(text: str) -> FrozenSet[str]:
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < 3:
+        return frozenset(words)
+    return frozenset(" ".join(words[i:i + 3]) for i in range(len(words) - 2))
+
+
+def _containment(candidate: FrozenSet[str], kept: FrozenSet[str]) -> float:
+    """Fração dos trigramas do candidato que já aparecem em um trecho mantido."""
+    if not candidate or not kept:
+        return 0.0
+    return len(candidate & kept) / len(candidate)
+
+
+class ContextPacker:
+    """Monta o contexto de RAG dentro do orçamento de tokens de cada agente."""
+
+    def __init__(
+        self,
+        default_budget: int = settings.CONTEXT_MAX_TOKENS,
+        budgets: Optional[Dict[str, int]] = None,
+        dedup_threshold: float = settings.CONTEXT_DEDUP_THRESHOLD,
+    ):
+        self.default_budget = default_budget
+        self.budgets = budgets if budgets is not None else parse_budgets(settings.CONTEXT_AGENT_BUDGETS)
+        self.dedup_threshold = dedup_threshold
+
+    def budget_for(self, agent: str) -> int:
+        return self.budgets.get(agent, self.default_budget)
+
+    def _merge_overlapping(self, passages: List[Passage]) -> List[Passage]:
+        merged: List[Passage] = []
+        for passage in passages:
+            for i, existing in enumerate(merged):
+                combined = _merge(existing, passage) or _merge(passage, existing)
+                if combined:
+                    merged[i] = combined
+                    break
+            else:
+                merged.append(passage)
+        return merged
+
+    def _drop_near_duplicates(self, passages: List[Passage]) -> List[Passage]:
+        kept: List[Passage] = []
+        kept_shingles: List[FrozenSet[str]] = []
+        for passage in passages:
+            shingles = _shingles(passage.text)
+            if any(_containment(shingles, other) >= self.dedup_threshold for other in kept_shingles):
+                continue
+            kept.append(passage)
+            kept_shingles.append(shingles)
+        return kept
+
+    def pack(
+        self,
+        items: Sequence[Union[Document, dict]],
+        agent: str,
+        formatter: Callable[[Passage], str] = lambda passage: passage.text,
+    ) -> PackedContext:
+        """Deduplica, ordena e corta os trechos recuperados no orçamento do agente."""
+        with timed_stage("context"):
+            return self._pack(items, agent, formatter)
+
+    def _pack(self, items, agent: str, formatter: Callable[[Passage], str]) -> PackedContext:
+        budget = self.budget_for(agent)
+        passages = _to_passages(items)
+        passages.sort(key=lambda passage: passage.score, reverse=True)
+        candidates = self._drop_near_duplicates(self._merge_overlapping(passages))
+
+        selected: List[Passage] = []
+        blocks: List[str] = []
+        used = 0
+        for passage in candidates:
+            block = formatter(passage)
+            cost = estimate_tokens(block) + (estimate_tokens(SEPARATOR) if blocks else 0)
+            if used + cost > budget:
+                continue
+            selected.append(passage)
+            blocks.append(block)
+            used += cost
+
+        if not selected and candidates:
+            # Nem o trecho mais relevante cabe: entra cortado no orçamento
+            block = formatter(candidates[0])
+            # Maior prefixo com estimate_tokens (len // 4 + 1) dentro do orçamento
+            block = block[:max(0, (budget - 1) * 4 + 3)]
+            selected, blocks, used = [candidates[0]], [block], estimate_tokens(block)
+
+        logger.bind(
+            context={
+                "retrieved": len(items),
+                "after_merge_dedup": len(candidates),
+                "selected": len(selected),
+                "tokens": used,
+                "budget": budget,
+            }
+        ).debug(f"Contexto montado para '{agent}'")
+        return PackedContext(SEPARATOR.join(blocks), selected, used, len(items) - len(selected))
+
+
+# Instância global do serviço
+context_packer = ContextPacker()
@@ -1,11 +1,11 @@
+from typing import AsyncIterator
+
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_community.callbacks.manager import get_openai_callback
+from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains.history_aware_retriever import create_history_aware_retriever
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.chains import create_retrieval_chain
@@ -14,62 +14,104 @@ from langchain.retrievers import MergerRetriever
 
 from app.config import settings
 from app.logger_config import logger
+from app.services.context_packer import context_packer
+from app.services.deadlines import LLM_STAGE, RETRIEVAL_STAGE, DeadlineExceeded, iter_with_deadline, run_stage, run_stage_sync
+from app.services.contract_index_cache import contract_index_cache
+from app.services.document_chunker import contract_chunker
 from app.services.embedding_service import embedding_service
+from app.services.history_manager import history_manager
 from app.services.retriever_service import retriever_service
+from app.services.session_store import Session, session_store
+from app.services.streaming import chunk_to_text
+from app.services.token_usage import token_usage_callback, track_token_usage
 from app.prompts import rag_prompt, conversational_prompt, contextualize_q_prompt
 
 # --- Gerenciador de Sessão --- #
-# Em produção, usaríamos Redis ou similar.
-store = {}
+# Sessões ficam no armazenamento compartilhado (LRU/TTL com backend persistente).
+# O retriever não é serializado: a sessão guarda apenas a chave do índice do
+# contrato, e o retriever é reconstruído a partir do cache de índices quando a
+# sessão volta do armazenamento persistente.
+SESSION_AGENT = "contract"
 
-def get_session_data(session_id: str) -> dict:
+def get_session_data(session_id: str) -> Session:
     """Obtém ou cria os dados da sessão (histórico e retriever)."""
-    if session_id not in store:
-        store[session_id] = {"history": ChatMessageHistory(), "retriever": None}
-        logger.info(f"Nova sessão criada: {session_id}")
-    return store[session_id]
+    return session_store.get(SESSION_AGENT, session_id)
 
-def get_session_history(session_id: str) -> ChatMessageHistory:
-    """Obtém o histórico de chat da sessão."""
-    return get_session_data(session_id)["history"]
+def get_session_history(session_id: str) -> BaseChatMessageHistory:
+    """Obtém o histórico de chat da sessão, limitado pelo orçamento de tokens."""
+    return history_manager.get_history(SESSION_AGENT, session_id)
 
 # --- Lógica de RAG (Retrieval-Augmented Generation) --- #
 
-def create_retriever(text: str):
-    """Cria um retriever a partir de um texto, usando embeddings e um vector store."""
-    logger.info("Criando retriever a partir do texto do documento.")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
-    documents = text_splitter.create_documents([text])
-    
-    # Usa o serviço de embedding local centralizado
-    embeddings = embedding_service.get_embeddings()
-    
-    vector_store = FAISS.from_documents(documents, embeddings)
+def get_contract_index_key(text: str) -> str:
+    """Chave do índice FAISS do contrato no cache de índices (inclui os parâmetros do chunker)."""
+    return contract_index_cache.make_key(text, contract_chunker.params, embedding_service.model_name)
+
+def create_retriever(text: str, cache_key: str = None):
+    """
+    Cria um retriever a partir de um texto, usando embeddings e um vector store.
+
+    O índice FAISS é reaproveitado do cache quando o mesmo texto já foi indexado
+    com os mesmos parâmetros, sem nenhuma chamada de embedding.
+    """
+    cache_key = cache_key or get_contract_index_key(text)
+
+    def build_vector_store():
+        logger.info("Criando retriever a partir do texto do documento.")
+        # Um chunk por cláusula, com o cabeçalho da cláusula nos metadados
+        documents = contract_chunker.create_documents(text)
+        # Usa o serviço de embedding centralizado (com cache)
+        return FAISS.from_documents(documents, embedding_service)
+
+    vector_store = contract_index_cache.get_or_build(cache_key, build_vector_store, embedding_service)
     return vector_store.as_retriever(search_kwargs={"k": 5})
 
-def set_session_retriever(session_id: str, retriever):
+def set_session_retriever(session_id: str, retriever, contract_index_key: str = None):
     """Armazena o retriever na sessão do usuário."""
-    get_session_data(session_id)["retriever"] = retriever
+    session = get_session_data(session_id)
+    session.transient["retriever"] = retriever
+    if contract_index_key:
+        session.metadata["contract_index_key"] = contract_index_key
     logger.info(f"Retriever armazenado para a sessão: {session_id}")
 
+def get_session_retriever(session_id: str):
+    """
+    Retorna o retriever da sessão, reconstruindo-o a partir do cache de índices
+    se a sessão foi restaurada do armazenamento persistente.
+    """
+    session = get_session_data(session_id)
+    retriever = session.transient.get("retriever")
+    index_key = session.metadata.get("contract_index_key")
+    if retriever is None and index_key:
+        vector_store = contract_index_cache.get(index_key, embedding_service)
+        if vector_store is None:
+            logger.warning(f"Índice do contrato da sessão {session_id} não está mais no cache")
+            return None
+        retriever = _combine_with_civil_code(session_id, vector_store.as_retriever(search_kwargs={"k": 5}))
+        session.transient["retriever"] = retriever
+        logger.info(f"Retriever da sessão {session_id} reconstruído a partir do cache de índices")
+    return retriever
+
+def _combine_with_civil_code(session_id: str, contract_retriever):
+    # Combina com o retriever do Código Civil, se ele foi carregado
+    civil_code_retriever = retriever_service.get_civil_code_retriever()
+    if civil_code_retriever:
+        logger.info(f"Combinando retriever do contrato com a base de conhecimento para a sessão {session_id}")
+        return MergerRetriever(retrievers=[contract_retriever, civil_code_retriever])
+    logger.warning(f"Base de conhecimento do Código Civil não carregada. Usando apenas o retriever do contrato para a sessão {session_id}")
+    return contract_retriever
+
 def setup_retriever_for_session(session_id: str, contract_text: str):
     """Cria um retriever para o contrato e o combina com o retriever global do Código Civil."""
     logger.info(f"Configurando retriever para a sessão {session_id}.")
     
     # 1. Cria o retriever para o contrato específico
-    contract_retriever = create_retriever(contract_text)
-
-    # 2. Obtém o retriever do Código Civil a partir do serviço centralizado
-    civil_code_retriever = retriever_service.get_civil_code_retriever()
+    index_key = get_contract_index_key(contract_text)
+    contract_retriever = create_retriever(contract_text, cache_key=index_key)
 
-    # 3. Combina com o retriever do Código Civil, se ele foi carregado
-    if civil_code_retriever:
-        logger.info(f"Combinando retriever do contrato com a base de conhecimento para a sessão {session_id}")
-        merger = MergerRetriever(retrievers=[contract_retriever, civil_code_retriever])
-        set_session_retriever(session_id, merger)
-    else:
-        logger.warning(f"Base de conhecimento do Código Civil não carregada. Usando apenas o retriever do contrato para a sessão {session_id}")
-        set_session_retriever(session_id, contract_retriever)
+    # 2. Combina com o retriever do Código Civil obtido do serviço centralizado
+    retriever = _combine_with_civil_code(session_id, contract_retriever)
+    set_session_retriever(session_id, retriever, contract_index_key=index_key)
 
 
 # --- Construção das Cadeias (Chains) --- #
@@ -78,28 +120,49 @@ def setup_retriever_for_session(session_id: str, contract_text: str):
 llm = ChatGoogleGenerativeAI(
     model="gemini-2.5-pro",
     google_api_key=settings.GOOGLE_API_KEY,
-    temperature=0.2
+    temperature=0.2,
+    timeout=settings.STAGE_TIMEOUT_LLM_SECONDS,
+    callbacks=[token_usage_callback]
+)
+
+# Contexto usado quando a busca estoura o orçamento (modo degradado, sem RAG)
+DEGRADED_CONTEXT = (
+    "A busca no contrato e na legislação excedeu o tempo limite. Responda com base "
+    "no histórico da conversa e no conhecimento geral, e avise o usuário de que a "
+    "resposta não foi conferida com o texto do contrato."
 )
 
 # Função para obter documentos relevantes
 def get_relevant_documents(session_id: str, query: str):
-    """Busca documentos relevantes usando o retriever da sessão."""
-    logger.debug(f"Buscando documentos para sessão {session_id} com query: {query}")
+    """
+    Busca documentos relevantes usando o retriever da sessão, dentro do orçamento
+    da etapa de recuperação (estourado, propaga `DeadlineExceeded`).
+    """
+    logger.bind(context=f'query="{query[:50]}..."').debug(f"Buscando documentos para sessão {session_id}")
     try:
-        retriever = get_session_data(session_id)["retriever"]
+        retriever = get_session_retriever(session_id)
         if retriever:
-            docs = retriever.invoke(query)  # Usando invoke em vez do método deprecated
+            docs = run_stage_sync(RETRIEVAL_STAGE, lambda: retriever.invoke(query))
             logger.debug(f"Encontrados {len(docs)} documentos relevantes")
             return docs
         logger.warning(f"Nenhum retriever encontrado para sessão {session_id}")
         return []
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar documentos: {e}")
         return []
 
 # 1. Cadeia RAG simplificada
 def create_rag_response(session_id: str, query: str, chat_history: list):
-    """Cria resposta RAG combinando contrato + leis civis."""
+    """
+    Monta a cadeia RAG combinando contrato + leis civis.
+
+    Retorna a cadeia já com o contexto injetado, para que o RunnableLambda que a
+    envolve possa tanto invocá-la quanto transmiti-la token a token. Em caso de
+    falha na busca, retorna diretamente a mensagem de erro; se a busca estourar
+    o orçamento, a cadeia segue sem os documentos (modo degradado).
+    """
     logger.debug(f"Criando resposta RAG para sessão {session_id}")
     
     try:
@@ -112,38 +175,26 @@ def create_rag_response(session_id: str, query: str, chat_history: list):
             logger.warning("Nenhum documento encontrado")
             return "Não foi possível encontrar informações relevantes para sua consulta."
         
-        # Combina os documentos
+        # Funde trechos sobrepostos, descarta duplicatas e corta no orçamento de tokens
         logger.debug("Combinando documentos...")
-        context = "\n\n".join([doc.page_content for doc in docs])
+        context = context_packer.pack(docs, SESSION_AGENT).text
         logger.debug(f"Contexto criado com {len(context)} caracteres")
+    except DeadlineExceeded as e:
+        logger.warning(f"{e}; respondendo sem os documentos da sessão {session_id} (modo degradado)")
+        context = DEGRADED_CONTEXT
     except Exception as e:
-        logger.error(f"Erro na busca/combinação de documentos: {e}", exc_info=True)
+        logger.opt(exception=True).error(f"Erro na busca/combinação de documentos: {e}")
         return f"Erro ao buscar informações: {str(e)}"
     
-    try:
-        # Monta a cadeia RAG usando o prompt importado
-        rag_chain_with_context = (
-            RunnablePassthrough.assign(
-                context=(lambda x: context) # Injeta o contexto dos documentos
-            )
-            | rag_prompt
-            | llm
-            | StrOutputParser()
+    # Monta a cadeia RAG usando o prompt importado
+    return (
+        RunnablePassthrough.assign(
+            context=(lambda x: context) # Injeta o contexto dos documentos
         )
-
-        logger.debug("Invocando a cadeia RAG com contexto...")
-        # Invoca a cadeia com os dados necessários
-        response = rag_chain_with_context.invoke({
-            "input": query,
-            "chat_history": chat_history
-        })
-        
-        logger.debug("Resposta RAG gerada com sucesso")
-        return response
-        
-    except Exception as e:
-        logger.error(f"Erro na criação da resposta RAG: {e}", exc_info=True)
-        return f"Erro ao processar a análise: {str(e)}"
+        | rag_prompt
+        | llm
+        | StrOutputParser()
+    )
 
 # Chain simples que funciona
 rag_chain = RunnableLambda(lambda x: create_rag_response(
@@ -159,12 +210,10 @@ conversational_chain = conversational_prompt | llm
 def route(info):
     """Decide qual cadeia (RAG ou conversacional) executar com base na presença de um retriever."""
     session_id = info.get("session_id")
-    logger.debug(f"Roteando para a sessão: {session_id}. Info recebido: {info}")
-    
-    if session_id and get_session_data(session_id)["retriever"]:
+    if session_id and get_session_retriever(session_id):
         logger.debug(f"Sessão {session_id}: Roteando para RAG chain (retriever encontrado).")
         return rag_chain
-    
+
     logger.debug(f"Sessão {session_id}: Roteando para Conversational chain (sem retriever).")
     return conversational_chain
 
@@ -173,7 +222,6 @@ chain_with_history = RunnableWithMessageHistory(
     get_session_history,
     input_messages_key="input",
     history_messages_key="chat_history",
-    output_messages_key="answer",
 )
 
 
@@ -182,67 +230,68 @@ class ContractChatService:
 
     async def process_message(self, user_message: str, session_id: str) -> str:
         """Processa a mensagem do usuário e retorna a resposta do agente."""
-        logger.debug(
-            f"Processando mensagem para a sessão {session_id}", 
-            context=f'user_message="{user_message[:50]}..."'
+        logger.bind(context=f'user_message="{user_message[:50]}..."').debug(
+            f"Processando mensagem para a sessão {session_id}"
         )
         
         try:
             config = {"configurable": {"session_id": session_id}}
             input_data = {"input": user_message, "session_id": session_id}
-            logger.debug(f"Input data preparado: {input_data}")
-            logger.debug(f"Config preparado: {config}")
-            
-            with get_openai_callback() as cb:
-                logger.debug("Iniciando chamada para chain_with_history.invoke...")
+
+            with track_token_usage() as usage:
                 # Passa a session_id diretamente no dicionário de input
-                response = await chain_with_history.ainvoke(input_data, config=config)
-                logger.debug(f"Resposta recebida: {type(response)} = {response}")
-                
+                response = await run_stage(LLM_STAGE, lambda: chain_with_history.ainvoke(input_data, config=config))
+
                 # A resposta pode ser string (nossa função) ou dict/AIMessage (chains complexas)
                 if isinstance(response, str):
-                    logger.debug("Resposta é uma string direta")
                     response_content = response
                 elif isinstance(response, dict):
-                    logger.debug("Resposta é um dicionário, buscando chave 'answer'")
                     response_content = response.get("answer", str(response))
                 else:
-                    logger.debug("Resposta é um AIMessage, acessando .content")
                     response_content = response.content
-                
-                logger.debug(f"Conteúdo final extraído: {response_content[:100]}...")
 
                 # Log de uso de tokens
                 history = get_session_history(session_id)
-                logger.info(
-                    f"Estatísticas de uso para a sessão {session_id}",
+                logger.bind(
                     context={
                         "history_length": len(history.messages),
-                        "input_tokens": cb.prompt_tokens,
-                        "output_tokens": cb.completion_tokens,
-                        "total_tokens": cb.total_tokens,
-                        "total_cost_usd": f"${cb.total_cost:.6f}"
+                        **usage.to_dict()
                     }
-                )
+                ).info(f"Estatísticas de uso para a sessão {session_id}")
 
-            logger.info(
-                f"Resposta gerada com sucesso para a sessão {session_id}",
-                context=f'response="{response_content[:50]}..."'
+            logger.bind(context=f'response="{response_content[:50]}..."').info(
+                f"Resposta gerada com sucesso para a sessão {session_id}"
             )
             return response_content
+        except DeadlineExceeded:
+            # O router responde 504 quando o prazo da requisição acaba
+            raise
         except Exception as e:
-            logger.error(
-                f"Erro ao processar a mensagem na sessão {session_id}: {e}",
-                context=f'user_message="{user_message[:50]}..."', 
-                exc_info=True
+            logger.bind(context=f'user_message="{user_message[:50]}..."').opt(exception=True).error(
+                f"Erro ao processar a mensagem na sessão {session_id}: {e}"
             )
             return "Desculpe, ocorreu um erro ao processar sua solicitação. Por favor, tente novamente."
 
+    async def stream_message(self, user_message: str, session_id: str) -> AsyncIterator[str]:
+        """
+        Versão em streaming de `process_message`.
+
+        Usa o mesmo roteamento (RAG ou conversacional); o histórico só recebe o
+        turno quando o stream é consumido até o fim.
+        """
+        logger.debug(f"Iniciando stream para a sessão {session_id}")
+
+        config = {"configurable": {"session_id": session_id}}
+        input_data = {"input": user_message, "session_id": session_id}
+        async for chunk in iter_with_deadline(LLM_STAGE, chain_with_history.astream(input_data, config=config)):
+            text = chunk_to_text(chunk)
+            if text:
+                yield text
+
 
 # Função auxiliar para limpar a memória
 def clear_session_memory(session_id: str):
-    if session_id in store:
-        del store[session_id]
+    if session_store.delete(SESSION_AGENT, session_id):
         logger.info(f"Sessão {session_id} foi limpa.")
         return True
     return False
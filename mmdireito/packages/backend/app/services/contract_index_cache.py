@@ -0,0 +1,187 @@
+# app/services/contract_index_cache.py
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from app.config import settings
+from app.logger_config import logger
+
+INDEX_NAME = "index"
+
+
+class ContractIndexCache:
+    """
+    Cache endereçado por conteúdo dos índices FAISS de contratos.
+
+    A chave é o hash do texto extraído somado aos parâmetros de divisão e ao modelo
+    de embedding, então o mesmo contrato (por exemplo, um modelo padrão enviado por
+    várias sessões) é indexado uma única vez. Os índices ficam em disco no formato
+    do `FAISS.save_local`, são carregados com memory-map quando possível e os mais
+    usados permanecem em memória, compartilhados entre as sessões. O diretório é
+    limitado por tamanho, removendo primeiro os índices acessados há mais tempo.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = settings.CONTRACT_INDEX_CACHE_DIR,
+        max_bytes: int = settings.CONTRACT_INDEX_CACHE_MAX_BYTES,
+        max_in_memory: int = settings.CONTRACT_INDEX_CACHE_MAX_IN_MEMORY,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_in_memory = max_in_memory
+        self._loaded: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, splitter_params: dict, embedding_model: str) -> str:
+        """Gera a chave do índice a partir do conteúdo e dos parâmetros que o afetam."""
+        digest = hashlib.sha256()
+        digest.update(text.encode("utf-8"))
+        digest.update(json.dumps(splitter_params, sort_keys=True).encode("utf-8"))
+        digest.update(embedding_model.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _remember(self, key: str, vector_store) -> None:
+        # Chamado sob o lock
+        self._loaded[key] = vector_store
+        self._loaded.move_to_end(key)
+        while len(self._loaded) > self.max_in_memory:
+            self._loaded.popitem(last=False)
+
+    def _load_from_disk(self, key: str, embeddings):
+        import faiss
+        from langchain_community.vectorstores import FAISS
+
+        path = self._path(key)
+        index_file = os.path.join(path, f"{INDEX_NAME}.faiss")
+        if not os.path.exists(index_file):
+            return None
+
+        try:
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Nem todo tipo de índice suporta memory-map; carrega normalmente
+            index = faiss.read_index(index_file)
+
+        # Arquivo gerado por este próprio cache (mesmo formato do FAISS.save_local)
+        with open(os.path.join(path, f"{INDEX_NAME}.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        os.utime(path)  # marca o acesso para a política de remoção
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+    def get(self, key: str, embeddings):
+        """Retorna o vector store em cache (memória ou disco) ou None."""
+        with self._lock:
+            vector_store = self._loaded.get(key)
+            if vector_store is not None:
+                self._loaded.move_to_end(key)
+                self.memory_hits += 1
+                return vector_store
+
+        try:
+            vector_store = self._load_from_disk(key, embeddings)
+        except Exception as e:
+            logger.warning(f"Índice de contrato {key[:12]} corrompido no cache; será reconstruído: {e}")
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            vector_store = None
+
+        with self._lock:
+            if vector_store is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, vector_store)
+            return vector_store
+
+    def put(self, key: str, vector_store) -> None:
+        """Grava o índice em disco (de forma atômica) e o mantém em memória."""
+        with self._lock:
+            self._remember(key, vector_store)
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = os.path.join(self.cache_dir, f".tmp-{key}-{uuid.uuid4().hex}")
+            vector_store.save_local(tmp_path, index_name=INDEX_NAME)
+            final_path = self._path(key)
+            if os.path.exists(final_path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            else:
+                os.replace(tmp_path, final_path)
+            self._evict_to_size()
+        except OSError as e:
+            logger.warning(f"Não foi possível persistir o índice de contrato {key[:12]}: {e}")
+
+    def get_or_build(self, key: str, build: Callable[[], object], embeddings):
+        """
+        Retorna o índice em cache ou o constrói com `build`. Construções concorrentes
+        da mesma chave aguardam a primeira, evitando embeddings duplicados.
+        """
+        vector_store = self.get(key, embeddings)
+        if vector_store is not None:
+            return vector_store
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                vector_store = self._loaded.get(key)
+            if vector_store is None:
+                vector_store = build()
+                self.put(key, vector_store)
+
+        with self._lock:
+            self._build_locks.pop(key, None)
+        return vector_store
+
+    def _evict_to_size(self) -> None:
+        """Remove os índices acessados há mais tempo até o diretório caber no limite."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".tmp-") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            entries.append((os.stat(path).st_mtime, size, name, path))
+            total += size
+
+        for _, size, name, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logger.info(f"Índice de contrato {name[:12]} removido do cache em disco (limite de tamanho)")
+
+    def get_stats(self) -> dict:
+        """Contadores de acerto/erro e ocupação do cache."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "in_memory": len(self._loaded),
+            "max_in_memory": self.max_in_memory,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Instância global do cache
+contract_index_cache = ContractIndexCache()
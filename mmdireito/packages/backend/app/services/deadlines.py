@@ -0,0 +1,288 @@
+# app/services/deadlines.py
+"""
+Prazos por requisição e por etapa (embedding, recuperação e LLM).
+
+O router define o prazo da requisição em um ContextVar; cada etapa roda com o
+menor entre o seu orçamento (`STAGE_TIMEOUT_*`) e o tempo que resta até o prazo,
+e estoura com `DeadlineExceeded`. Como o ContextVar é copiado para as tarefas e
+threads criadas a partir da requisição, os serviços não precisam receber o prazo
+como parâmetro.
+
+As chamadas de embedding e de recuperação podem ser "hedged": se a primeira
+tentativa passa do percentil configurado da latência observada, uma segunda é
+disparada e vale a que terminar primeiro. O que pesa é a cauda, não a mediana.
+"""
+import asyncio
+import contextvars
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.metrics import timed_stage
+
+T = TypeVar("T")
+
+# Etapas com orçamento próprio
+EMBEDDING_STAGE = "embedding"
+RETRIEVAL_STAGE = "retrieval"
+LLM_STAGE = "llm"
+
+STAGE_BUDGETS = {
+    EMBEDDING_STAGE: settings.STAGE_TIMEOUT_EMBEDDING_SECONDS,
+    RETRIEVAL_STAGE: settings.STAGE_TIMEOUT_RETRIEVAL_SECONDS,
+    LLM_STAGE: settings.STAGE_TIMEOUT_LLM_SECONDS,
+}
+
+# Amostras de latência guardadas por etapa para o percentil do hedging
+LATENCY_SAMPLES = 500
+
+# Desfechos de uma execução de etapa
+OK = "ok"
+TIMEOUT = "timeout"
+ERROR = "error"
+CANCELLED = "cancelled"
+
+# Prazo absoluto (time.monotonic) da requisição atual
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+# Threads para etapas síncronas (ex.: retrievers do LangChain); a chamada que
+# estoura o prazo continua na thread, mas a requisição segue sem ela
+_sync_executor = ThreadPoolExecutor(max_workers=settings.DEADLINE_SYNC_WORKERS, thread_name_prefix="stage")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Uma etapa não terminou dentro do orçamento (ou o prazo da requisição acabou)."""
+
+    def __init__(self, stage: str, timeout: Optional[float] = None):
+        detail = f" ({timeout:.2f}s)" if timeout is not None else ""
+        super().__init__(f"Prazo esgotado na etapa '{stage}'{detail}")
+        self.stage = stage
+
+
+class StageStats:
+    """Latências recentes (das execuções bem-sucedidas) e contadores de uma etapa."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._samples: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds: float, outcome: str = OK) -> None:
+        self.calls += 1
+        if outcome == OK:
+            self._samples.append(seconds)
+        elif outcome == TIMEOUT:
+            self.timeouts += 1
+        elif outcome == ERROR:
+            self.errors += 1
+        else:
+            self.cancelled += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def hedge_delay(self) -> Optional[float]:
+        """Atraso da segunda tentativa, ou None enquanto não há amostras suficientes."""
+        if not settings.HEDGE_ENABLED or len(self._samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return max(settings.HEDGE_MIN_DELAY_SECONDS, self.percentile(settings.HEDGE_PERCENTILE))
+
+    def get_stats(self) -> dict:
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 4) if value is not None else None
+
+        return {
+            "budget_seconds": STAGE_BUDGETS.get(self.stage),
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50": rounded(self.percentile(0.5)),
+            "p95": rounded(self.percentile(0.95)),
+            "p99": rounded(self.percentile(0.99)),
+        }
+
+
+_stats: Dict[str, StageStats] = {stage: StageStats(stage) for stage in STAGE_BUDGETS}
+
+
+def _stage_stats(stage: str) -> StageStats:
+    stats = _stats.get(stage)
+    if stats is None:
+        stats = _stats[stage] = StageStats(stage)
+    return stats
+
+
+# --- Prazo da requisição --- #
+
+def deadline_after(seconds: float) -> float:
+    """Prazo absoluto daqui a `seconds`, sem ultrapassar o prazo já em vigor."""
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    return min(at, current) if current is not None else at
+
+
+@contextmanager
+def request_deadline(seconds: float = settings.REQUEST_DEADLINE_SECONDS):
+    """Define o prazo da requisição para o bloco (e tudo que ele disparar)."""
+    token = _deadline.set(deadline_after(seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def set_deadline(at: Optional[float]) -> None:
+    """Define o prazo no contexto atual sem restaurá-lo (para geradores de streaming)."""
+    _deadline.set(at)
+
+
+def remaining() -> Optional[float]:
+    """Segundos até o prazo da requisição (None se não houver prazo)."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def stage_timeout(stage: str) -> Optional[float]:
+    """Menor entre o orçamento da etapa e o que resta do prazo da requisição."""
+    budget = STAGE_BUDGETS.get(stage)
+    left = remaining()
+    if budget is None:
+        return left
+    return budget if left is None else min(budget, left)
+
+
+@contextmanager
+def _recorded(stage: str):
+    """Mede a etapa em /metrics e registra a duração e o desfecho nas estatísticas dela."""
+    stats = _stage_stats(stage)
+    started = time.monotonic()
+    outcome = OK
+    try:
+        with timed_stage(stage):
+            yield
+    except DeadlineExceeded as e:
+        # Prazo de uma etapa interna conta como erro desta
+        outcome = TIMEOUT if e.stage == stage else ERROR
+        raise
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = CANCELLED
+        raise
+    except BaseException:
+        outcome = ERROR
+        raise
+    finally:
+        stats.record(time.monotonic() - started, outcome)
+
+
+# --- Execução das etapas --- #
+
+async def run_stage(stage: str, fn: Callable[[], Awaitable[T]]) -> T:
+    """Executa `fn()` com o tempo limite da etapa (e mede a duração em /metrics e nas estatísticas)."""
+    timeout = stage_timeout(stage)
+    with _recorded(stage):
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded(stage, 0.0)
+        try:
+            return await asyncio.wait_for(fn(), timeout)
+        except DeadlineExceeded:
+            # Etapa interna que estourou primeiro: mantém a etapa original no erro
+            raise
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage, timeout) from None
+
+
+def run_stage_sync(stage: str, fn: Callable[[], T]) -> T:
+    """Versão para código síncrono: executa `fn` em uma thread e espera até o limite da etapa."""
+    timeout = stage_timeout(stage)
+    with _recorded(stage):
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded(stage, 0.0)
+        context = contextvars.copy_context()
+        future = _sync_executor.submit(context.run, fn)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise DeadlineExceeded(stage, timeout) from None
+
+
+async def hedged(stage: str, fn: Callable[[], Awaitable[T]]) -> T:
+    """
+    Executa `fn()` e, se ela passar do percentil de latência da etapa, dispara uma
+    segunda tentativa; devolve o primeiro resultado bem-sucedido e cancela o resto.
+    Roda dentro do `run_stage` da mesma etapa, que registra a duração.
+    """
+    stats = _stage_stats(stage)
+    delay = stats.hedge_delay()
+    first = asyncio.ensure_future(fn())
+    tasks = [first]
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                stats.hedges += 1
+                logger.debug(f"Etapa '{stage}' passou de {delay:.3f}s; disparando tentativa paralela")
+                tasks.append(asyncio.ensure_future(fn()))
+
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        stats.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def iter_with_deadline(stage: str, stream: AsyncIterator[T]) -> AsyncIterator[T]:
+    """Repassa os itens de um stream enquanto houver tempo na etapa."""
+    timeout = stage_timeout(stage)
+    ends_at = None if timeout is None else time.monotonic() + timeout
+    iterator = stream.__aiter__()
+    try:
+        with _recorded(stage):
+            while True:
+                left = None if ends_at is None else ends_at - time.monotonic()
+                if left is not None and left <= 0:
+                    raise DeadlineExceeded(stage, timeout)
+                try:
+                    item = await asyncio.wait_for(iterator.__anext__(), left)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise DeadlineExceeded(stage, timeout) from None
+                yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose:
+            await aclose()
+
+
+def get_stats() -> dict:
+    return {
+        "request_deadline_seconds": settings.REQUEST_DEADLINE_SECONDS,
+        "hedge_enabled": settings.HEDGE_ENABLED,
+        "stages": {stage: stats.get_stats() for stage, stats in _stats.items()},
+    }
@@ -1,22 +1,25 @@
+from typing import AsyncIterator
+
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
 
 from app.config import settings
 from app.prompts import devil_advocate_prompt
 from app.logger_config import logger
+from app.services.deadlines import LLM_STAGE, DeadlineExceeded, iter_with_deadline, run_stage
+from app.services.history_manager import history_manager
+from app.services.streaming import chunk_to_text
+from app.services.token_usage import token_usage_callback
 
 
 # --- Gerenciador de Sessão --- #
-# Em produção, usaríamos Redis ou similar.
-store = {}
+# Sessões ficam no armazenamento compartilhado (LRU/TTL com backend persistente);
+# a cadeia recebe apenas o resumo + turnos recentes dentro do orçamento de tokens
+SESSION_AGENT = "devil_advocate"
 
 def get_session_history(session_id: str):
     """Obtém o histórico da sessão ou cria um novo."""
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-        logger.info(f"Nova sessão criada para Advogado do Diabo: {session_id}")
-    return store[session_id]
+    return history_manager.get_history(SESSION_AGENT, session_id)
 
 # --- Construção da Chain --- #
 
@@ -24,7 +27,9 @@ def get_session_history(session_id: str):
 llm = ChatGoogleGenerativeAI(
     model="gemini-2.5-flash",
     google_api_key=settings.GOOGLE_API_KEY,
-    temperature=0.4 # Um pouco mais criativo para encontrar falhas
+    temperature=0.4, # Um pouco mais criativo para encontrar falhas
+    timeout=settings.STAGE_TIMEOUT_LLM_SECONDS,
+    callbacks=[token_usage_callback]
 )
 
 # Cria a cadeia de conversação simples
@@ -47,17 +52,32 @@ class DevilAdvocateService:
         
         try:
             config = {"configurable": {"session_id": session_id}}
-            response = await chain_with_history.ainvoke(
+            response = await run_stage(LLM_STAGE, lambda: chain_with_history.ainvoke(
                 {"input": user_message},
                 config=config
-            )
+            ))
             return response.content
+        except DeadlineExceeded:
+            # O router responde 504 quando o prazo da requisição acaba
+            raise
         except Exception as e:
-            logger.error(
-                f"Erro ao processar mensagem para Advogado do Diabo na sessão {session_id}: {e}",
-                exc_info=True
+            logger.opt(exception=True).error(
+                f"Erro ao processar mensagem para Advogado do Diabo na sessão {session_id}: {e}"
             )
             return "Desculpe, ocorreu um erro ao analisar sua tese. Por favor, tente novamente."
 
+    async def stream_message(self, user_message: str, session_id: str) -> AsyncIterator[str]:
+        """Transmite a crítica em fragmentos; o turno só entra no histórico ao final do stream."""
+        logger.debug(f"Iniciando stream para Advogado do Diabo na sessão {session_id}")
+
+        config = {"configurable": {"session_id": session_id}}
+        async for chunk in iter_with_deadline(LLM_STAGE, chain_with_history.astream(
+            {"input": user_message},
+            config=config
+        )):
+            text = chunk_to_text(chunk)
+            if text:
+                yield text
+
 # Instância única do serviço
 devil_advocate_service = DevilAdvocateService()
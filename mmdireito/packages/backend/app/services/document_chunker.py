@@ -0,0 +1,281 @@
+# app/services/document_chunker.py
+"""
+Divisão estrutural de textos jurídicos em chunks.
+
+Em vez de janelas fixas com sobreposição, o texto é cortado nas fronteiras da
+própria estrutura do documento:
+
+- códigos e leis: um chunk por artigo, com a rubrica e os cabeçalhos de divisão
+  (Livro/Título/Capítulo/Seção) que o antecedem e a hierarquia nos metadados;
+- contratos: um chunk por cláusula.
+
+Unidades maiores que `max_chars` são divididas nos parágrafos/incisos (e, em
+último caso, por tamanho, sem sobreposição); unidades menores que `min_chars`
+são agrupadas com as seguintes da mesma seção. O texto é processado em
+streaming, linha a linha, então o chunker pode ser alimentado página a página.
+"""
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from langchain_core.documents import Document
+
+from app.config import settings
+from app.services.article_index import (
+    HIERARCHY_LEVELS,
+    ArticleTracker,
+    article_heading_id,
+    hierarchy_level,
+    is_article_heading,
+    is_heading_line,
+    is_subdivision,
+)
+
+# Quantas linhas de cabeçalho/rubrica antes de um artigo são levadas para ele
+_MAX_LEADING_LINES = 6
+
+# Cabeçalho de cláusula ("CLÁUSULA PRIMEIRA – DO OBJETO", "Cláusula 3ª", "4. DO PRAZO");
+# só a palavra "cláusula" ignora maiúsculas: o título numerado precisa estar em caixa alta
+_CLAUSE_PATTERN = re.compile(
+    r"^\s*(?:(?i:CL[ÁA]USULA)\b|\d{1,2}\s*[.)–-]\s*[A-ZÁÉÍÓÚÂÊÔÃÕÇ][A-ZÁÉÍÓÚÂÊÔÃÕÇ ,/-]{3,}$)"
+)
+# Sumário do PDF: título e entradas com pontilhado ou número de página no fim
+_TOC_TITLE_PATTERN = re.compile(r"^\s*(?:Sum[áa]rio|[ÍI]ndice(?:\s+Sistem[áa]tico)?)\s*$", re.IGNORECASE)
+_TOC_LEADER_PATTERN = re.compile(r"(?:\.\s?){4,}\s*\d*\s*$")
+_TOC_PAGE_PATTERN = re.compile(r"\s\d{1,4}\s*$")
+
+# Subcláusulas e parágrafos de contrato ("3.1", "Parágrafo Primeiro", "a)")
+_SUBCLAUSE_PATTERN = re.compile(r"^\s*(?:\d{1,2}\.\d{1,2}\b|Par[áa]grafo\b|[a-z]\)\s)", re.IGNORECASE)
+
+
+def _is_toc_entry(line: str) -> bool:
+    """Entrada do sumário: pontilhado até a página, ou divisão seguida do número da página."""
+    return bool(_TOC_LEADER_PATTERN.search(line)) or (
+        hierarchy_level(line) is not None and bool(_TOC_PAGE_PATTERN.search(line))
+    )
+
+
+class Chunk(NamedTuple):
+    """Trecho do documento e seus metadados estruturais."""
+    content: str
+    metadata: dict
+
+
+class _Unit(NamedTuple):
+    lines: List[str]
+    label: Optional[str]
+    hierarchy: Dict[str, str]
+
+
+class StructuredChunker:
+    """
+    Agrupa linhas em unidades (artigos ou cláusulas) delimitadas por `is_boundary`.
+
+    `unit_name` nomeia a unidade nos metadados ("article", "clause"), identificada
+    por `label_of(linha de fronteira)`; `is_split_point` indica onde uma unidade
+    grande pode ser cortada.
+    """
+
+    def __init__(
+        self,
+        unit_name: str,
+        is_boundary: Callable[[str], bool],
+        is_split_point: Callable[[str], bool],
+        max_chars: int,
+        min_chars: int,
+        label_of: Callable[[str], str] = str.strip,
+        track_hierarchy: bool = False,
+        track_articles: bool = False,
+    ):
+        self.unit_name = unit_name
+        self.is_boundary = is_boundary
+        self.is_split_point = is_split_point
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self.label_of = label_of
+        self.track_hierarchy = track_hierarchy
+        self.track_articles = track_articles
+
+    @property
+    def params(self) -> dict:
+        """Parâmetros que determinam os chunks (usados em chaves de cache)."""
+        return {
+            "chunker": self.unit_name,
+            "max_chars": self.max_chars,
+            "min_chars": self.min_chars,
+        }
+
+    # --- Unidades --- #
+
+    def _iter_lines(self, texts: Iterable[str]) -> Iterator[str]:
+        """
+        Linhas dos textos em ordem. Nos códigos, o sumário é descartado: ele lista
+        todas as divisões (e as páginas) e contaminaria a hierarquia e o preâmbulo.
+        Ele vai até a última entrada antes do primeiro artigo; o que vem depois dela
+        (título do documento, "PARTE GERAL", "TÍTULO I"...) já é o começo do texto.
+        """
+        in_toc = False
+        after_toc: List[str] = []
+        for text in texts:
+            for line in text.splitlines():
+                if not self.track_hierarchy:
+                    yield line
+                elif _is_toc_entry(line) or (not in_toc and _TOC_TITLE_PATTERN.match(line)):
+                    in_toc, after_toc = True, []
+                elif not in_toc:
+                    yield line
+                elif is_article_heading(line):
+                    yield from after_toc
+                    yield line
+                    in_toc, after_toc = False, []
+                else:
+                    after_toc.append(line)
+        yield from after_toc
+
+    def _iter_units(self, texts: Iterable[str]) -> Iterator[_Unit]:
+        hierarchy: Dict[str, str] = {}
+        lines: List[str] = []
+        label: Optional[str] = None
+        unit_hierarchy: Dict[str, str] = {}
+
+        for line in self._iter_lines(texts):
+            if self.track_hierarchy:
+                level = hierarchy_level(line)
+                if level:
+                    # Uma divisão nova invalida as divisões abaixo dela
+                    for lower in HIERARCHY_LEVELS[HIERARCHY_LEVELS.index(level):]:
+                        hierarchy.pop(lower, None)
+                    hierarchy[level] = line.strip()
+
+            if not self.is_boundary(line):
+                lines.append(line)
+                continue
+
+            # Cabeçalhos e rubrica logo antes da fronteira pertencem à unidade nova
+            leading: List[str] = []
+            while lines and len(leading) < _MAX_LEADING_LINES and is_heading_line(lines[-1]):
+                leading.insert(0, lines.pop())
+            if any(line.strip() for line in lines):
+                yield _Unit(lines, label, unit_hierarchy)
+            lines = leading + [line]
+            label = self.label_of(line)
+            unit_hierarchy = dict(hierarchy)
+
+        if any(line.strip() for line in lines):
+            yield _Unit(lines, label, unit_hierarchy)
+
+    # --- Divisão de unidades grandes --- #
+
+    def _split_oversized(self, lines: List[str]) -> List[str]:
+        """Corta nos parágrafos/incisos, agrupando os segmentos até `max_chars`."""
+        segments: List[List[str]] = [[]]
+        for line in lines:
+            if segments[-1] and self.is_split_point(line):
+                segments.append([])
+            segments[-1].append(line)
+
+        parts: List[str] = []
+        current = ""
+        for segment in segments:
+            text = "\n".join(segment)
+            if len(text) > self.max_chars:
+                if current:
+                    parts.append(current)
+                    current = ""
+                parts.extend(self._split_by_size(text))
+            elif current and len(current) + 1 + len(text) > self.max_chars:
+                parts.append(current)
+                current = text
+            else:
+                current = f"{current}\n{text}" if current else text
+        if current:
+            parts.append(current)
+        return parts
+
+    def _split_by_size(self, text: str) -> List[str]:
+        # Último recurso para segmentos sem estrutura interna (sem sobreposição)
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        splitter = RecursiveCharacterTextSplitter(chunk_size=self.max_chars, chunk_overlap=0)
+        return splitter.split_text(text)
+
+    # --- Chunks --- #
+
+    def _metadata(self, labels: List[Optional[str]], hierarchy: Dict[str, str], part: int, parts: int) -> dict:
+        # Texto antes da primeira fronteira (preâmbulo) não tem rótulo
+        labels = [label for label in labels if label]
+        metadata = {self.unit_name: (labels[0] if len(labels) == 1 else labels) or None}
+        if self.track_hierarchy:
+            metadata["hierarchy"] = hierarchy
+        if parts > 1:
+            metadata["part"] = part
+            metadata["parts"] = parts
+        return metadata
+
+    def _iter_raw_chunks(self, texts: Iterable[str]) -> Iterator[Chunk]:
+        pending_text = ""
+        pending_labels: List[str] = []
+        pending_hierarchy: Dict[str, str] = {}
+
+        for unit in self._iter_units(texts):
+            text = "\n".join(unit.lines).strip()
+            if len(text) > self.max_chars:
+                if pending_text:
+                    yield Chunk(pending_text, self._metadata(pending_labels, pending_hierarchy, 0, 1))
+                    pending_text, pending_labels = "", []
+                parts = self._split_oversized(unit.lines)
+                for part, content in enumerate(parts):
+                    yield Chunk(content.strip(), self._metadata([unit.label], unit.hierarchy, part, len(parts)))
+                continue
+
+            # Unidades pequenas são agrupadas enquanto estiverem na mesma seção
+            can_merge = (
+                pending_text
+                and len(pending_text) < self.min_chars
+                and unit.hierarchy == pending_hierarchy
+                and len(pending_text) + 2 + len(text) <= self.max_chars
+            )
+            if can_merge:
+                pending_text = f"{pending_text}\n\n{text}"
+                pending_labels.append(unit.label)
+                continue
+
+            if pending_text:
+                yield Chunk(pending_text, self._metadata(pending_labels, pending_hierarchy, 0, 1))
+            pending_text, pending_labels, pending_hierarchy = text, [unit.label], unit.hierarchy
+
+        if pending_text:
+            yield Chunk(pending_text, self._metadata(pending_labels, pending_hierarchy, 0, 1))
+
+    def iter_chunks(self, texts: Iterable[str]) -> Iterator[Chunk]:
+        """Divide os textos (ex.: páginas, em ordem) em chunks, à medida que chegam."""
+        tracker = ArticleTracker() if self.track_articles else None
+        for chunk in self._iter_raw_chunks(texts):
+            if tracker:
+                chunk.metadata["articles"] = tracker.extract(chunk.content)
+            yield chunk
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk.content for chunk in self.iter_chunks([text])]
+
+    def create_documents(self, text: str) -> List[Document]:
+        return [Document(page_content=chunk.content, metadata=chunk.metadata) for chunk in self.iter_chunks([text])]
+
+
+# Instâncias globais: códigos/leis (por artigo) e contratos (por cláusula)
+statute_chunker = StructuredChunker(
+    unit_name="article",
+    is_boundary=is_article_heading,
+    is_split_point=is_subdivision,
+    max_chars=settings.STATUTE_CHUNK_MAX_CHARS,
+    min_chars=settings.STATUTE_CHUNK_MIN_CHARS,
+    label_of=article_heading_id,
+    track_hierarchy=True,
+    track_articles=True,
+)
+
+contract_chunker = StructuredChunker(
+    unit_name="clause",
+    is_boundary=lambda line: bool(_CLAUSE_PATTERN.match(line)),
+    is_split_point=lambda line: bool(_SUBCLAUSE_PATTERN.match(line)),
+    max_chars=settings.CONTRACT_CHUNK_MAX_CHARS,
+    min_chars=settings.CONTRACT_CHUNK_MIN_CHARS,
+)
@@ -0,0 +1,161 @@
+# app/services/embedding_cache.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.logger_config import logger
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str, casefold: bool = False) -> str:
+    """Normaliza o texto para uso como chave (NFC, espaços colapsados e, opcionalmente, caixa)."""
+    normalized = unicodedata.normalize("NFC", text or "")
+    normalized = _WHITESPACE_RE.sub(" ", normalized).strip()
+    return normalized.casefold() if casefold else normalized
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings com LRU + TTL em memória e uma camada opcional em disco
+    (SQLite) que sobrevive a reinicializações do processo.
+
+    As chaves são derivadas do nome do modelo, do tipo de embedding (query ou
+    documento, que usam task types diferentes na API do Google) e do texto
+    normalizado. É thread-safe, pois o serviço de embedding também é chamado a
+    partir de threads do executor.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 86400, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._disk: Optional[sqlite3.Connection] = None
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, disk_path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, created_at REAL, vector BLOB)"
+            )
+            self._disk.commit()
+            logger.info(f"Cache de embeddings em disco ativo: {disk_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Não foi possível abrir o cache de embeddings em disco ({disk_path}): {e}")
+            self._disk = None
+
+    @staticmethod
+    def make_key(model_name: str, kind: str, text: str) -> str:
+        """Gera a chave do cache para um texto já normalizado."""
+        return hashlib.sha256(f"{model_name}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def _store_in_memory(self, key: str, created_at: float, vector: List[float]) -> None:
+        self._entries[key] = (created_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_from_disk(self, key: str, now: float) -> Optional[Tuple[float, List[float]]]:
+        row = self._disk.execute(
+            "SELECT created_at, vector FROM embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        created_at, blob = row
+        if self._is_expired(created_at, now):
+            self._disk.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+            self._disk.commit()
+            return None
+        return created_at, array("f", blob).tolist()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """Retorna o embedding armazenado ou None (contabilizando acerto/erro)."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Busca várias chaves de uma vez; chaves ausentes não aparecem no resultado."""
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self._is_expired(entry[0], now):
+                    del self._entries[key]
+                    entry = None
+
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found[key] = entry[1]
+                    continue
+
+                if self._disk is not None:
+                    disk_entry = self._get_from_disk(key, now)
+                    if disk_entry is not None:
+                        self.disk_hits += 1
+                        self._store_in_memory(key, *disk_entry)
+                        found[key] = disk_entry[1]
+                        continue
+
+                self.misses += 1
+        return found
+
+    def set(self, key: str, vector: List[float]) -> None:
+        """Armazena um embedding."""
+        self.set_many({key: vector})
+
+    def set_many(self, items: Dict[str, List[float]]) -> None:
+        """Armazena vários embeddings (uma única transação na camada em disco)."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            for key, vector in items.items():
+                self._store_in_memory(key, now, list(vector))
+            if self._disk is not None:
+                self._disk.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, created_at, vector) VALUES (?, ?, ?)",
+                    [(key, now, array("f", vector).tobytes()) for key, vector in items.items()]
+                )
+                self._disk.commit()
+
+    def clear(self) -> None:
+        """Esvazia as camadas em memória e em disco."""
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM embeddings")
+                self._disk.commit()
+
+    def get_stats(self) -> dict:
+        """Contadores de acerto/erro e ocupação do cache."""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_enabled": self._disk is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
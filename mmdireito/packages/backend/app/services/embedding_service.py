@@ -1,38 +1,117 @@
-import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import asyncio
+from typing import List
+
+from langchain_core.embeddings import Embeddings
 from app.logger_config import logger
 from app.config import settings
+from app.services.embedding_cache import EmbeddingCache, normalize_text
+from app.services.deadlines import EMBEDDING_STAGE, hedged, run_stage
+from app.services.single_flight import embedding_flight
+
+class EmbeddingService(Embeddings):
+    """
+    Serviço para encapsular a geração de embeddings com a API do Google.
+
+    As chamadas passam por um cache (memória + disco opcional) chaveado pelo modelo
+    e pelo texto normalizado, evitando uma ida à API para perguntas repetidas.
+    Perguntas idênticas simultâneas compartilham uma única chamada à API.
+    """
 
-class EmbeddingService:
-    """Serviço para encapsular a geração de embeddings com a API do Google."""
-    
-    def __init__(self, model_name: str = "models/embedding-001"):
+    def __init__(self, model_name: str = "models/embedding-001", cache: EmbeddingCache = None):
         """Inicializa o serviço com o modelo de embedding do Google."""
         if not settings.GOOGLE_API_KEY:
             logger.error("A variável de ambiente GOOGLE_API_KEY não está configurada.")
             raise ValueError("GOOGLE_API_KEY não encontrada.")
-        
-        try:
-            self.embeddings_model = GoogleGenerativeAIEmbeddings(
-                model=model_name,
-                google_api_key=settings.GOOGLE_API_KEY
-            )
-            logger.info(f"Modelo de embedding do Google '{model_name}' configurado com sucesso.")
-        except Exception as e:
-            logger.error(f"Erro ao configurar o modelo de embedding do Google: {e}")
-            raise
+
+        self.model_name = model_name
+        self.cache = cache or EmbeddingCache(
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+            disk_path=settings.EMBEDDING_CACHE_DISK_PATH or None
+        )
+
+        # O cliente do Google é criado no primeiro embedding não encontrado no cache
+        self._embeddings_model = None
+
+    @property
+    def embeddings_model(self):
+        if self._embeddings_model is None:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+            try:
+                self._embeddings_model = GoogleGenerativeAIEmbeddings(
+                    model=self.model_name,
+                    google_api_key=settings.GOOGLE_API_KEY
+                )
+                logger.info(f"Modelo de embedding do Google '{self.model_name}' configurado com sucesso.")
+            except Exception as e:
+                logger.error(f"Erro ao configurar o modelo de embedding do Google: {e}")
+                raise
+        return self._embeddings_model
 
     def get_embeddings(self):
         """Retorna a instância do modelo de embedding."""
         return self.embeddings_model
-    
-    def embed_query(self, text: str):
-        """Gera embedding para uma query de texto."""
-        return self.embeddings_model.embed_query(text)
-    
-    def embed_documents(self, texts: list):
-        """Gera embeddings para uma lista de documentos."""
-        return self.embeddings_model.embed_documents(texts)
+
+    def _query_key(self, text: str) -> str:
+        # Perguntas diferem só em caixa/espaços com frequência; normaliza de forma mais agressiva
+        return self.cache.make_key(self.model_name, "query", normalize_text(text, casefold=True))
+
+    def _document_key(self, text: str) -> str:
+        return self.cache.make_key(self.model_name, "document", normalize_text(text))
+
+    def embed_query(self, text: str) -> List[float]:
+        """Gera embedding para uma query de texto (com cache)."""
+        key = self._query_key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        return embedding_flight.do_sync(key, lambda: self._fetch_query(key, text))
+
+    def _fetch_query(self, key: str, text: str) -> List[float]:
+        vector = self.embeddings_model.embed_query(text)
+        self.cache.set(key, vector)
+        return vector
+
+    def embed_documents(self, texts: list) -> List[List[float]]:
+        """Gera embeddings para uma lista de documentos, consultando a API só para os ausentes do cache."""
+        keys = [self._document_key(text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # Textos ausentes (sem repetição) vão em uma única chamada à API
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.embeddings_model.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self.cache.set_many(new_items)
+            found.update(new_items)
+
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Versão assíncrona de `embed_query`; só a chamada à API sai do event loop."""
+        key = self._query_key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        # O limite de tempo vale para quem espera; a chamada compartilhada (e a
+        # tentativa paralela disparada na cauda de latência) segue para os demais
+        return await run_stage(EMBEDDING_STAGE, lambda: embedding_flight.do(
+            key, lambda: hedged(EMBEDDING_STAGE, lambda: asyncio.to_thread(self._fetch_query, key, text))
+        ))
+
+    async def aembed_documents(self, texts: list) -> List[List[float]]:
+        """Versão assíncrona de `embed_documents`, executada fora do event loop."""
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    def get_cache_stats(self) -> dict:
+        """Estatísticas do cache de embeddings."""
+        return {"model": self.model_name, **self.cache.get_stats()}
 
 # Instância global do serviço para ser usada em toda a aplicação
 embedding_service = EmbeddingService()
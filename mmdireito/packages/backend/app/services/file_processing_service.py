@@ -1,9 +1,9 @@
 from fastapi import UploadFile
-import pypdf
-import docx
+from typing import List
 import io
 
 from app.logger_config import logger
+from app.services.pdf_extraction_service import ExtractedPage, extract_pdf_pages
 
 # Define os tipos de MIME permitidos e o tamanho máximo do arquivo (em bytes)
 ALLOWED_MIME_TYPES = {
@@ -12,19 +12,12 @@ ALLOWED_MIME_TYPES = {
 }
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
 
-def extract_text_from_file(file: UploadFile) -> str:
+def validate_upload(file: UploadFile) -> None:
     """
-    Extrai o texto de um arquivo PDF ou DOCX enviado.
-
-    Args:
-        file: O arquivo enviado via FastAPI.
-
-    Returns:
-        O texto extraído do arquivo.
+    Valida tamanho e tipo de um arquivo enviado, sem ler o seu conteúdo.
 
     Raises:
         ValueError: Se o tipo de arquivo ou o tamanho for inválido.
-        Exception: Para outros erros de extração.
     """
     # 1. Validação de tamanho
     if file.size > MAX_FILE_SIZE:
@@ -36,21 +29,71 @@ def extract_text_from_file(file: UploadFile) -> str:
         logger.warning(f"Tentativa de upload de tipo de arquivo inválido: {file.filename}, {file.content_type}")
         raise ValueError(f"Tipo de arquivo não suportado. Apenas PDF e DOCX são permitidos.")
 
-    logger.info(f"Iniciando extração de texto para o arquivo: {file.filename}")
+def extract_pages_from_bytes(content: bytes, content_type: str, filename: str) -> List[ExtractedPage]:
+    """
+    Extrai o texto de um PDF ou DOCX já lido em memória, página a página.
+
+    Args:
+        content: Conteúdo binário do arquivo.
+        content_type: Tipo MIME (já validado por `validate_upload`).
+        filename: Nome do arquivo, usado apenas nos logs.
+
+    Returns:
+        As páginas em ordem, com o número da página. Um DOCX não tem paginação
+        fixa e é retornado como uma única página.
+
+    Raises:
+        Exception: Para erros de extração.
+    """
+    logger.info(f"Iniciando extração de texto para o arquivo: {filename}")
 
     try:
-        content = file.file.read()
-        file.file.seek(0) # Retorna o ponteiro para o início do arquivo
+        if content_type == "application/pdf":
+            pages = extract_pdf_pages(content)
+        elif content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+            import docx  # importado sob demanda: só o processamento de uploads precisa dele
 
-        if file.content_type == "application/pdf":
-            pdf_reader = pypdf.PdfReader(io.BytesIO(content))
-            text = "\n".join(page.extract_text() for page in pdf_reader.pages)
-        elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
             doc = docx.Document(io.BytesIO(content))
-            text = "\n".join(para.text for para in doc.paragraphs)
+            pages = [ExtractedPage(1, "\n".join(para.text for para in doc.paragraphs))]
         
-        logger.info(f"Texto extraído com sucesso do arquivo: {file.filename}")
-        return text
+        logger.info(f"Texto extraído com sucesso do arquivo: {filename} ({len(pages)} páginas)")
+        return pages
     except Exception as e:
-        logger.error(f"Falha ao extrair texto do arquivo {file.filename}: {e}")
+        logger.error(f"Falha ao extrair texto do arquivo {filename}: {e}")
         raise Exception("Ocorreu um erro ao processar o arquivo. Ele pode estar corrompido.")
+
+def extract_pages_from_file(file: UploadFile) -> List[ExtractedPage]:
+    """
+    Valida e extrai o texto de um arquivo PDF ou DOCX enviado, página a página.
+
+    Args:
+        file: O arquivo enviado via FastAPI.
+
+    Returns:
+        As páginas em ordem, com o número da página.
+
+    Raises:
+        ValueError: Se o tipo de arquivo ou o tamanho for inválido.
+        Exception: Para outros erros de extração.
+    """
+    validate_upload(file)
+
+    content = file.file.read()
+    file.file.seek(0) # Retorna o ponteiro para o início do arquivo
+    return extract_pages_from_bytes(content, file.content_type, file.filename)
+
+def extract_text_from_file(file: UploadFile) -> str:
+    """
+    Extrai o texto de um arquivo PDF ou DOCX enviado.
+
+    Args:
+        file: O arquivo enviado via FastAPI.
+
+    Returns:
+        O texto extraído do arquivo, com as páginas separadas por quebra de linha.
+
+    Raises:
+        ValueError: Se o tipo de arquivo ou o tamanho for inválido.
+        Exception: Para outros erros de extração.
+    """
+    return "\n".join(page.text for page in extract_pages_from_file(file))
@@ -0,0 +1,174 @@
+# app/services/history_manager.py
+"""
+Histórico de chat com orçamento de tokens e resumo incremental.
+
+O `RunnableWithMessageHistory` envia todo o `chat_history` a cada turno. Aqui o
+histórico entregue à cadeia é uma visão limitada: um resumo dos turnos antigos
+seguido dos últimos turnos na íntegra, cortados para caber no orçamento de
+tokens do agente. Quando a sessão acumula turnos além dos mantidos na íntegra,
+os mais antigos são incorporados ao resumo em segundo plano e removidos da
+sessão, então nem o prompt nem a memória crescem com o tamanho da conversa.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+
+from app.config import settings
+from app.logger_config import logger
+from app.prompts import history_summary_prompt
+from app.services.session_store import Session, SessionStore, session_store
+from app.services.token_usage import token_usage_callback
+
+SUMMARY_KEY = "history_summary"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa simples de tokens (~4 caracteres por token)."""
+    return len(text) // 4 + 1
+
+
+def _message_tokens(message: BaseMessage) -> int:
+    content = message.content
+    return estimate_tokens(content if isinstance(content, str) else str(content))
+
+
+def parse_budgets(spec: str) -> Dict[str, int]:
+    """Converte 'civil:3000,contract:2000' em {'civil': 3000, 'contract': 2000}."""
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        agent, _, value = item.partition(":")
+        budgets[agent.strip()] = int(value)
+    return budgets
+
+
+class BudgetedChatHistory(BaseChatMessageHistory):
+    """Visão do histórico da sessão limitada pelo orçamento de tokens."""
+
+    def __init__(self, manager: "HistoryManager", agent: str, session: Session):
+        self.manager = manager
+        self.agent = agent
+        self.session = session
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self.manager.build_view(self.agent, self.session)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.session.history.add_messages(messages)
+        self.manager.schedule_summary(self.agent, self.session)
+
+    def clear(self) -> None:
+        self.session.history.clear()
+        self.session.metadata.pop(SUMMARY_KEY, None)
+
+
+class HistoryManager:
+    """Monta as visões limitadas do histórico e mantém os resumos das sessões."""
+
+    def __init__(
+        self,
+        store: SessionStore = session_store,
+        default_budget: int = settings.HISTORY_MAX_TOKENS,
+        budgets: Dict[str, int] = None,
+        keep_turns: int = settings.HISTORY_KEEP_TURNS,
+        summary_model: str = settings.HISTORY_SUMMARY_MODEL,
+    ):
+        self.store = store
+        self.default_budget = default_budget
+        self.budgets = budgets if budgets is not None else parse_budgets(settings.HISTORY_AGENT_BUDGETS)
+        self.keep_turns = keep_turns
+        self.summary_model = summary_model
+        self._llm = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            self._llm = ChatGoogleGenerativeAI(
+                model=self.summary_model,
+                google_api_key=settings.GOOGLE_API_KEY,
+                temperature=0,
+                callbacks=[token_usage_callback]
+            )
+        return self._llm
+
+    def budget_for(self, agent: str) -> int:
+        return self.budgets.get(agent, self.default_budget)
+
+    def get_history(self, agent: str, session_id: str) -> BudgetedChatHistory:
+        """Histórico a ser entregue ao `RunnableWithMessageHistory`."""
+        return BudgetedChatHistory(self, agent, self.store.get(agent, session_id))
+
+    def build_view(self, agent: str, session: Session) -> List[BaseMessage]:
+        """Resumo + turnos mais recentes, do mais novo para o mais antigo, dentro do orçamento."""
+        budget = self.budget_for(agent)
+        view: List[BaseMessage] = []
+
+        summary = session.metadata.get(SUMMARY_KEY)
+        if summary:
+            summary_message = SystemMessage(content=f"Resumo da conversa anterior:\n{summary}")
+            budget -= _message_tokens(summary_message)
+            view.append(summary_message)
+
+        recent: List[BaseMessage] = []
+        for message in reversed(session.history.messages):
+            cost = _message_tokens(message)
+            if cost > budget:
+                break
+            budget -= cost
+            recent.append(message)
+
+        view.extend(reversed(recent))
+        return view
+
+    def schedule_summary(self, agent: str, session: Session) -> None:
+        """Agenda a incorporação dos turnos antigos ao resumo, fora do caminho da requisição."""
+        # Dobra em lotes (ao ultrapassar o dobro dos turnos mantidos) para não resumir a cada turno
+        if len(session.history.messages) <= self.keep_turns * 2 * 2:
+            return
+        with self._lock:
+            if id(session) in self._pending:
+                return
+            self._pending.add(id(session))
+        self._executor.submit(self._summarize, agent, session)
+
+    def _summarize(self, agent: str, session: Session) -> None:
+        try:
+            messages = list(session.history.messages)
+            fold_count = len(messages) - self.keep_turns * 2
+            if fold_count <= 0:
+                return
+
+            chain = history_summary_prompt | self.llm | StrOutputParser()
+            summary = chain.invoke({
+                "summary": session.metadata.get(SUMMARY_KEY) or "(vazio)",
+                "messages": messages[:fold_count],
+            })
+
+            # Remove apenas as mensagens resumidas; turnos novos ficam no fim da lista
+            session.metadata[SUMMARY_KEY] = summary.strip()
+            session.history.messages = session.history.messages[fold_count:]
+            logger.bind(
+                context={"folded_messages": fold_count, "summary_chars": len(summary)}
+            ).info(f"Histórico de {agent} resumido")
+        except Exception as e:
+            # Sem resumo, a visão continua limitada pelo orçamento; tenta de novo no próximo turno
+            logger.warning(f"Falha ao resumir o histórico de {agent}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(id(session))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Instância global do gerenciador
+history_manager = HistoryManager()
@@ -1,26 +1,100 @@
-import pypdf
-from typing import List, Dict, Any
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from supabase.client import Client, create_client
+import hashlib
+import random
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from supabase.client import Client
 
 from app.config import settings
 from app.logger_config import logger
+from app.services.article_index import ArticleTracker
+from app.services.document_chunker import Chunk, StructuredChunker, statute_chunker
 from app.services.embedding_service import embedding_service
+from app.services.pdf_extraction_service import ExtractedPage, iter_pdf_pages
+from app.services.knowledge_base_version import KnowledgeBaseVersions, knowledge_base_versions
+from app.services.schema_service import ARTICLES_SCHEMA_MIGRATION, KNOWLEDGE_BASE_VERSIONS_MIGRATION, Migration, SchemaService
+from app.services.supabase_service import SupabaseService, supabase_service
+
+VALID_LEGAL_AREAS = ['civil', 'penal', 'processual_penal', 'trabalhista', 'tributario', 'empresarial', 'constitucional']
+
+# Coluna de hash por chunk (e backfill das linhas antigas) usada na reindexação incremental
+CONTENT_HASH_SCHEMA_SQL = """
+ALTER TABLE dir_knowledge_base_chunks ADD COLUMN IF NOT EXISTS content_hash text;
+UPDATE dir_knowledge_base_chunks
+  SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+  WHERE content_hash IS NULL;
+CREATE INDEX IF NOT EXISTS dir_knowledge_base_chunks_document_hash_idx
+  ON dir_knowledge_base_chunks (document_id, content_hash);
+"""
+
+# Tamanho da página ao ler chunks existentes (limite padrão do PostgREST)
+STORED_CHUNKS_PAGE_SIZE = 1000
+
+# Chunk no pipeline: (índice, conteúdo, hash, identificadores de artigos)
+ChunkItem = Tuple[int, str, str, List[str]]
+
+# Chunk já gravado: (id, chunk_index)
+StoredChunk = Tuple[int, int]
+
+
+def content_hash(content: str) -> str:
+    """Hash SHA-256 do conteúdo do chunk (mesmo cálculo do backfill em SQL)."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
 class KnowledgeBaseService:
-    """Serviço para gerenciar a base de conhecimento no Supabase."""
+    """
+    Serviço para gerenciar a base de conhecimento no Supabase.
 
-    def __init__(self):
-        self.supabase_client: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+    A indexação é um pipeline em streaming: as páginas do PDF alimentam o chunker
+    estrutural (um chunk por artigo) conforme são extraídas, os chunks são embedados em lotes (com concorrência
+    limitada e retry com backoff) e gravados em ordem, lote a lote.
+
+    Cada chunk carrega um hash do conteúdo. Ao reindexar um documento já existente
+    (mesmo título e área), só os chunks novos ou alterados são embedados e gravados,
+    e os que deixaram de existir são removidos ao final. O mesmo mecanismo serve de
+    checkpoint: uma execução interrompida é retomada sem reprocessar o que já foi salvo.
+    """
+
+    def __init__(
+        self,
+        supabase: SupabaseService = supabase_service,
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+        concurrency: int = settings.INGEST_EMBED_CONCURRENCY,
+        max_retries: int = settings.INGEST_MAX_RETRIES,
+        retry_backoff: float = settings.INGEST_RETRY_BACKOFF_SECONDS,
+        chunker: StructuredChunker = statute_chunker,
+        versions: KnowledgeBaseVersions = knowledge_base_versions,
+    ):
+        self.supabase = supabase
+        self.schema = SchemaService(supabase)
         self.embedding_service = embedding_service
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.chunker = chunker
+        self.versions = versions
+        self._schema_ready = False
+        self._unchanged_count = 0
+        self._moved_chunks: List[StoredChunk] = []
+
+    @property
+    def supabase_client(self) -> Client:
+        """Cliente síncrono do pool compartilhado (criado sob demanda)."""
+        return self.supabase.client
+
+    # --- Extração e divisão --- #
+
+    def _iter_pdf_pages(self, pdf_path: str) -> Iterator[ExtractedPage]:
+        """Extrai o texto do PDF página a página (em paralelo para PDFs grandes), em ordem."""
+        logger.info(f"Extraindo texto de: {pdf_path}")
+        return iter_pdf_pages(pdf_path)
 
     def _extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extrai texto de um arquivo PDF."""
-        logger.info(f"Extraindo texto de: {pdf_path}")
         try:
-            with open(pdf_path, 'rb') as f:
-                pdf_reader = pypdf.PdfReader(f)
-                text = "\n".join(page.extract_text() for page in pdf_reader.pages)
+            text = "\n".join(page_text for _, page_text in self._iter_pdf_pages(pdf_path))
             logger.success(f"Texto extraído com sucesso ({len(text)} caracteres).")
             return text
         except Exception as e:
@@ -28,77 +102,316 @@ class KnowledgeBaseService:
             raise
 
     def _split_text_into_chunks(self, text: str) -> List[str]:
-        """Divide o texto em chunks."""
+        """Divide o texto em chunks (um por artigo)."""
         logger.info("Dividindo texto em chunks...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
-        chunks = text_splitter.split_text(text)
+        chunks = self.chunker.split_text(text)
         logger.success(f"Texto dividido em {len(chunks)} chunks.")
         return chunks
 
-    def process_and_save_pdf(self, pdf_path: str, document_title: str, legal_area: str = 'civil') -> None:
-        """Orquestra o processo completo de indexação de um PDF."""
+    def _iter_chunks(self, pages: Iterable[ExtractedPage]) -> Iterator[Chunk]:
+        """
+        Divide o texto em chunks à medida que as páginas chegam.
+
+        Apenas o artigo em andamento fica retido até o próximo começar, então a
+        memória usada não depende do tamanho do PDF.
+        """
+        return self.chunker.iter_chunks(page_text for _, page_text in pages)
+
+    def _iter_batches(self, chunks: Iterable[ChunkItem]) -> Iterator[List[ChunkItem]]:
+        """Agrupa os chunks (índice, conteúdo, hash, artigos) em lotes de `batch_size`."""
+        batch: List[ChunkItem] = []
+        for item in chunks:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _iter_changed_chunks(self, chunks: Iterable[Chunk], stored: Dict[str, List[StoredChunk]]) -> Iterator[ChunkItem]:
+        """
+        Filtra os chunks que já estão gravados com o mesmo conteúdo.
+
+        `stored` mapeia hash -> (id, chunk_index) existentes; cada chunk reaproveitado
+        consome um id, e o que sobrar ao final corresponde a chunks removidos do
+        documento. Reaproveitados que mudaram de posição entram em `_moved_chunks`.
+        """
+        for index, (chunk, metadata) in enumerate(chunks):
+            chunk_hash = content_hash(chunk)
+            stored_chunks = stored.get(chunk_hash)
+            if stored_chunks:
+                chunk_id, stored_index = stored_chunks.pop()
+                if not stored_chunks:
+                    del stored[chunk_hash]
+                if stored_index != index:
+                    self._moved_chunks.append((chunk_id, index))
+                self._unchanged_count += 1
+                continue
+            yield index, chunk, chunk_hash, metadata.get("articles", [])
+
+    # --- Embedding e gravação --- #
+
+    def _with_retry(self, operation: Callable, description: str):
+        """Executa `operation` com retry e backoff exponencial com jitter."""
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                return operation()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** (attempt - 1)) * (1 + random.random() / 2)
+                logger.warning(
+                    f"Falha em {description} (tentativa {attempt}/{self.max_retries}): {e}. "
+                    f"Nova tentativa em {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def _embed_batch(self, batch: List[ChunkItem]) -> List[List[float]]:
+        return self._with_retry(
+            lambda: self.embedding_service.embed_documents([chunk for _, chunk, _, _ in batch]),
+            f"embedding de {len(batch)} chunks a partir do índice {batch[0][0]}"
+        )
+
+    def _insert_batch(self, document_id: int, batch: List[ChunkItem], embeddings: List[List[float]]) -> None:
+        chunk_records = [
+            {
+                'document_id': document_id,
+                'content': chunk,
+                'content_hash': chunk_hash,
+                'embedding': embedding,
+                'chunk_index': index,
+                'articles': articles
+            }
+            for (index, chunk, chunk_hash, articles), embedding in zip(batch, embeddings)
+        ]
+        self._with_retry(
+            lambda: self.supabase_client.table('dir_knowledge_base_chunks').insert(chunk_records).execute(),
+            f"gravação de {len(batch)} chunks a partir do índice {batch[0][0]}"
+        )
+
+    def _ensure_schema(self) -> None:
+        """Garante as colunas `content_hash` e `articles` (pelo registro de migrações; uma vez por processo)."""
+        if self._schema_ready:
+            return
+        result = self.schema.apply([
+            Migration("knowledge_base_content_hash", CONTENT_HASH_SCHEMA_SQL),
+            ARTICLES_SCHEMA_MIGRATION,
+            KNOWLEDGE_BASE_VERSIONS_MIGRATION,
+        ])
+        if result["failed"]:
+            logger.warning(f"Não foi possível garantir as colunas da base de conhecimento: {result['failed']}")
+        else:
+            self._schema_ready = True
+
+    def _find_document(self, document_title: str, legal_area: str) -> Optional[int]:
+        """Retorna o id do documento mais recente com o mesmo título e área, se houver."""
+        response = self.supabase_client.table('dir_knowledge_base') \
+            .select('id') \
+            .eq('title', document_title) \
+            .eq('legal_area', legal_area) \
+            .order('id', desc=True) \
+            .limit(1) \
+            .execute()
+        return response.data[0]['id'] if response.data else None
+
+    def _load_stored_hashes(self, document_id: int) -> Dict[str, List[StoredChunk]]:
+        """Carrega hash -> (id, chunk_index) dos chunks já gravados para o documento (paginado)."""
+        stored: Dict[str, List[StoredChunk]] = {}
+        offset = 0
+        while True:
+            response = self.supabase_client.table('dir_knowledge_base_chunks') \
+                .select('id, content_hash, chunk_index') \
+                .eq('document_id', document_id) \
+                .order('id') \
+                .range(offset, offset + STORED_CHUNKS_PAGE_SIZE - 1) \
+                .execute()
+            rows = response.data or []
+            for row in rows:
+                stored.setdefault(row.get('content_hash') or '', []).append((row['id'], row.get('chunk_index')))
+            if len(rows) < STORED_CHUNKS_PAGE_SIZE:
+                return stored
+            offset += STORED_CHUNKS_PAGE_SIZE
+
+    def _delete_chunks(self, chunk_ids: List[int]) -> None:
+        """Remove chunks em lotes de `batch_size`."""
+        for start in range(0, len(chunk_ids), self.batch_size):
+            ids = chunk_ids[start:start + self.batch_size]
+            self._with_retry(
+                lambda: self.supabase_client.table('dir_knowledge_base_chunks').delete().in_('id', ids).execute(),
+                f"remoção de {len(ids)} chunks obsoletos"
+            )
+
+    def _renumber_chunks(self, moved: List[StoredChunk]) -> None:
+        """
+        Atualiza o `chunk_index` dos chunks reaproveitados que mudaram de posição,
+        em lotes de `batch_size` (um UPDATE por lote), para que a ordem do documento
+        continue valendo para quem lê os chunks em sequência.
+        """
+        for start in range(0, len(moved), self.batch_size):
+            batch = moved[start:start + self.batch_size]
+            values = ", ".join(f"({int(chunk_id)}, {int(index)})" for chunk_id, index in batch)
+            query = (
+                "UPDATE dir_knowledge_base_chunks AS chunks SET chunk_index = moved.chunk_index "
+                f"FROM (VALUES {values}) AS moved(id, chunk_index) WHERE chunks.id = moved.id"
+            )
+            self._with_retry(
+                lambda: self.supabase_client.rpc("exec_sql", {"query": query}).execute(),
+                f"renumeração de {len(batch)} chunks"
+            )
+
+    def _create_document(self, document_title: str, legal_area: str) -> int:
+        # total_chunks = 0 marca a indexação como em andamento até o final do pipeline
+        doc_response = self.supabase_client.table('dir_knowledge_base').insert({
+            'title': document_title,
+            'total_chunks': 0,
+            'legal_area': legal_area
+        }).execute()
+
+        if not doc_response.data:
+            raise Exception("Falha ao criar o registro do documento principal no Supabase.")
+        return doc_response.data[0]['id']
+
+    def process_and_save_pdf(self, pdf_path: str, document_title: str, legal_area: str = 'civil', incremental: bool = True) -> None:
+        """
+        Orquestra o processo completo de indexação de um PDF.
+
+        Com `incremental=True`, reaproveita o documento de mesmo título e área e grava
+        apenas a diferença; com `False`, cria sempre um documento novo.
+        """
         # Validar área jurídica
-        valid_areas = ['civil', 'penal', 'processual_penal', 'trabalhista', 'tributario', 'empresarial', 'constitucional']
-        if legal_area not in valid_areas:
-            logger.error(f"Área jurídica inválida: {legal_area}. Áreas válidas: {valid_areas}")
-            raise ValueError(f"Área jurídica '{legal_area}' não é válida. Use uma das seguintes: {', '.join(valid_areas)}")
-        
+        if legal_area not in VALID_LEGAL_AREAS:
+            logger.error(f"Área jurídica inválida: {legal_area}. Áreas válidas: {VALID_LEGAL_AREAS}")
+            raise ValueError(f"Área jurídica '{legal_area}' não é válida. Use uma das seguintes: {', '.join(VALID_LEGAL_AREAS)}")
+
         logger.info(f"Iniciando indexação do documento '{document_title}' na área jurídica: {legal_area}")
-        
-        # 1. Extrair e dividir o texto
-        text = self._extract_text_from_pdf(pdf_path)
-        chunks = self._split_text_into_chunks(text)
+        self._ensure_schema()
 
-        # 2. Criar o documento principal
-        logger.info("Criando registro do documento principal...")
+        # 1. Obter o documento existente (e seus hashes) ou criar um novo
         try:
-            doc_response = self.supabase_client.table('dir_knowledge_base').insert({
-                'title': document_title,
-                'total_chunks': len(chunks),
-                'legal_area': legal_area
-            }).execute()
-
-            if not doc_response.data:
-                raise Exception("Falha ao criar o registro do documento principal no Supabase.")
-            
-            document_id = doc_response.data[0]['id']
-            logger.success(f"Documento principal criado com ID: {document_id}")
-
+            document_id = self._find_document(document_title, legal_area) if incremental else None
+            if document_id:
+                stored = self._load_stored_hashes(document_id)
+                stored_count = sum(len(chunks) for chunks in stored.values())
+                logger.info(f"Reindexando documento {document_id} de forma incremental ({stored_count} chunks já gravados)")
+            else:
+                logger.info("Criando registro do documento principal...")
+                document_id, stored = self._create_document(document_title, legal_area), {}
+                logger.success(f"Documento principal criado com ID: {document_id}")
         except Exception as e:
             logger.error(f"Erro ao salvar documento principal: {e}")
             return
 
-        # 3. Gerar embeddings e salvar os chunks
-        logger.info("Gerando embeddings e salvando chunks...")
+        # 2. Pipeline: páginas -> chunks -> apenas os alterados -> lotes embedados em paralelo -> gravação
+        logger.info(
+            f"Gerando embeddings e salvando chunks (lotes de {self.batch_size}, "
+            f"{self.concurrency} lotes em paralelo)..."
+        )
+        self._unchanged_count = 0
+        self._moved_chunks = []
+        inserted = 0
+        total_chunks = 0
         try:
-            embeddings_model = self.embedding_service.get_embeddings()
-            embeddings = embeddings_model.embed_documents(chunks)
-
-            chunk_records = []
-            for i, chunk in enumerate(chunks):
-                chunk_records.append({
-                    'document_id': document_id,
-                    'content': chunk,
-                    'embedding': embeddings[i],
-                    'chunk_index': i
-                })
-            
-            # Inserir todos os chunks de uma vez
-            self.supabase_client.table('dir_knowledge_base_chunks').insert(chunk_records).execute()
-            logger.success(f"{len(chunk_records)} chunks salvos com sucesso no Supabase.")
+            def counted_chunks():
+                nonlocal total_chunks
+                for chunk in self._iter_chunks(self._iter_pdf_pages(pdf_path)):
+                    total_chunks += 1
+                    yield chunk
+
+            changed = self._iter_changed_chunks(counted_chunks(), stored)
+            pending: "deque[Tuple[List[ChunkItem], Future]]" = deque()
+
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for batch in self._iter_batches(changed):
+                    pending.append((batch, executor.submit(self._embed_batch, batch)))
+
+                    # Mantém no máximo `concurrency` lotes em voo e grava sempre o mais antigo
+                    if len(pending) >= self.concurrency:
+                        inserted += self._drain_oldest(document_id, pending)
+
+                while pending:
+                    inserted += self._drain_oldest(document_id, pending)
 
         except Exception as e:
-            logger.error(f"Erro ao gerar embeddings ou salvar chunks: {e}")
-            # Limpeza: se a inserção dos chunks falhar, remove o documento principal
-            logger.warning(f"Removendo documento principal (ID: {document_id}) devido a falha na indexação dos chunks.")
-            self.supabase_client.table('dir_knowledge_base').delete().eq('id', document_id).execute()
+            logger.error(
+                f"Erro ao gerar embeddings ou salvar chunks: {e}. "
+                f"{inserted} chunks novos do documento {document_id} foram salvos; "
+                f"execute novamente para retomar a partir deste ponto."
+            )
             return
 
-        logger.info("Processo de indexação concluído.")
+        # 3. Remover chunks que não existem mais, renumerar os que mudaram de posição
+        #    e marcar a indexação como concluída
+        removed_ids = [chunk_id for chunks in stored.values() for chunk_id, _ in chunks]
+        try:
+            self._delete_chunks(removed_ids)
+            self._renumber_chunks(self._moved_chunks)
+            self.supabase_client.table('dir_knowledge_base').update(
+                {'total_chunks': total_chunks}
+            ).eq('id', document_id).execute()
+        except Exception as e:
+            logger.error(f"Erro ao finalizar a indexação do documento {document_id}: {e}")
+            return
+
+        logger.success(
+            f"Indexação concluída: {total_chunks} chunks no documento "
+            f"({self._unchanged_count} inalterados, {len(self._moved_chunks)} renumerados, "
+            f"{inserted} novos/alterados, {len(removed_ids)} removidos)."
+        )
+
+        # Conteúdo mudou: nova versão da área invalida as respostas em cache da API
+        if inserted or removed_ids:
+            try:
+                self.versions.bump(legal_area)
+            except Exception as e:
+                logger.warning(f"Não foi possível atualizar a versão da área '{legal_area}': {e}")
+
+    def backfill_article_index(self, legal_area: str = None) -> int:
+        """
+        Preenche a coluna `articles` dos chunks gravados antes do índice de artigos.
+
+        Percorre cada documento na ordem dos chunks (o artigo corrente passa de um
+        chunk para o outro) e atualiza apenas as linhas cujos identificadores mudaram.
+        """
+        self._ensure_schema()
+        query = self.supabase_client.table('dir_knowledge_base').select('id, title')
+        if legal_area:
+            query = query.eq('legal_area', legal_area)
+        documents = query.execute().data or []
+
+        updated = 0
+        for document in documents:
+            tracker = ArticleTracker()
+            offset = 0
+            while True:
+                rows = self.supabase_client.table('dir_knowledge_base_chunks') \
+                    .select('id, content, articles') \
+                    .eq('document_id', document['id']) \
+                    .order('chunk_index') \
+                    .range(offset, offset + STORED_CHUNKS_PAGE_SIZE - 1) \
+                    .execute().data or []
+                for row in rows:
+                    articles = tracker.extract(row['content'])
+                    if (row.get('articles') or []) != articles:
+                        self._with_retry(
+                            lambda: self.supabase_client.table('dir_knowledge_base_chunks')
+                                .update({'articles': articles}).eq('id', row['id']).execute(),
+                            f"atualização dos artigos do chunk {row['id']}"
+                        )
+                        updated += 1
+                if len(rows) < STORED_CHUNKS_PAGE_SIZE:
+                    break
+                offset += STORED_CHUNKS_PAGE_SIZE
+            logger.info(f"Índice de artigos atualizado para o documento '{document['title']}' ({document['id']})")
+
+        logger.success(f"Backfill do índice de artigos concluído: {updated} chunks atualizados.")
+        return updated
+
+    def _drain_oldest(self, document_id: int, pending: deque) -> int:
+        """Aguarda o lote mais antigo, grava-o e retorna quantos chunks foram salvos."""
+        batch, future = pending.popleft()
+        self._insert_batch(document_id, batch, future.result())
+        logger.info(f"Checkpoint: lote de {len(batch)} chunks salvo até o índice {batch[-1][0]} (documento {document_id})")
+        return len(batch)
 
 # Instância global do serviço
 knowledge_base_service = KnowledgeBaseService()
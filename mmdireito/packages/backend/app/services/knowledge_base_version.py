@@ -0,0 +1,104 @@
+# app/services/knowledge_base_version.py
+"""
+Versão do conteúdo da base de conhecimento, por área jurídica.
+
+A ingestão (que roda em outro processo, via scripts/create_knowledge_base.py)
+grava uma versão nova da área em `dir_knowledge_base_versions` sempre que muda
+algum chunk. A API relê a tabela a cada `KB_VERSION_REFRESH_SECONDS` e avisa os
+interessados (ex.: o cache de respostas) quando a versão de uma área muda.
+"""
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.supabase_service import SupabaseService, supabase_service
+
+VERSIONS_TABLE = "dir_knowledge_base_versions"
+
+
+class KnowledgeBaseVersions:
+    """Versões por área, com releitura periódica e notificação de mudanças."""
+
+    def __init__(self, supabase: SupabaseService = supabase_service, refresh_seconds: float = settings.KB_VERSION_REFRESH_SECONDS):
+        self.supabase = supabase
+        self.refresh_seconds = refresh_seconds
+        self._versions: Dict[str, str] = {}
+        self._loaded_at = 0.0
+        self._listeners: List[Callable[[List[str]], None]] = []
+        self._lock = threading.Lock()
+
+    def on_change(self, listener: Callable[[List[str]], None]) -> None:
+        """Registra um callback chamado com as áreas cuja versão mudou."""
+        self._listeners.append(listener)
+
+    def _apply(self, versions: Dict[str, str]) -> None:
+        with self._lock:
+            changed = [
+                area for area in set(self._versions) | set(versions)
+                if self._versions.get(area) != versions.get(area)
+            ]
+            first_load = not self._loaded_at
+            self._versions = versions
+            self._loaded_at = time.time()
+        if changed and not first_load:
+            logger.info(f"Versão da base de conhecimento alterada: {sorted(changed)}")
+            for listener in self._listeners:
+                listener(changed)
+
+    def _stale(self) -> bool:
+        return time.time() - self._loaded_at > self.refresh_seconds
+
+    def _compose(self, legal_areas: Iterable[str]) -> str:
+        return "|".join(f"{area}:{self._versions.get(area, '0')}" for area in sorted(legal_areas))
+
+    def refresh(self) -> None:
+        try:
+            result = self.supabase.client.table(VERSIONS_TABLE).select("legal_area, version").execute()
+            self._apply({row["legal_area"]: row["version"] for row in result.data or []})
+        except Exception as e:
+            # Sem a tabela (ou sem conexão), mantém as versões conhecidas
+            logger.warning(f"Não foi possível ler as versões da base de conhecimento: {e}")
+            self._loaded_at = time.time()
+
+    async def arefresh(self) -> None:
+        try:
+            client = await self.supabase.get_async_client()
+            result = await client.table(VERSIONS_TABLE).select("legal_area, version").execute()
+            self._apply({row["legal_area"]: row["version"] for row in result.data or []})
+        except Exception as e:
+            logger.warning(f"Não foi possível ler as versões da base de conhecimento: {e}")
+            self._loaded_at = time.time()
+
+    def get(self, legal_areas: Iterable[str]) -> str:
+        """Versão combinada das áreas informadas (muda se qualquer uma mudar)."""
+        legal_areas = list(legal_areas)
+        if legal_areas and self._stale():
+            self.refresh()
+        return self._compose(legal_areas)
+
+    async def aget(self, legal_areas: Iterable[str]) -> str:
+        legal_areas = list(legal_areas)
+        if legal_areas and self._stale():
+            await self.arefresh()
+        return self._compose(legal_areas)
+
+    def bump(self, legal_area: str) -> str:
+        """Grava uma versão nova para a área (chamado pela ingestão ao alterar chunks)."""
+        version = uuid.uuid4().hex[:12]
+        self.supabase.client.table(VERSIONS_TABLE).upsert(
+            {"legal_area": legal_area, "version": version, "updated_at": datetime.now(timezone.utc).isoformat()}
+        ).execute()
+        with self._lock:
+            self._versions = {**self._versions, legal_area: version}
+        logger.info(f"Nova versão da base de conhecimento para '{legal_area}': {version}")
+        for listener in self._listeners:
+            listener([legal_area])
+        return version
+
+
+# Instância global do serviço
+knowledge_base_versions = KnowledgeBaseVersions()
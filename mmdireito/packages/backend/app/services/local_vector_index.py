@@ -0,0 +1,246 @@
+# app/services/local_vector_index.py
+"""
+Índice vetorial local (em processo) para os códigos jurídicos estáticos.
+
+Os chunks e embeddings de cada área são exportados do Supabase para dois
+arquivos em `LOCAL_INDEX_DIR`:
+
+    {area}.npy   matriz float32 (n_chunks x dimensões), com linhas normalizadas
+    {area}.json  metadados: modelo de embedding, ids, conteúdo, artigos e posição
+                 (documento, chunk_index) dos chunks
+
+A matriz é carregada com memory-map, então o boot não copia os vetores para a
+memória, e a busca por similaridade de cosseno (a mesma do operador `<=>` do
+pgvector) é um produto matricial local, sem ida à rede.
+"""
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.logger_config import logger
+
+# Tamanho da página ao exportar chunks do Supabase (limite padrão do PostgREST)
+EXPORT_PAGE_SIZE = 1000
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalVectorIndex:
+    """Vetores de uma área jurídica e a busca top-k por similaridade de cosseno."""
+
+    def __init__(
+        self,
+        legal_area: str,
+        vectors: np.ndarray,
+        ids: List[int],
+        contents: List[str],
+        model: str,
+        articles: Optional[List[List[str]]] = None,
+        positions: Optional[List[List[Optional[int]]]] = None,
+    ):
+        self.legal_area = legal_area
+        self.vectors = vectors
+        self.ids = ids
+        self.contents = contents
+        self.model = model
+        self.articles = articles or [[] for _ in ids]
+        # (document_id, chunk_index) de cada chunk; índices antigos não têm a posição
+        self.positions = positions or [[None, None] for _ in ids]
+        # Identificador de artigo -> linhas que o contêm, para a busca exata
+        self._article_rows: Dict[str, List[int]] = {}
+        for row, identifiers in enumerate(self.articles):
+            for identifier in identifiers:
+                self._article_rows.setdefault(identifier, []).append(row)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def paths(directory: str, legal_area: str):
+        base = os.path.join(directory, legal_area)
+        return f"{base}.npy", f"{base}.json"
+
+    @classmethod
+    def exists(cls, directory: str, legal_area: str) -> bool:
+        return all(os.path.exists(path) for path in cls.paths(directory, legal_area))
+
+    @classmethod
+    def load(cls, directory: str, legal_area: str) -> "LocalVectorIndex":
+        """Carrega o índice com a matriz de vetores em memory-map (somente leitura)."""
+        vectors_path, metadata_path = cls.paths(directory, legal_area)
+        with open(metadata_path, encoding="utf-8") as f:
+            metadata = json.load(f)
+        vectors = np.load(vectors_path, mmap_mode="r")
+        if vectors.shape[0] != len(metadata["ids"]):
+            raise ValueError(f"Índice local de '{legal_area}' inconsistente: {vectors.shape[0]} vetores, {len(metadata['ids'])} chunks")
+        return cls(
+            legal_area, vectors, metadata["ids"], metadata["contents"], metadata["model"],
+            metadata.get("articles"), metadata.get("positions"),
+        )
+
+    def save(self, directory: str) -> None:
+        """Grava os arquivos do índice (substituição atômica de cada arquivo)."""
+        os.makedirs(directory, exist_ok=True)
+        vectors_path, metadata_path = self.paths(directory, self.legal_area)
+        np.save(f"{vectors_path}.tmp.npy", np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(f"{metadata_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "legal_area": self.legal_area,
+                "model": self.model,
+                "built_at": time.time(),
+                "ids": self.ids,
+                "contents": self.contents,
+                "articles": self.articles,
+                "positions": self.positions,
+            }, f, ensure_ascii=False)
+        os.replace(f"{vectors_path}.tmp.npy", vectors_path)
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+
+    def search(self, query_embedding, k: int = 10) -> List[dict]:
+        """Retorna os k chunks mais similares no formato das funções SQL de busca."""
+        if not self.ids:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "id": self.ids[i],
+                "content": self.contents[i],
+                "legal_area": self.legal_area,
+                "document_id": self.positions[i][0],
+                "chunk_index": self.positions[i][1],
+                "similarity": float(scores[i]),
+            }
+            for i in top
+        ]
+
+
+    def lookup(self, identifiers: List[str], k: int = 10) -> List[dict]:
+        """Chunks que contêm os identificadores, na ordem de prioridade dos identificadores."""
+        rows: List[int] = []
+        for identifier in identifiers:
+            for row in self._article_rows.get(identifier, []):
+                if row not in rows:
+                    rows.append(row)
+        return [
+            {
+                "id": self.ids[i],
+                "content": self.contents[i],
+                "legal_area": self.legal_area,
+                "articles": self.articles[i],
+                "document_id": self.positions[i][0],
+                "chunk_index": self.positions[i][1],
+                "similarity": 1.0,
+            }
+            for i in rows[:k]
+        ]
+
+
+def search_indexes(indexes: List[LocalVectorIndex], query_embedding, k: int = 10) -> List[dict]:
+    """Top-k global entre várias áreas (equivalente à função SQL multi-área)."""
+    rows = [row for index in indexes for row in index.search(query_embedding, k)]
+    rows.sort(key=lambda row: row["similarity"], reverse=True)
+    return rows[:k]
+
+
+def lookup_indexes(indexes: List[LocalVectorIndex], identifiers: List[str], k: int = 10) -> List[dict]:
+    """Busca exata por artigo entre várias áreas (equivalente à função SQL por artigo)."""
+    from app.services.article_index import order_rows_by_priority
+    rows = [row for index in indexes for row in index.lookup(identifiers, k)]
+    return order_rows_by_priority(rows, identifiers)[:k]
+
+
+class LocalVectorRetriever(BaseRetriever):
+    """Retriever sobre um `LocalVectorIndex`; substitui o SupabaseVectorStore da área."""
+
+    index: LocalVectorIndex
+    embeddings: object
+    k: int = 10
+
+    def _to_documents(self, rows: List[dict]) -> List[Document]:
+        from app.services.retriever_service import _row_to_document
+        return [_row_to_document(row) for row in rows]
+
+    def _lookup(self, query: str) -> List[dict]:
+        # Referência a artigo desta área: busca exata, sem embedding
+        from app.services.article_index import parse_article_query, resolve_areas, select_rows
+        article_query = parse_article_query(query)
+        areas = [self.index.legal_area]
+        if not article_query or not resolve_areas(article_query, areas):
+            return []
+        return select_rows(article_query, self.index.lookup(article_query.identifiers, self.k), areas)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        rows = self._lookup(query) or self.index.search(self.embeddings.embed_query(query), self.k)
+        return self._to_documents(rows)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        rows = self._lookup(query)
+        if not rows:
+            query_embedding = await self.embeddings.aembed_query(query)
+            rows = self.index.search(query_embedding, self.k)
+        return self._to_documents(rows)
+
+
+def _parse_embedding(value) -> List[float]:
+    # O PostgREST devolve colunas `vector` como texto: "[0.1,0.2,...]"
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def build_from_supabase(client, legal_area: str, model: str) -> Optional[LocalVectorIndex]:
+    """Exporta os chunks e embeddings de uma área do Supabase para um índice local."""
+    documents = client.table("dir_knowledge_base").select("id").eq("legal_area", legal_area).execute()
+    document_ids = [row["id"] for row in documents.data or []]
+    if not document_ids:
+        logger.warning(f"Nenhum documento da área '{legal_area}' encontrado no Supabase")
+        return None
+
+    ids, contents, vectors, articles, positions = [], [], [], [], []
+    start = 0
+    while True:
+        page = (
+            client.table("dir_knowledge_base_chunks")
+            .select("id, content, embedding, articles, document_id, chunk_index")
+            .in_("document_id", document_ids)
+            .order("id")
+            .range(start, start + EXPORT_PAGE_SIZE - 1)
+            .execute()
+        ).data or []
+        for row in page:
+            ids.append(row["id"])
+            contents.append(row["content"])
+            vectors.append(_parse_embedding(row["embedding"]))
+            articles.append(row.get("articles") or [])
+            positions.append([row.get("document_id"), row.get("chunk_index")])
+        if len(page) < EXPORT_PAGE_SIZE:
+            break
+        start += EXPORT_PAGE_SIZE
+
+    if not ids:
+        logger.warning(f"Nenhum chunk da área '{legal_area}' encontrado no Supabase")
+        return None
+
+    matrix = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+    logger.info(f"Área '{legal_area}' exportada: {len(ids)} chunks, {matrix.shape[1]} dimensões")
+    return LocalVectorIndex(legal_area, matrix, ids, contents, model, articles, positions)
@@ -0,0 +1,213 @@
+# app/services/metrics.py
+"""
+Métricas da aplicação no formato de texto do Prometheus (exportadas em /metrics).
+
+Implementação mínima, sem dependências: contadores e histogramas com rótulos,
+mais "coletores" que leem, na hora da exportação, os contadores que os serviços
+já mantêm (caches, sessões, bulkheads). O agente da requisição atual fica em um
+ContextVar definido pelo router, para rotular as métricas das etapas sem passar o
+nome por todas as camadas.
+"""
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Limites dos histogramas de latência (segundos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Agente da requisição atual (rótulo "agent" das métricas de etapa e de tokens)
+current_agent: contextvars.ContextVar[str] = contextvars.ContextVar("metrics_agent", default="none")
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues, **extra) -> Dict[str, str]:
+        return {**dict(zip(self.labelnames, key)), **extra}
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Por série: contagem por faixa (não cumulativa), soma e total
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, totals = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0, 0.0]))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            else:
+                counts[-1] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {key: (list(counts), list(totals)) for key, (counts, totals) in self._series.items()}
+        lines = []
+        for key, (counts, (total, count)) in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = self._labels(key, le=_format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(labels)} {cumulative}")
+            labels = _format_labels(self._labels(key))
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {_format_value(count)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Métricas registradas e coletores lidos na exportação."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets=buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+        """
+        Registra uma função que devolve (nome, tipo, descrição, amostras) de métricas
+        calculadas na hora (ex.: contadores mantidos pelos próprios serviços).
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+# Instância global do registro
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "mmdireito_stage_duration_seconds",
+    "Duração de cada etapa do atendimento (embedding, retrieval, context, llm, request).",
+    ["stage", "agent", "outcome"],
+)
+LLM_TOKENS = registry.counter(
+    "mmdireito_llm_tokens_total",
+    "Tokens enviados e recebidos do Gemini, por agente e modelo.",
+    ["agent", "model", "type"],
+)
+LLM_CALL_SECONDS = registry.histogram(
+    "mmdireito_llm_call_duration_seconds",
+    "Duração de cada chamada ao Gemini (do envio ao fim da resposta), por agente e modelo.",
+    ["agent", "model"],
+)
+LLM_CALLS = registry.counter(
+    "mmdireito_llm_calls_total",
+    "Chamadas concluídas ao Gemini, por agente e modelo.",
+    ["agent", "model"],
+)
+
+
+def observe_stage(stage: str, seconds: float, outcome: str = "ok") -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage, agent=current_agent.get(), outcome=outcome)
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Mede o bloco como uma etapa; o outcome distingue timeout, cancelamento e erro."""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except TimeoutError:
+        outcome = "timeout"
+        raise
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started, outcome)
+
+
+@contextmanager
+def agent_scope(agent: str):
+    """Define o agente que rotula as métricas geradas dentro do bloco."""
+    token = current_agent.set(agent)
+    try:
+        yield
+    finally:
+        current_agent.reset(token)
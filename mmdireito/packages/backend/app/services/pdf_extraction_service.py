@@ -0,0 +1,98 @@
+# app/services/pdf_extraction_service.py
+"""
+Extração de texto de PDFs página a página, paralelizada entre processos.
+
+`page.extract_text()` do pypdf é CPU-bound e roda em um único núcleo; para PDFs
+grandes (como o Código Civil) as páginas são divididas em faixas e extraídas em
+um pool de processos. Abaixo do limite de páginas configurado, a extração é
+serial, pois o custo de iniciar os processos não compensa.
+"""
+import io
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, NamedTuple, Tuple, Union
+
+from app.config import settings
+from app.logger_config import logger
+
+PdfSource = Union[str, bytes]
+
+
+class ExtractedPage(NamedTuple):
+    """Texto de uma página, com o número da página (a partir de 1) como metadado."""
+    page_number: int
+    text: str
+
+
+def _open_reader(source: PdfSource):
+    # pypdf é importado sob demanda para não pesar no import da aplicação web
+    import pypdf
+
+    return pypdf.PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+
+
+def _extract_page_range(source: PdfSource, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extrai as páginas [start, end) — executado dentro dos processos do pool."""
+    reader = _open_reader(source)
+    return [(index + 1, reader.pages[index].extract_text() or "") for index in range(start, end)]
+
+
+def _page_ranges(total_pages: int, workers: int) -> List[Tuple[int, int]]:
+    # Algumas faixas por processo equilibram a carga entre páginas mais e menos densas
+    pages_per_task = max(1, math.ceil(total_pages / (workers * 4)))
+    return [(start, min(start + pages_per_task, total_pages)) for start in range(0, total_pages, pages_per_task)]
+
+
+def iter_pdf_pages(
+    source: PdfSource,
+    max_workers: int = settings.PDF_EXTRACTION_WORKERS,
+    min_pages_for_parallel: int = settings.PDF_PARALLEL_MIN_PAGES,
+) -> Iterator[ExtractedPage]:
+    """
+    Extrai as páginas de um PDF (caminho ou bytes), em ordem.
+
+    As páginas são produzidas conforme as faixas ficam prontas, então o consumidor
+    pode processá-las em streaming. Se o pool de processos não puder ser usado
+    (ambientes serverless sem suporte a multiprocessing, por exemplo), a extração
+    continua de forma serial a partir da página em que parou.
+    """
+    reader = _open_reader(source)
+    total_pages = len(reader.pages)
+    next_index = 0
+
+    if max_workers > 1 and total_pages >= min_pages_for_parallel:
+        ranges = _page_ranges(total_pages, max_workers)
+        logger.info(f"Extraindo {total_pages} páginas em paralelo ({max_workers} processos, {len(ranges)} faixas)")
+        try:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                results = executor.map(
+                    _extract_page_range,
+                    [source] * len(ranges),
+                    [start for start, _ in ranges],
+                    [end for _, end in ranges],
+                )
+                for page_range in results:
+                    for page_number, text in page_range:
+                        yield ExtractedPage(page_number, text)
+                        next_index = page_number
+            return
+        except (OSError, BrokenProcessPool) as e:
+            logger.warning(f"Extração paralela indisponível ({e}); continuando de forma serial na página {next_index + 1}")
+
+    for index in range(next_index, total_pages):
+        yield ExtractedPage(index + 1, reader.pages[index].extract_text() or "")
+
+
+def extract_pdf_pages(source: PdfSource) -> List[ExtractedPage]:
+    """Extrai todas as páginas de um PDF em uma lista ordenada."""
+    return list(iter_pdf_pages(source))
+
+
+def extract_pdf_text(source: PdfSource) -> str:
+    """Extrai o texto completo de um PDF, com as páginas separadas por quebra de linha."""
+    return "\n".join(page.text for page in iter_pdf_pages(source))
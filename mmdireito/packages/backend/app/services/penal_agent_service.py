@@ -3,194 +3,156 @@
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
-from app.prompts import agente_penal_prompt
+from app.services.article_index import CODE_NAMES
+from app.services.answer_cache import CacheProbe, answer_cache, cache_generated, prompt_version
+from app.services.context_packer import Passage, context_packer
+from app.services.deadlines import LLM_STAGE, DeadlineExceeded, iter_with_deadline, run_stage
 from app.services.retriever_service import retriever_service
+from app.services.session_store import session_store
+from app.services.single_flight import llm_flight
+from app.services.supabase_service import SupabaseService, supabase_service
+from app.config import settings
 from app.logger_config import logger
-from typing import Dict
+from app.services.streaming import chunk_to_text
+from app.services.token_usage import token_usage_callback
+from typing import AsyncIterator, Optional, Tuple
+
+# Áreas consultadas pelo Agente Penal
+PENAL_LEGAL_AREAS = ['penal', 'processual_penal']
+
+# Identificador das sessões do agente no armazenamento compartilhado
+SESSION_AGENT = "penal"
+
+# Modelo do agente; junto com o prompt, compõe a versão das respostas em cache
+PENAL_MODEL = "gemini-2.0-flash-exp"
+
+# Contexto usado quando a recuperação estoura o orçamento (modo degradado, sem RAG)
+DEGRADED_CONTEXT = (
+    "A consulta à base de conhecimento excedeu o tempo limite. Responda com base no "
+    "conhecimento geral de Direito Penal e avise o usuário de que os dispositivos "
+    "citados devem ser conferidos na legislação."
+)
+
+def _format_passage(passage: Passage) -> str:
+    # O código de origem distingue artigos de mesmo número do CP e do CPP
+    source = CODE_NAMES.get(passage.metadata.get("legal_area"), "Documento")
+    return f"{source} (similaridade: {passage.score:.3f}):\n{passage.text}"
 
 class PenalAgentService:
     """Serviço para o Agente Penal especializado em Direito Penal e Processual Penal."""
 
-    def __init__(self):
+    def __init__(self, supabase: SupabaseService = supabase_service):
+        self.supabase = supabase
         self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash-exp",
+            model=PENAL_MODEL,
             temperature=0.1,
             max_tokens=None,
-            timeout=None,
+            timeout=settings.STAGE_TIMEOUT_LLM_SECONDS,
             max_retries=2,
+            callbacks=[token_usage_callback],
         )
         
-        # Histórico de sessões
-        self.store: Dict[str, BaseChatMessageHistory] = {}
-        
-        # Inicializar sem RAG (será configurado dinamicamente)
-        self.retriever = None
-        self.rag_chain = None
-        self.simple_chain = None
+        # Histórico de sessões (armazenamento compartilhado entre os agentes)
+        self.sessions = session_store
+
+        # Versão das respostas em cache: muda com o prompt ou o modelo
+        from app.prompts import AGENTE_PENAL_PROMPT
+        self.prompt_version = prompt_version(AGENTE_PENAL_PROMPT, PENAL_MODEL)
         
         logger.info("PenalAgentService inicializado com sucesso")
 
-    def _ensure_chain_configured(self):
-        """Garante que a cadeia está configurada com RAG se disponível."""
+    def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
+        """Obtém ou cria o histórico de uma sessão."""
+        return self.sessions.get_history(SESSION_AGENT, session_id)
+
+    async def _build_prompt(self, message: str, session_id: str) -> Tuple[str, bool]:
+        """
+        Executa a etapa de recuperação (busca por artigo ou embedding + busca no
+        Supabase) e monta o prompt final enviado ao LLM.
+
+        Retorna o prompt e se ele foi montado em modo degradado (a recuperação
+        estourou o orçamento e a resposta sai sem a base de conhecimento).
+        """
+        logger.bind(context=f'message="{message[:50]}..."').info(
+            f"[SIMPLE RAG] Processando mensagem para sessão {session_id}"
+        )
+        
+        # PASSOS 1 e 2: Referências a artigos ("art. 155 do CP") são resolvidas por
+        # busca exata; as demais perguntas geram embedding e buscam nas duas áreas
+        # com uma única RPC (top-k global)
+        logger.info("[SIMPLE RAG] Buscando documentos...")
+        
+        context_docs = []
+        degraded = False
         try:
-            logger.info("[DEBUG] Iniciando _ensure_chain_configured")
-            
-            # Verificar se já está configurado
-            if self.rag_chain is not None or self.simple_chain is not None:
-                logger.info("[DEBUG] Cadeia já configurada, retornando")
-                return
-            
-            logger.info("[DEBUG] Buscando retrievers para áreas penais")
-            # Obter retrievers para áreas penais
-            penal_retriever = retriever_service.get_retriever('penal')
-            processual_penal_retriever = retriever_service.get_retriever('processual_penal')
-            
-            logger.info(f"[DEBUG] Penal retriever: {type(penal_retriever) if penal_retriever else None}")
-            logger.info(f"[DEBUG] Processual penal retriever: {type(processual_penal_retriever) if processual_penal_retriever else None}")
-            
-            # Combinar retrievers se ambos estiverem disponíveis
-            if penal_retriever and processual_penal_retriever:
-                logger.info("[DEBUG] Ambos retrievers disponíveis, combinando")
-                
-                # TESTE: Verificar se retrievers conseguem buscar documentos
-                try:
-                    logger.info("[DEBUG] Testando busca no retriever penal")
-                    test_docs_penal = penal_retriever.get_relevant_documents("roubo furto crime")
-                    logger.info(f"[DEBUG] Retriever penal encontrou {len(test_docs_penal)} documentos")
-                    
-                    logger.info("[DEBUG] Testando busca no retriever processual penal")
-                    test_docs_proc = processual_penal_retriever.get_relevant_documents("roubo furto crime")
-                    logger.info(f"[DEBUG] Retriever processual encontrou {len(test_docs_proc)} documentos")
-                    
-                    # TESTE CRÍTICO: Testar embedding service diretamente
-                    logger.info("[DEBUG] Testando embedding service diretamente")
-                    from app.services.embedding_service import embedding_service
-                    test_embedding = embedding_service.embed_query("Art. 15. O agente que, voluntariamente, desiste")
-                    logger.info(f"[DEBUG] Embedding gerado: dimensões={len(test_embedding) if test_embedding else 'None'}")
-                    if test_embedding:
-                        logger.info(f"[DEBUG] Primeiros 5 valores: {test_embedding[:5]}")
-                    
-                    # TESTE: Buscar diretamente no vector store
-                    logger.info("[DEBUG] Testando busca direta no vector store penal")
-                    penal_vector_store = retriever_service.get_retriever('penal').vectorstore
-                    logger.info(f"[DEBUG] Vector store tipo: {type(penal_vector_store)}")
-                    logger.info(f"[DEBUG] Vector store query_name: {getattr(penal_vector_store, 'query_name', 'None')}")
-                    logger.info(f"[DEBUG] Vector store table_name: {getattr(penal_vector_store, 'table_name', 'None')}")
-                    
-                    # TESTE: Verificar se função SQL existe no Supabase
-                    try:
-                        logger.info("[DEBUG] Testando função SQL diretamente")
-                        test_embedding_list = test_embedding.tolist() if hasattr(test_embedding, 'tolist') else test_embedding
-                        
-                        # Obter client corretamente do SupabaseVectorStore
-                        from supabase import create_client
-                        import os
-                        supabase_client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
-                        
-                        sql_result = supabase_client.rpc("match_documents_penal_area", {
-                            "query_embedding": test_embedding_list,
-                            "match_threshold": 0.5,
-                            "match_count": 3
-                        }).execute()
-                        logger.info(f"[DEBUG] Função SQL direta retornou: {len(sql_result.data) if sql_result.data else 'None'}")
-                        if sql_result.data:
-                            logger.info(f"[DEBUG] Primeiro resultado SQL: {sql_result.data[0]}")
-                        else:
-                            logger.warning("[DEBUG] Função SQL existe mas retornou dados vazios")
-                            
-                        # TESTE: Verificar se a função existe mesmo
-                        logger.info("[DEBUG] Verificando se função SQL existe")
-                        function_check = supabase_client.rpc("exec_sql", {
-                            "query": "SELECT routine_name FROM information_schema.routines WHERE routine_name = 'match_documents_penal_area'"
-                        }).execute()
-                        logger.info(f"[DEBUG] Função existe no schema: {function_check.data}")
-                        
-                    except Exception as sql_error:
-                        logger.error(f"[DEBUG] Erro ao chamar função SQL direta: {sql_error}")
-                        import traceback
-                        logger.error(f"[DEBUG] SQL Traceback: {traceback.format_exc()}")
-                    
-                    direct_results = penal_vector_store.similarity_search("Art. 15. O agente que, voluntariamente, desiste", k=3)
-                    logger.info(f"[DEBUG] Busca direta encontrou: {len(direct_results)} documentos")
-                    
-                except Exception as e:
-                    logger.error(f"[DEBUG] Erro ao testar retrievers individuais: {e}")
-                    import traceback
-                    logger.error(f"[DEBUG] Traceback: {traceback.format_exc()}")
-                
-                self.retriever = retriever_service.get_combined_retriever(['penal', 'processual_penal'])
-                logger.info("Retriever combinado configurado para áreas: penal e processual_penal")
-                logger.info(f"[DEBUG] Retriever combinado tipo: {type(self.retriever)}")
-                
-                # TESTE: Verificar se retriever combinado funciona
-                try:
-                    logger.info("[DEBUG] Testando busca no retriever combinado")
-                    test_docs_combined = self.retriever.get_relevant_documents("roubo furto crime")
-                    logger.info(f"[DEBUG] Retriever combinado encontrou {len(test_docs_combined)} documentos")
-                    if test_docs_combined:
-                        logger.info(f"[DEBUG] Primeiro doc: {str(test_docs_combined[0])[:200]}...")
-                except Exception as e:
-                    logger.error(f"[DEBUG] Erro ao testar retriever combinado: {e}")
-            elif penal_retriever:
-                logger.info("[DEBUG] Apenas retriever penal disponível")
-                self.retriever = penal_retriever
-                logger.info("Retriever configurado apenas para área: penal")
-            elif processual_penal_retriever:
-                logger.info("[DEBUG] Apenas retriever processual penal disponível")
-                self.retriever = processual_penal_retriever
-                logger.info("Retriever configurado apenas para área: processual_penal")
-            else:
-                logger.warning("[DEBUG] Nenhum retriever disponível")
-                self.retriever = None
-                logger.warning("Nenhum retriever disponível para áreas penais. Agente funcionará sem RAG.")
-            
-            # Criar cadeia de chat
-            if self.retriever:
-                logger.info("[DEBUG] Configurando cadeia RAG")
-                # Cadeia com RAG
-                from langchain.chains import create_retrieval_chain
-                from langchain.chains.combine_documents import create_stuff_documents_chain
-                
-                logger.info("[DEBUG] Criando document_chain")
-                # Cadeia para combinar documentos
-                document_chain = create_stuff_documents_chain(self.llm, agente_penal_prompt)
-                logger.info(f"[DEBUG] Document chain criada: {type(document_chain)}")
-                
-                logger.info("[DEBUG] Criando retrieval_chain")
-                # Cadeia de recuperação completa
-                self.rag_chain = create_retrieval_chain(self.retriever, document_chain)
-                logger.info(f"[DEBUG] RAG chain criada: {type(self.rag_chain)}")
-                
-                logger.info("Cadeia RAG configurada com sucesso")
-            else:
-                logger.info("[DEBUG] Configurando cadeia simples")
-                # Cadeia simples sem RAG
-                from langchain_core.prompts import ChatPromptTemplate
-                
-                simple_prompt = ChatPromptTemplate.from_messages([
-                    ("system", agente_penal_prompt.messages[0].prompt.template),
-                    ("placeholder", "{chat_history}"),
-                    ("human", "{input}")
-                ])
-                
-                self.simple_chain = simple_prompt | self.llm
-                
-                logger.info("Cadeia simples configurada (sem RAG)")
-                
+            context_docs = await retriever_service.asearch_query(
+                message, PENAL_LEGAL_AREAS, match_count=5
+            )
+        except DeadlineExceeded as e:
+            degraded = True
+            logger.warning(f"[SIMPLE RAG] {e}; respondendo sem a base de conhecimento (modo degradado)")
         except Exception as e:
-            logger.error(f"[ERROR] Erro ao configurar cadeia de chat: {str(e)}")
-            logger.error(f"[ERROR] Tipo do erro: {type(e)}")
-            import traceback
-            logger.error(f"[ERROR] Traceback: {traceback.format_exc()}")
-            raise
+            logger.warning(f"[SIMPLE RAG] Erro ao buscar áreas penais: {e}")
+        
+        # PASSO 3: Preparar contexto para o LLM
+        logger.info(f"[SIMPLE RAG] Total de documentos encontrados: {len(context_docs)}")
+        
+        if degraded:
+            context_text = DEGRADED_CONTEXT
+        elif not context_docs:
+            logger.warning("[SIMPLE RAG] Nenhum documento encontrado, gerando resposta sem contexto")
+            context_text = "Nenhum documento específico foi encontrado na base de conhecimento."
+        else:
+            # Funde trechos sobrepostos/adjacentes, descarta duplicatas e corta no orçamento
+            packed = context_packer.pack(context_docs, SESSION_AGENT, formatter=_format_passage)
+            context_text = packed.text
+            
+            logger.info(f"[SIMPLE RAG] Contexto preparado: {len(packed.passages)} trechos, ~{packed.tokens} tokens")
+        
+        # PASSO 4: Preparar prompt para o LLM
+        from app.prompts import AGENTE_PENAL_PROMPT
+        
+        return f"""{AGENTE_PENAL_PROMPT}
 
-    def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
-        """Obtém ou cria o histórico de uma sessão."""
-        if session_id not in self.store:
-            self.store[session_id] = ChatMessageHistory()
-            logger.info(f"Nova sessão criada: {session_id}")
-        return self.store[session_id]
+CONTEXTO E DOCUMENTOS:
+{context_text}
+
+PERGUNTA DO USUÁRIO: {message}
+
+Por favor, responda com base no contexto fornecido, citando os artigos e dispositivos legais específicos quando relevante:""", degraded
+
+    async def _cache_probe(self, message: str, session_id: str) -> Optional[CacheProbe]:
+        """Consulta o cache de respostas se a sessão ainda não tem histórico (primeiro turno)."""
+        if self.get_session_history(session_id).messages:
+            return None
+        return await answer_cache.lookup(SESSION_AGENT, message, self.prompt_version, PENAL_LEGAL_AREAS)
+
+    def _record_turn(self, session_id: str, message: str, answer: str) -> None:
+        """Registra a pergunta e a resposta no histórico da sessão."""
+        history = self.get_session_history(session_id)
+        history.add_user_message(message)
+        history.add_ai_message(answer)
+
+    @staticmethod
+    def _limit_length(answer: str) -> str:
+        """Limita o tamanho da resposta devolvida por `process_message`."""
+        if len(answer) > 4000:
+            logger.info("[SIMPLE RAG] Resposta truncada por ser muito longa")
+            return answer[:4000] + "..."
+        return answer
+
+    async def _generate(self, message: str, session_id: str) -> Tuple[str, bool]:
+        """Recupera o contexto e chama o LLM, devolvendo o texto bruto da resposta e se houve degradação."""
+        full_prompt, degraded = await self._build_prompt(message, session_id)
+
+        # PASSO 5: Chamar LLM (dentro do orçamento da etapa e do prazo da requisição)
+        logger.info("[SIMPLE RAG] Enviando para LLM...")
+        response = await run_stage(LLM_STAGE, lambda: self.llm.ainvoke(full_prompt))
+        
+        # PASSO 6: Processar resposta
+        answer = response.content if hasattr(response, 'content') else str(response)
+        logger.info(f"[SIMPLE RAG] Resposta do LLM: {len(answer)} caracteres")
+        return answer, degraded
 
     async def process_message(self, message: str, session_id: str) -> str:
         """
@@ -204,116 +166,75 @@ class PenalAgentService:
             Resposta do agente baseada no conhecimento jurídico
         """
         try:
-            logger.info(f"[SIMPLE RAG] Processando mensagem para sessão {session_id}")
-            logger.info(f"[SIMPLE RAG] Pergunta: {message}")
-            
-            # PASSO 1: Gerar embedding da pergunta
-            from app.services.embedding_service import embedding_service
-            logger.info("[SIMPLE RAG] Gerando embedding da pergunta...")
-            query_embedding = embedding_service.embed_query(message)
-            logger.info(f"[SIMPLE RAG] Embedding gerado: {len(query_embedding)} dimensões")
-            
-            # PASSO 2: Buscar documentos com SQL direto
-            from supabase import create_client
-            import os
-            supabase_client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
-            
-            logger.info("[SIMPLE RAG] Buscando documentos no Supabase...")
-            
-            # Converter embedding para lista se necessário
-            embedding_list = query_embedding.tolist() if hasattr(query_embedding, 'tolist') else query_embedding
-            
-            # Buscar em ambas as áreas (penal e processual_penal)
-            context_docs = []
-            
-            # Buscar área penal
-            try:
-                penal_results = supabase_client.rpc("match_documents_penal_area", {
-                    "query_embedding": embedding_list,
-                    "match_count": 3
-                }).execute()
-                
-                if penal_results.data:
-                    context_docs.extend(penal_results.data)
-                    logger.info(f"[SIMPLE RAG] Encontrados {len(penal_results.data)} docs na área penal")
-            except Exception as e:
-                logger.warning(f"[SIMPLE RAG] Erro ao buscar área penal: {e}")
-            
-            # Buscar área processual penal
-            try:
-                proc_results = supabase_client.rpc("match_documents_processual_penal_area", {
-                    "query_embedding": embedding_list,
-                    "match_count": 3
-                }).execute()
-                
-                if proc_results.data:
-                    context_docs.extend(proc_results.data)
-                    logger.info(f"[SIMPLE RAG] Encontrados {len(proc_results.data)} docs na área processual penal")
-            except Exception as e:
-                logger.warning(f"[SIMPLE RAG] Erro ao buscar área processual penal: {e}")
-            
-            # PASSO 3: Preparar contexto para o LLM
-            logger.info(f"[SIMPLE RAG] Total de documentos encontrados: {len(context_docs)}")
-            
-            if not context_docs:
-                logger.warning("[SIMPLE RAG] Nenhum documento encontrado, gerando resposta sem contexto")
-                context_text = "Nenhum documento específico foi encontrado na base de conhecimento."
-            else:
-                # Ordenar por similaridade e pegar os melhores
-                context_docs.sort(key=lambda x: x.get('similarity', 0), reverse=True)
-                top_docs = context_docs[:5]  # Top 5 documentos
-                
-                context_text = "\n\n---\n\n".join([
-                    f"Documento (similaridade: {doc.get('similarity', 'N/A'):.3f}):\n{doc['content']}"
-                    for doc in top_docs
-                ])
-                
-                logger.info(f"[SIMPLE RAG] Contexto preparado: {len(context_text)} caracteres")
-            
-            # PASSO 4: Preparar prompt para o LLM
-            from app.prompts import AGENTE_PENAL_PROMPT
-            
-            full_prompt = f"""{AGENTE_PENAL_PROMPT}
+            probe = await self._cache_probe(message, session_id)
+            if probe and probe.answer:
+                logger.info(f"[SIMPLE RAG] Resposta obtida do cache para sessão {session_id}")
+                answer = self._limit_length(probe.answer)
+                self._record_turn(session_id, message, answer)
+                return answer
 
-CONTEXTO E DOCUMENTOS:
-{context_text}
-
-PERGUNTA DO USUÁRIO: {message}
-
-Por favor, responda com base no contexto fornecido, citando os artigos e dispositivos legais específicos quando relevante:"""
-
-            # PASSO 5: Chamar LLM
-            logger.info("[SIMPLE RAG] Enviando para LLM...")
-            response = await self.llm.ainvoke(full_prompt)
-            
-            logger.info(f"[SIMPLE RAG] Resposta do LLM: {len(response.content)} caracteres")
-            
-            # PASSO 6: Processar resposta
-            answer = response.content if hasattr(response, 'content') else str(response)
+            if probe:
+                # Primeiro turno não depende da sessão: perguntas idênticas simultâneas
+                # compartilham a mesma recuperação e a mesma chamada ao LLM
+                answer, degraded = await llm_flight.do(
+                    (probe.namespace, probe.question), lambda: self._generate(message, session_id)
+                )
+            else:
+                answer, degraded = await self._generate(message, session_id)
             
-            if not answer or answer.strip() == "":
+            # O cache guarda o texto integral; o limite de tamanho é só da saída
+            cache_generated(probe, answer, degraded)
+            if not (answer and answer.strip()):
                 answer = "Desculpe, não consegui gerar uma resposta adequada. Poderia reformular sua pergunta sobre Direito Penal?"
-            
-            # Limitar tamanho da resposta
-            if len(answer) > 4000:
-                answer = answer[:4000] + "..."
-                logger.info("[SIMPLE RAG] Resposta truncada por ser muito longa")
-            
+
+            answer = self._limit_length(answer)
+            self._record_turn(session_id, message, answer)
             logger.info(f"[SIMPLE RAG] Resposta final gerada com sucesso para sessão {session_id}")
             
             return answer
             
+        except DeadlineExceeded:
+            # O router responde 504; não há resposta parcial para gravar
+            raise
         except Exception as e:
             logger.error(f"[SIMPLE RAG] Erro ao processar mensagem: {e}")
             import traceback
             logger.error(f"[SIMPLE RAG] Traceback completo: {traceback.format_exc()}")
             return f"Erro interno ao processar sua solicitação: {str(e)}"
 
+    async def stream_message(self, message: str, session_id: str) -> AsyncIterator[str]:
+        """
+        Transmite a resposta do Agente Penal token a token.
+
+        A recuperação acontece antes do primeiro token; a resposta completa só é
+        gravada no histórico (e no cache de respostas) se o stream chegar ao fim.
+        """
+        probe = await self._cache_probe(message, session_id)
+        if probe and probe.answer:
+            logger.info(f"[SIMPLE RAG] Resposta obtida do cache para sessão {session_id}")
+            yield probe.answer
+            self._record_turn(session_id, message, probe.answer)
+            return
+
+        full_prompt, degraded = await self._build_prompt(message, session_id)
+
+        logger.info("[SIMPLE RAG] Iniciando stream do LLM...")
+        parts = []
+        async for chunk in iter_with_deadline(LLM_STAGE, self.llm.astream(full_prompt)):
+            text = chunk_to_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+
+        answer = "".join(parts)
+        cache_generated(probe, answer, degraded)
+        self._record_turn(session_id, message, answer)
+        logger.info(f"[SIMPLE RAG] Stream concluído para sessão {session_id}")
+
     def clear_session(self, session_id: str) -> bool:
         """Limpa o histórico de uma sessão específica."""
         try:
-            if session_id in self.store:
-                del self.store[session_id]
+            if self.sessions.delete(SESSION_AGENT, session_id):
                 logger.info(f"Sessão {session_id} limpa com sucesso")
                 return True
             else:
@@ -325,7 +246,7 @@ Por favor, responda com base no contexto fornecido, citando os artigos e disposi
 
     def get_session_count(self) -> int:
         """Retorna o número de sessões ativas."""
-        return len(self.store)
+        return self.sessions.count(SESSION_AGENT)
 
 # Instância global do serviço
 penal_agent_service = PenalAgentService()
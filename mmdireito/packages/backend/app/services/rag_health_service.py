@@ -0,0 +1,158 @@
+# app/services/rag_health_service.py
+"""
+Diagnóstico e aquecimento do pipeline de RAG, fora do caminho das requisições.
+
+No boot, uma tarefa em segundo plano executa as sondas abaixo: abre as conexões
+com o Supabase, gera um embedding de teste (inicializando o cliente do Google e
+o cache) e consulta as funções de busca de cada área. Os resultados, com o tempo
+de cada sonda, ficam em cache e são servidos por `/health/rag`; nenhuma
+requisição de usuário executa diagnósticos.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.embedding_service import embedding_service
+from app.services.retriever_service import retriever_service, MULTI_AREA_FUNCTION_NAME
+from app.services.schema_service import area_match_function_name
+from app.services.supabase_service import SupabaseService, supabase_service
+
+# Pergunta usada nas sondas de embedding e busca
+PROBE_QUERY = "Art. 15. O agente que, voluntariamente, desiste de prosseguir na execução"
+
+
+class RagHealthService:
+    """Executa as sondas do RAG e guarda o último resultado de cada uma."""
+
+    def __init__(
+        self,
+        supabase: SupabaseService = supabase_service,
+        max_age: float = settings.RAG_HEALTH_MAX_AGE_SECONDS,
+        probe_timeout: float = settings.RAG_HEALTH_PROBE_TIMEOUT_SECONDS,
+    ):
+        self.supabase = supabase
+        self.max_age = max_age
+        self.probe_timeout = probe_timeout
+        self.results: Dict[str, dict] = {}
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._query_embedding: Optional[List[float]] = None
+
+    # --- Sondas --- #
+
+    async def _probe_supabase(self) -> dict:
+        client = await self.supabase.get_async_client()
+        result = await client.table("dir_knowledge_base").select("legal_area").limit(1).execute()
+        return {"rows": len(result.data or [])}
+
+    async def _probe_embedding(self) -> dict:
+        self._query_embedding = await embedding_service.aembed_query(PROBE_QUERY)
+        return {"dimensions": len(self._query_embedding)}
+
+    async def _probe_area(self, area: str) -> dict:
+        if self._query_embedding is None:
+            raise RuntimeError("embedding de teste indisponível")
+        client = await self.supabase.get_async_client()
+        result = await client.rpc(area_match_function_name(area), {
+            "query_embedding": self._query_embedding,
+            "match_count": 3
+        }).execute()
+        rows = result.data or []
+        return {
+            "documents": len(rows),
+            "top_similarity": round(rows[0]["similarity"], 4) if rows else None,
+        }
+
+    async def _probe_multi_area(self) -> dict:
+        if self._query_embedding is None:
+            raise RuntimeError("embedding de teste indisponível")
+        areas = retriever_service.list_available_areas()
+        rows = await retriever_service.asearch_areas(self._query_embedding, areas, match_count=3)
+        return {"areas": areas, "documents": len(rows)}
+
+    async def _run_probe(self, name: str, probe: Callable[[], Awaitable[dict]]) -> None:
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(probe(), timeout=self.probe_timeout)
+            status = "ok"
+            if detail.get("documents") == 0:
+                status = "degraded"
+        except Exception as e:
+            detail = {"error": f"{type(e).__name__}: {e}"}
+            status = "error"
+        self.results[name] = {
+            "status": status,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            **detail,
+        }
+
+    async def run_probes(self) -> dict:
+        """Executa todas as sondas e atualiza o cache de resultados."""
+        # Conexão e embedding primeiro; as buscas por área dependem do embedding
+        await asyncio.gather(
+            self._run_probe("supabase", self._probe_supabase),
+            self._run_probe("embedding", self._probe_embedding),
+        )
+        area_probes = [
+            self._run_probe(f"retrieval:{area}", lambda area=area: self._probe_area(area))
+            for area in retriever_service.list_available_areas()
+        ]
+        await asyncio.gather(
+            *area_probes,
+            self._run_probe(f"retrieval:{MULTI_AREA_FUNCTION_NAME}", self._probe_multi_area),
+        )
+        self.checked_at = time.time()
+
+        failing = [name for name, result in self.results.items() if result["status"] != "ok"]
+        if failing:
+            logger.bind(context=self.results).warning(f"Diagnóstico do RAG com problemas: {failing}")
+        else:
+            logger.info("Diagnóstico do RAG concluído", context=self.results)
+        return self.results
+
+    # --- Agendamento --- #
+
+    def start_warmup(self) -> None:
+        """Dispara as sondas em segundo plano (usado no startup; não bloqueia o boot)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_probes())
+
+    async def shutdown(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def get_report(self) -> dict:
+        """Resultado em cache; se estiver velho, agenda uma nova rodada sem esperar por ela."""
+        stale = self.checked_at is None or time.time() - self.checked_at > self.max_age
+        running = self._task is not None and not self._task.done()
+        if stale and not running:
+            self.start_warmup()
+            running = True
+
+        statuses = {result["status"] for result in self.results.values()}
+        if not self.results:
+            overall = "pending"
+        elif "error" in statuses:
+            overall = "error"
+        elif "degraded" in statuses:
+            overall = "degraded"
+        else:
+            overall = "ok"
+
+        return {
+            "status": overall,
+            "checked_at": self.checked_at,
+            "age_seconds": round(time.time() - self.checked_at, 1) if self.checked_at else None,
+            "refreshing": running,
+            "probes": self.results,
+        }
+
+
+# Instância global do serviço
+rag_health_service = RagHealthService()
@@ -1,12 +1,65 @@
 # app/services/retriever_service.py
 from typing import Dict, List, Optional
-from langchain.retrievers import MergerRetriever
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from app.logger_config import logger
+from app.services.article_index import order_rows_by_priority, parse_article_query, resolve_areas, select_rows
+from app.services.local_vector_index import LocalVectorIndex, lookup_indexes, search_indexes
+from app.services.deadlines import RETRIEVAL_STAGE, DeadlineExceeded, hedged, run_stage
+from app.services.single_flight import retrieval_flight, vector_key
+from app.services.supabase_service import SupabaseService, supabase_service
+
+# Função SQL (criada no lifespan) que busca em várias áreas com ranking global
+MULTI_AREA_FUNCTION_NAME = "match_documents_multi_area"
+
+# Função SQL (criada no lifespan) que busca chunks pelo número do artigo
+ARTICLE_FUNCTION_NAME = "match_documents_by_article"
+
+
+def _row_to_document(row: dict) -> Document:
+    """Converte uma linha retornada pelas funções de busca em um Document."""
+    return Document(
+        page_content=row.get("content", ""),
+        metadata={
+            "id": row.get("id"),
+            "legal_area": row.get("legal_area"),
+            "document_id": row.get("document_id"),
+            "chunk_index": row.get("chunk_index"),
+            "similarity": row.get("similarity"),
+        }
+    )
+
+
+class MultiAreaRetriever(BaseRetriever):
+    """
+    Retriever que consulta várias áreas jurídicas em uma única chamada RPC,
+    retornando o top-k global em vez de k documentos de cada área.
+    """
+
+    legal_areas: List[str]
+    k: int = 10
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        rows = retriever_service.search_query(query, self.legal_areas, self.k)
+        return [_row_to_document(row) for row in rows]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        rows = await retriever_service.asearch_query(query, self.legal_areas, self.k)
+        return [_row_to_document(row) for row in rows]
+
 
 class RetrieverService:
     """Serviço para gerenciar retrievers por área jurídica."""
 
-    def __init__(self):
+    def __init__(self, supabase: SupabaseService = supabase_service):
+        self.supabase = supabase
+        # Índices locais (memory-map) das áreas exportadas; evitam a RPC na busca
+        self._local_indexes: Dict[str, LocalVectorIndex] = {}
         self._retrievers: Dict[str, any] = {
             'civil': None,
             'penal': None,
@@ -25,6 +78,18 @@ class RetrieverService:
         logger.info(f"Retriever configurado para área: {legal_area}")
         return True
 
+    def set_local_index(self, legal_area: str, index: Optional[LocalVectorIndex]) -> None:
+        """Registra o índice local de uma área (None remove), usado por `search_areas`."""
+        if index is None:
+            self._local_indexes.pop(legal_area, None)
+        else:
+            self._local_indexes[legal_area] = index
+
+    def _local_indexes_for(self, legal_areas: List[str]) -> Optional[List[LocalVectorIndex]]:
+        # Só usa a busca local quando todas as áreas pedidas têm índice local
+        indexes = [self._local_indexes.get(area) for area in legal_areas]
+        return indexes if indexes and all(indexes) else None
+
     def get_retriever(self, legal_area: str):
         """Obtém retriever de uma área jurídica específica."""
         retriever = self._retrievers.get(legal_area)
@@ -50,9 +115,155 @@ class RetrieverService:
         if len(available_retrievers) == 1:
             return available_retrievers[0]
         
-        # Combina múltiplos retrievers
-        logger.info(f"Combinando retrievers das áreas: {legal_areas}")
-        return MergerRetriever(retrievers=available_retrievers)
+        # Combina múltiplas áreas em uma única busca RPC com ranking global
+        available_areas = [area for area in legal_areas if self._retrievers.get(area)]
+        logger.info(f"Combinando retrievers das áreas: {available_areas}")
+        return MultiAreaRetriever(legal_areas=available_areas)
+
+    def _multi_area_params(self, query_embedding, legal_areas: List[str], match_count: int) -> dict:
+        embedding_list = query_embedding.tolist() if hasattr(query_embedding, 'tolist') else query_embedding
+        return {
+            "query_embedding": embedding_list,
+            "filter_areas": list(legal_areas),
+            "match_count": match_count
+        }
+
+    @staticmethod
+    def _flight_key(function_name: str, target, legal_areas: List[str], match_count: int) -> tuple:
+        # RPCs idênticas em andamento (mesma pergunta de vários usuários) viram uma só
+        return (function_name, target, tuple(legal_areas), match_count)
+
+    @staticmethod
+    async def _run_rpc(key: tuple, call) -> List[dict]:
+        # Limite de tempo da etapa para quem espera; hedging e coalescência na chamada em si
+        return await run_stage(RETRIEVAL_STAGE, lambda: retrieval_flight.do(key, lambda: hedged(RETRIEVAL_STAGE, call)))
+
+    def search_areas(self, query_embedding, legal_areas: List[str], match_count: int = 10) -> List[dict]:
+        """Busca os `match_count` trechos mais similares entre as áreas informadas (uma única RPC)."""
+        local_indexes = self._local_indexes_for(legal_areas)
+        if local_indexes:
+            return search_indexes(local_indexes, query_embedding, match_count)
+
+        def call() -> List[dict]:
+            response = self.supabase.client.rpc(
+                MULTI_AREA_FUNCTION_NAME,
+                self._multi_area_params(query_embedding, legal_areas, match_count)
+            ).execute()
+            return response.data or []
+
+        key = self._flight_key(MULTI_AREA_FUNCTION_NAME, vector_key(query_embedding), legal_areas, match_count)
+        return list(retrieval_flight.do_sync(key, call))
+
+    async def asearch_areas(self, query_embedding, legal_areas: List[str], match_count: int = 10) -> List[dict]:
+        """Versão assíncrona de `search_areas`, usando o cliente assíncrono do pool."""
+        local_indexes = self._local_indexes_for(legal_areas)
+        if local_indexes:
+            return search_indexes(local_indexes, query_embedding, match_count)
+
+        async def call() -> List[dict]:
+            client = await self.supabase.get_async_client()
+            response = await client.rpc(
+                MULTI_AREA_FUNCTION_NAME,
+                self._multi_area_params(query_embedding, legal_areas, match_count)
+            ).execute()
+            return response.data or []
+
+        key = self._flight_key(MULTI_AREA_FUNCTION_NAME, vector_key(query_embedding), legal_areas, match_count)
+        return list(await self._run_rpc(key, call))
+
+    def _article_params(self, identifiers: List[str], legal_areas: List[str], match_count: int) -> dict:
+        return {
+            "filter_areas": list(legal_areas),
+            "article_ids": list(identifiers),
+            "match_count": match_count
+        }
+
+    def lookup_articles(self, identifiers: List[str], legal_areas: List[str], match_count: int = 10) -> List[dict]:
+        """Busca exata dos chunks que contêm os artigos informados (sem embedding)."""
+        local_indexes = self._local_indexes_for(legal_areas)
+        if local_indexes:
+            return lookup_indexes(local_indexes, identifiers, match_count)
+
+        def call() -> List[dict]:
+            response = self.supabase.client.rpc(
+                ARTICLE_FUNCTION_NAME,
+                self._article_params(identifiers, legal_areas, match_count)
+            ).execute()
+            return order_rows_by_priority(response.data or [], identifiers)
+
+        key = self._flight_key(ARTICLE_FUNCTION_NAME, tuple(identifiers), legal_areas, match_count)
+        return list(retrieval_flight.do_sync(key, call))
+
+    async def alookup_articles(self, identifiers: List[str], legal_areas: List[str], match_count: int = 10) -> List[dict]:
+        """Versão assíncrona de `lookup_articles`."""
+        local_indexes = self._local_indexes_for(legal_areas)
+        if local_indexes:
+            return lookup_indexes(local_indexes, identifiers, match_count)
+
+        async def call() -> List[dict]:
+            client = await self.supabase.get_async_client()
+            response = await client.rpc(
+                ARTICLE_FUNCTION_NAME,
+                self._article_params(identifiers, legal_areas, match_count)
+            ).execute()
+            return order_rows_by_priority(response.data or [], identifiers)
+
+        key = self._flight_key(ARTICLE_FUNCTION_NAME, tuple(identifiers), legal_areas, match_count)
+        return list(await self._run_rpc(key, call))
+
+    def _article_lookup_target(self, query: str, legal_areas: List[str]):
+        article_query = parse_article_query(query)
+        if not article_query:
+            return None
+        areas = resolve_areas(article_query, legal_areas)
+        return (article_query, areas) if areas else None
+
+    def search_query(self, query: str, legal_areas: List[str], match_count: int = 10) -> List[dict]:
+        """
+        Busca a partir do texto da pergunta: referências a artigos ("art. 155 do CP")
+        são resolvidas por busca exata; sem resultado, cai na busca vetorial.
+        """
+        target = self._article_lookup_target(query, legal_areas)
+        if target:
+            try:
+                article_query, areas = target
+                rows = select_rows(
+                    article_query, self.lookup_articles(article_query.identifiers, areas, match_count), legal_areas
+                )
+                if rows:
+                    logger.info(f"Busca por artigo resolvida sem embedding: {article_query.identifiers} em {areas}")
+                    return rows
+            except DeadlineExceeded:
+                # Sem orçamento de recuperação, a busca vetorial também não caberia
+                raise
+            except Exception as e:
+                logger.warning(f"Erro na busca por artigo; usando busca vetorial: {e}")
+
+        from app.services.embedding_service import embedding_service
+        query_embedding = embedding_service.embed_query(query)
+        return self.search_areas(query_embedding, legal_areas, match_count)
+
+    async def asearch_query(self, query: str, legal_areas: List[str], match_count: int = 10) -> List[dict]:
+        """Versão assíncrona de `search_query`."""
+        target = self._article_lookup_target(query, legal_areas)
+        if target:
+            try:
+                article_query, areas = target
+                rows = select_rows(
+                    article_query, await self.alookup_articles(article_query.identifiers, areas, match_count), legal_areas
+                )
+                if rows:
+                    logger.info(f"Busca por artigo resolvida sem embedding: {article_query.identifiers} em {areas}")
+                    return rows
+            except DeadlineExceeded:
+                # Sem orçamento de recuperação, a busca vetorial também não caberia
+                raise
+            except Exception as e:
+                logger.warning(f"Erro na busca por artigo; usando busca vetorial: {e}")
+
+        from app.services.embedding_service import embedding_service
+        query_embedding = await embedding_service.aembed_query(query)
+        return await self.asearch_areas(query_embedding, legal_areas, match_count)
 
     def list_available_areas(self) -> List[str]:
         """Lista áreas jurídicas com retrievers configurados."""
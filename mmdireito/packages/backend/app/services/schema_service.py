@@ -0,0 +1,263 @@
+# app/services/schema_service.py
+"""
+Registro versionado das funções SQL e alterações de esquema aplicadas via `exec_sql`.
+
+Cada migração tem um nome estável e um checksum do SQL. A tabela
+`dir_schema_migrations` guarda o checksum aplicado; no boot, apenas migrações
+novas ou cujo SQL mudou são executadas, então o cold start não paga por DDL
+inalterado. As funções de busca começam com `DROP FUNCTION IF EXISTS`: o
+`CREATE OR REPLACE` não aceita mudar as colunas retornadas.
+"""
+import asyncio
+import hashlib
+from typing import Dict, List, NamedTuple
+
+from app.logger_config import logger
+from app.services.supabase_service import SupabaseService, supabase_service
+
+MIGRATIONS_TABLE = "dir_schema_migrations"
+
+# Criação da tabela de registro; o NOTIFY faz o PostgREST enxergar a tabela nova
+MIGRATIONS_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+  name text PRIMARY KEY,
+  checksum text NOT NULL,
+  applied_at timestamptz NOT NULL DEFAULT now()
+);
+NOTIFY pgrst, 'reload schema';
+"""
+
+
+class Migration(NamedTuple):
+    """SQL idempotente identificado por um nome estável."""
+    name: str
+    sql: str
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.strip().encode("utf-8")).hexdigest()
+
+
+def area_match_function_name(area: str) -> str:
+    return f"match_documents_{area}_area"
+
+
+def area_match_function_migration(area: str) -> Migration:
+    """Função de busca vetorial restrita a uma área jurídica."""
+    function_name = area_match_function_name(area)
+    return Migration(function_name, f"""
+DROP FUNCTION IF EXISTS {function_name}(vector, int);
+CREATE OR REPLACE FUNCTION {function_name}(
+  query_embedding vector(384),
+  match_count int DEFAULT 10
+)
+RETURNS TABLE(
+  id bigint,
+  content text,
+  document_id bigint,
+  chunk_index int,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    chunks.id,
+    chunks.content,
+    chunks.document_id::bigint,
+    chunks.chunk_index::int,
+    (chunks.embedding <=> query_embedding) * -1 + 1 AS similarity
+  FROM dir_knowledge_base_chunks chunks
+  INNER JOIN dir_knowledge_base kb ON chunks.document_id = kb.id
+  WHERE
+    kb.legal_area = '{area}'
+  ORDER BY chunks.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION {function_name} TO anon, authenticated;
+""")
+
+
+def multi_area_function_migration(function_name: str) -> Migration:
+    """Função de busca multi-área: top-k global em uma única consulta."""
+    return Migration(function_name, f"""
+DROP FUNCTION IF EXISTS {function_name}(vector, text[], int);
+CREATE OR REPLACE FUNCTION {function_name}(
+  query_embedding vector(384),
+  filter_areas text[],
+  match_count int DEFAULT 10
+)
+RETURNS TABLE(
+  id bigint,
+  content text,
+  legal_area text,
+  document_id bigint,
+  chunk_index int,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    chunks.id,
+    chunks.content,
+    kb.legal_area::text,
+    chunks.document_id::bigint,
+    chunks.chunk_index::int,
+    (chunks.embedding <=> query_embedding) * -1 + 1 AS similarity
+  FROM dir_knowledge_base_chunks chunks
+  INNER JOIN dir_knowledge_base kb ON chunks.document_id = kb.id
+  WHERE
+    kb.legal_area = ANY(filter_areas)
+  ORDER BY chunks.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION {function_name} TO anon, authenticated;
+""")
+
+
+# Identificadores de artigos/parágrafos por chunk (ver app/services/article_index.py)
+ARTICLES_SCHEMA_MIGRATION = Migration("knowledge_base_articles", """
+ALTER TABLE dir_knowledge_base_chunks ADD COLUMN IF NOT EXISTS articles text[];
+CREATE INDEX IF NOT EXISTS dir_knowledge_base_chunks_articles_idx
+  ON dir_knowledge_base_chunks USING gin (articles);
+""")
+
+
+# Versão do conteúdo de cada área, trocada a cada reindexação (invalida caches de respostas)
+KNOWLEDGE_BASE_VERSIONS_MIGRATION = Migration("knowledge_base_versions", """
+CREATE TABLE IF NOT EXISTS dir_knowledge_base_versions (
+  legal_area text PRIMARY KEY,
+  version text NOT NULL,
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+NOTIFY pgrst, 'reload schema';
+""")
+
+
+def article_lookup_function_migration(function_name: str) -> Migration:
+    """Busca exata por identificadores de artigo; o primeiro identificador tem prioridade."""
+    return Migration(function_name, f"""
+DROP FUNCTION IF EXISTS {function_name}(text[], text[], int);
+CREATE OR REPLACE FUNCTION {function_name}(
+  filter_areas text[],
+  article_ids text[],
+  match_count int DEFAULT 10
+)
+RETURNS TABLE(
+  id bigint,
+  content text,
+  legal_area text,
+  articles text[],
+  document_id bigint,
+  chunk_index int,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    chunks.id,
+    chunks.content,
+    kb.legal_area::text,
+    chunks.articles,
+    chunks.document_id::bigint,
+    chunks.chunk_index::int,
+    1.0::float AS similarity
+  FROM dir_knowledge_base_chunks chunks
+  INNER JOIN dir_knowledge_base kb ON chunks.document_id = kb.id
+  WHERE
+    kb.legal_area = ANY(filter_areas)
+    AND chunks.articles && article_ids
+  ORDER BY (chunks.articles && article_ids[1:1]) DESC, chunks.id
+  LIMIT match_count;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION {function_name} TO anon, authenticated;
+""")
+
+
+class SchemaService:
+    """Aplica migrações pendentes e registra os checksums aplicados."""
+
+    def __init__(self, supabase: SupabaseService = supabase_service):
+        self.supabase = supabase
+        self._applied: Dict[str, str] = {}
+        self._loaded = False
+
+    def _load_applied(self) -> Dict[str, str]:
+        """Lê os checksums já aplicados (uma consulta por processo)."""
+        if self._loaded:
+            return self._applied
+        client = self.supabase.client
+        try:
+            result = client.table(MIGRATIONS_TABLE).select("name, checksum").execute()
+        except Exception as e:
+            logger.info(f"Registro de migrações indisponível ({e}); criando {MIGRATIONS_TABLE}")
+            client.rpc("exec_sql", {"query": MIGRATIONS_TABLE_SQL}).execute()
+            result = None
+        self._applied = {row["name"]: row["checksum"] for row in (result.data if result else [])}
+        self._loaded = True
+        return self._applied
+
+    def _apply_one(self, migration: Migration) -> None:
+        client = self.supabase.client
+        client.rpc("exec_sql", {"query": migration.sql}).execute()
+        client.table(MIGRATIONS_TABLE).upsert(
+            {"name": migration.name, "checksum": migration.checksum}
+        ).execute()
+        self._applied[migration.name] = migration.checksum
+
+    def pending(self, migrations: List[Migration]) -> List[Migration]:
+        """Migrações novas ou cujo SQL mudou desde a última aplicação."""
+        applied = self._load_applied()
+        return [m for m in migrations if applied.get(m.name) != m.checksum]
+
+    def apply(self, migrations: List[Migration]) -> dict:
+        """Aplica as migrações pendentes em sequência; falhas não interrompem as demais."""
+        pending = self.pending(migrations)
+        failed = []
+        for migration in pending:
+            try:
+                self._apply_one(migration)
+                logger.info(f"Migração aplicada: {migration.name}")
+            except Exception as e:
+                failed.append(migration.name)
+                logger.warning(f"Erro ao aplicar a migração {migration.name}: {e}")
+        return self._summary(migrations, pending, failed)
+
+    async def aapply(self, migrations: List[Migration]) -> dict:
+        """Aplica as migrações pendentes concorrentemente (são independentes entre si)."""
+        pending = await asyncio.to_thread(self.pending, migrations)
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self._apply_one, migration) for migration in pending),
+            return_exceptions=True
+        )
+        failed = []
+        for migration, result in zip(pending, results):
+            if isinstance(result, Exception):
+                failed.append(migration.name)
+                logger.warning(f"Erro ao aplicar a migração {migration.name}: {result}")
+            else:
+                logger.info(f"Migração aplicada: {migration.name}")
+        return self._summary(migrations, pending, failed)
+
+    @staticmethod
+    def _summary(migrations: List[Migration], pending: List[Migration], failed: List[str]) -> dict:
+        return {
+            "applied": [m.name for m in pending if m.name not in failed],
+            "skipped": len(migrations) - len(pending),
+            "failed": failed,
+        }
+
+
+# Instância global do serviço
+schema_service = SchemaService()
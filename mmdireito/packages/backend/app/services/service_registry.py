@@ -0,0 +1,77 @@
+# app/services/service_registry.py
+"""
+Registro de serviços instanciados sob demanda.
+
+Os módulos dos agentes constroem clientes do Gemini, carregam prompts e puxam
+FAISS e boa parte do LangChain ao serem importados. Aqui cada serviço é
+registrado pelo caminho "módulo:atributo" e só é importado no primeiro uso, então
+o cold start da aplicação não paga pelos agentes que a requisição não usa.
+"""
+import importlib
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class ServiceRegistry:
+    """Mapeia nomes para serviços importados e guardados no primeiro acesso."""
+
+    def __init__(self):
+        self._targets: Dict[str, str] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, target: str) -> None:
+        """Registra um serviço pelo caminho 'pacote.modulo:atributo'."""
+        self._targets[name] = target
+
+    def get(self, name: str) -> Any:
+        """Retorna o serviço, importando seu módulo na primeira chamada."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                module_name, _, attribute = self._targets[name].partition(":")
+                instance = getattr(importlib.import_module(module_name), attribute)
+                self._instances[name] = instance
+        return instance
+
+    def get_if_loaded(self, name: str) -> Optional[Any]:
+        """Retorna o serviço apenas se ele já foi instanciado (útil no shutdown)."""
+        return self._instances.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._targets)
+
+    def loaded(self) -> List[str]:
+        return list(self._instances)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._targets
+
+
+# Registro dos agentes: é também a lista de nomes aceitos pelas rotas
+# /agent/chat/{agent_name}, então só agentes entram aqui
+services = ServiceRegistry()
+
+services.register("contract-analyzer", "app.services.contract_chat_service:contract_chat_service")
+services.register("devil-advocate", "app.services.devil_advocate_service:devil_advocate_service")
+services.register("agente-civil", "app.services.civil_agent_service:civil_agent_service")
+services.register("agente-penal", "app.services.penal_agent_service:penal_agent_service")
+
+AGENT_NAMES = services.names()
+
+# Serviços de apoio carregados apenas pelos agentes (fora do registro exposto nas rotas)
+support_services = ServiceRegistry()
+support_services.register("history_manager", "app.services.history_manager:history_manager")
+
+# Modelo do Gemini usado por cada agente (bulkheads por modelo do controle de admissão);
+# mantenha em sincronia com os serviços, que não são importados aqui
+AGENT_MODELS = {
+    "contract-analyzer": "gemini-2.5-pro",
+    "devil-advocate": "gemini-2.5-flash",
+    "agente-civil": "gemini-2.5-flash",
+    "agente-penal": "gemini-2.0-flash-exp",
+}
@@ -0,0 +1,440 @@
+# app/services/session_store.py
+"""
+Armazenamento de sessões compartilhado por todos os agentes.
+
+Cada sessão é identificada pelo par (agente, session_id) e guarda o histórico de
+chat, metadados serializáveis (por exemplo, a chave do índice do contrato) e
+objetos transitórios, como o retriever do contrato. A memória é limitada por
+número de sessões, por tamanho estimado e por tempo ocioso; sessões frias saem
+da RAM, mas são gravadas no backend persistente (SQLite ou Redis) e reidratadas
+no próximo acesso.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+from app.config import settings
+from app.logger_config import logger
+
+SessionKey = Tuple[str, str]
+
+
+class SessionBackend:
+    """Interface dos backends persistentes de sessões."""
+
+    def load(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def save(self, key: str, data: dict) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class NullSessionBackend(SessionBackend):
+    """Sem persistência: sessões removidas da memória são descartadas."""
+
+    def load(self, key: str) -> Optional[dict]:
+        return None
+
+    def save(self, key: str, data: dict) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Persistência local em SQLite, adequada para uma única instância."""
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # Remove sessões persistidas que já passaram do prazo de retenção
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl_seconds,))
+            self._conn.commit()
+
+    def load(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time() - self.ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    def save(self, key: str, data: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (key, data, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(data), time.time())
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisSessionBackend(SessionBackend):
+    """Persistência em Redis (ou compatível), compartilhada entre instâncias."""
+
+    def __init__(self, url: str, ttl_seconds: float, prefix: str = "mmdireito:session:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("O backend de sessões 'redis' requer o pacote 'redis' instalado") from e
+        self._client = redis.Redis.from_url(url)
+        self.ttl_seconds = int(ttl_seconds)
+        self.prefix = prefix
+
+    def load(self, key: str) -> Optional[dict]:
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def save(self, key: str, data: dict) -> None:
+        self._client.set(self.prefix + key, json.dumps(data), ex=self.ttl_seconds)
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self.prefix + key)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class Session:
+    """Dados de uma sessão em memória."""
+
+    def __init__(self, history: ChatMessageHistory = None, metadata: Dict[str, Any] = None):
+        self.history = history or ChatMessageHistory()
+        # Dados serializáveis, gravados junto com o histórico
+        self.metadata: Dict[str, Any] = metadata or {}
+        # Objetos que não vão para o backend (retrievers, índices etc.)
+        self.transient: Dict[str, Any] = {}
+        self.last_access = time.monotonic()
+        # Estimativa de tamanho memorizada; refeita só quando mensagens/objetos mudam
+        self._size_signature: Optional[tuple] = None
+        self._message_bytes = 0
+        self._transient_bytes = 0
+
+    def estimate_bytes(self) -> int:
+        """
+        Estimativa do espaço ocupado pela sessão (mensagens + índices FAISS).
+
+        Mensagens acrescentadas à mesma lista são somadas de forma incremental; a
+        troca da lista (resumo, clear) ou dos objetos transitórios refaz a conta.
+        """
+        messages = self.history.messages
+        transient_ids = tuple(id(value) for value in self.transient.values())
+        signature = (id(messages), len(messages), transient_ids)
+        previous = self._size_signature
+        if signature != previous:
+            if previous and previous[0] == signature[0] and previous[1] <= signature[1]:
+                self._message_bytes += sum(_message_bytes(message) for message in messages[previous[1]:])
+            else:
+                self._message_bytes = sum(_message_bytes(message) for message in messages)
+            if not previous or previous[2] != transient_ids:
+                self._transient_bytes = sum(_estimate_object_bytes(value) for value in self.transient.values())
+            self._size_signature = signature
+        return sys.getsizeof(self.metadata) + self._message_bytes + self._transient_bytes
+
+    def to_dict(self) -> dict:
+        return {"messages": messages_to_dict(self.history.messages), "metadata": dict(self.metadata)}
+
+    def revision(self) -> tuple:
+        """Identifica o estado gravável da sessão, para saber se mudou desde uma cópia."""
+        messages = self.history.messages
+        return id(messages), len(messages), sorted(self.metadata.items())
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        history = ChatMessageHistory(messages=messages_from_dict(data.get("messages", [])))
+        return cls(history=history, metadata=data.get("metadata", {}))
+
+
+def _message_bytes(message) -> int:
+    content = message.content
+    return len(content.encode("utf-8")) if isinstance(content, str) else sys.getsizeof(content)
+
+
+def _estimate_object_bytes(value: Any) -> int:
+    # Retrievers FAISS: vetores float32 do índice; demais objetos, o tamanho raso
+    retrievers = getattr(value, "retrievers", None)
+    if retrievers:
+        return sum(_estimate_object_bytes(retriever) for retriever in retrievers)
+    vectorstore = getattr(value, "vectorstore", None)
+    index = getattr(vectorstore, "index", None)
+    if index is not None and hasattr(index, "ntotal"):
+        return index.ntotal * index.d * 4
+    return sys.getsizeof(value)
+
+
+class SessionStore:
+    """
+    Sessões de todos os agentes com remoção LRU, por TTL ocioso e por tamanho.
+
+    As sessões ficam em um OrderedDict na ordem do último acesso; a cada acesso
+    as sessões mais antigas que passaram do TTL (ou que excedem os limites) são
+    retiradas da memória e gravadas no backend.
+
+    O tamanho total é mantido incrementalmente (cada sessão é reestimada quando
+    acessada) e a gravação no backend roda em uma thread própria, fora do lock
+    e do event loop; enquanto a gravação não termina, a sessão fica em
+    `_pending` e um novo acesso a recupera de lá.
+    """
+
+    def __init__(
+        self,
+        backend: SessionBackend,
+        max_sessions: int = settings.SESSION_MAX_SESSIONS,
+        idle_ttl: float = settings.SESSION_IDLE_TTL_SECONDS,
+        max_bytes: int = settings.SESSION_MAX_BYTES,
+    ):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[SessionKey, Session]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Tamanho estimado de cada sessão em memória e o total
+        self._bytes: Dict[SessionKey, int] = {}
+        self._total_bytes = 0
+        # Sessões retiradas da memória cuja gravação ainda não terminou
+        self._pending: Dict[SessionKey, Session] = {}
+        # Uma única thread de escrita mantém a ordem das gravações e remoções
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-writer")
+
+        self.created = 0
+        self.rehydrated = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _backend_key(key: SessionKey) -> str:
+        return f"{key[0]}:{key[1]}"
+
+    def get(self, agent: str, session_id: str) -> Session:
+        """Obtém a sessão da memória, do backend persistente ou cria uma nova."""
+        key = (agent, session_id)
+        with self._lock:
+            session = self._cached(key)
+            if session is not None:
+                return session
+
+        # Leitura do backend fora do lock
+        loaded = self._load(key)
+
+        with self._lock:
+            # Outra requisição pode ter trazido a sessão enquanto o backend era lido
+            session = self._cached(key)
+            if session is not None:
+                return session
+
+            if loaded is None:
+                session = Session()
+                self.created += 1
+                logger.info(f"Nova sessão criada para {agent}: {session_id}")
+            else:
+                session = loaded
+                self.rehydrated += 1
+                logger.info(f"Sessão {session_id} de {agent} restaurada do armazenamento persistente")
+            return self._admit(key, session)
+
+    def _cached(self, key: SessionKey) -> Optional[Session]:
+        # Chamado sob o lock: sessão em memória ou ainda sendo gravada
+        session = self._sessions.get(key)
+        if session is not None:
+            self._sessions.move_to_end(key)
+            session.last_access = time.monotonic()
+            self._track(key, session)
+            self._evict()
+            return session
+        session = self._pending.get(key)
+        if session is not None:
+            return self._admit(key, session)
+        return None
+
+    def _admit(self, key: SessionKey, session: Session) -> Session:
+        session.last_access = time.monotonic()
+        self._sessions[key] = session
+        self._track(key, session)
+        self._evict(keep=key)
+        return session
+
+    def _track(self, key: SessionKey, session: Session) -> None:
+        size = session.estimate_bytes()
+        self._total_bytes += size - self._bytes.get(key, 0)
+        self._bytes[key] = size
+
+    def _untrack(self, key: SessionKey) -> None:
+        self._total_bytes -= self._bytes.pop(key, 0)
+
+    def get_history(self, agent: str, session_id: str) -> ChatMessageHistory:
+        """Atalho para o histórico de chat da sessão."""
+        return self.get(agent, session_id).history
+
+    def delete(self, agent: str, session_id: str) -> bool:
+        """Remove a sessão da memória e do backend persistente."""
+        key = (agent, session_id)
+        with self._lock:
+            existed = self._sessions.pop(key, None) is not None
+            existed = self._pending.pop(key, None) is not None or existed
+            self._untrack(key)
+
+        def remove() -> bool:
+            try:
+                found = self.backend.load(self._backend_key(key)) is not None
+                self.backend.delete(self._backend_key(key))
+                return found
+            except Exception as e:
+                logger.warning(f"Falha ao remover a sessão {session_id} do backend persistente: {e}")
+                return False
+
+        # Na thread de escrita, depois de qualquer gravação pendente da mesma sessão
+        return self._writer.submit(remove).result() or existed
+
+    def count(self, agent: str = None) -> int:
+        """Número de sessões em memória (de um agente ou de todos)."""
+        with self._lock:
+            if agent is None:
+                return len(self._sessions)
+            return sum(1 for key in self._sessions if key[0] == agent)
+
+    def _load(self, key: SessionKey) -> Optional[Session]:
+        try:
+            data = self.backend.load(self._backend_key(key))
+        except Exception as e:
+            logger.warning(f"Falha ao ler a sessão {key[1]} do backend persistente: {e}")
+            return None
+        return Session.from_dict(data) if data else None
+
+    def _persist(self, key: SessionKey, data: dict) -> None:
+        try:
+            self.backend.save(self._backend_key(key), data)
+        except Exception as e:
+            logger.warning(f"Falha ao persistir a sessão {key[1]} de {key[0]}: {e}")
+
+    def _write(self, key: SessionKey, session: Session) -> None:
+        # Executado na thread de escrita. A cópia é feita aqui, sob o lock, e não na
+        # remoção da memória: uma requisição em andamento ainda pode acrescentar um
+        # turno à sessão, e nesse caso ela é gravada de novo antes de sair de `_pending`
+        while True:
+            with self._lock:
+                if self._pending.get(key) is not session:
+                    # Removida (delete) enquanto aguardava a gravação
+                    return
+                revision = session.revision()
+                data = session.to_dict()
+            self._persist(key, data)
+            with self._lock:
+                if self._pending.get(key) is not session:
+                    return
+                if session.revision() == revision:
+                    del self._pending[key]
+                    return
+
+    def _evict(self, keep: SessionKey = None) -> None:
+        # Chamado sob o lock; percorre a partir da sessão acessada há mais tempo
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if key == keep:
+                break
+            if session.last_access >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            self._remove_to_backend(key, session)
+
+        if self.max_bytes:
+            while self._sessions and self._total_bytes > self.max_bytes:
+                key, session = next(iter(self._sessions.items()))
+                if key == keep:
+                    break
+                self._remove_to_backend(key, session)
+
+    def _remove_to_backend(self, key: SessionKey, session: Session) -> None:
+        # A cópia dos dados e a escrita ficam para a thread de escrita
+        del self._sessions[key]
+        self._untrack(key)
+        self._pending[key] = session
+        self._writer.submit(self._write, key, session)
+        self.evicted += 1
+        logger.debug(f"Sessão {key[1]} de {key[0]} removida da memória")
+
+    def flush(self) -> None:
+        """Grava todas as sessões em memória no backend e espera as gravações (usado no shutdown)."""
+        with self._lock:
+            snapshot = [(key, session.to_dict()) for key, session in self._sessions.items()]
+        for key, data in snapshot:
+            self._writer.submit(self._persist, key, data)
+        self._writer.submit(lambda: None).result()
+
+    def shutdown(self) -> None:
+        self.flush()
+        self._writer.shutdown(wait=True)
+        self.backend.close()
+
+    def get_stats(self) -> dict:
+        """Ocupação e contadores do armazenamento de sessões."""
+        with self._lock:
+            per_agent: Dict[str, Dict[str, int]] = {}
+            for key, session in self._sessions.items():
+                self._track(key, session)
+                stats = per_agent.setdefault(key[0], {"sessions": 0, "bytes": 0})
+                stats["sessions"] += 1
+                stats["bytes"] += self._bytes[key]
+            return {
+                "backend": type(self.backend).__name__,
+                "in_memory": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl_seconds": self.idle_ttl,
+                "max_bytes": self.max_bytes,
+                "total_bytes": self._total_bytes,
+                "pending_writes": len(self._pending),
+                "agents": per_agent,
+                "created": self.created,
+                "rehydrated": self.rehydrated,
+                "evicted": self.evicted,
+            }
+
+
+def create_session_backend(kind: str = settings.SESSION_BACKEND) -> SessionBackend:
+    """Cria o backend persistente configurado em SESSION_BACKEND."""
+    if kind == "redis":
+        return RedisSessionBackend(settings.SESSION_REDIS_URL, settings.SESSION_PERSIST_TTL_SECONDS)
+    if kind == "sqlite":
+        try:
+            return SQLiteSessionBackend(settings.SESSION_SQLITE_PATH, settings.SESSION_PERSIST_TTL_SECONDS)
+        except (OSError, sqlite3.Error) as e:
+            # Ambientes com sistema de arquivos somente leitura (ex.: Vercel)
+            logger.warning(f"Backend SQLite de sessões indisponível ({e}); sessões ficarão apenas em memória")
+            return NullSessionBackend()
+    return NullSessionBackend()
+
+
+# Instância global do armazenamento de sessões
+session_store = SessionStore(create_session_backend())
@@ -0,0 +1,112 @@
+# app/services/single_flight.py
+"""
+Coalescência de chamadas idênticas em andamento ("single-flight").
+
+Quando várias requisições pedem a mesma coisa ao mesmo tempo (a mesma pergunta
+de uma turma inteira, por exemplo), só a primeira executa a chamada; as demais
+aguardam o resultado dela. Nada é guardado depois que a chamada termina: isso é
+papel dos caches. Há uma variante assíncrona (`do`) e uma para threads (`do_sync`).
+"""
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+def vector_key(vector) -> str:
+    """Chave compacta de um embedding, para compor chaves de chamadas."""
+    data = np.asarray(vector, dtype=np.float32).tobytes()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class _SyncCall:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Agrupa chamadas concorrentes com a mesma chave em uma única execução."""
+
+    def __init__(self, name: str):
+        self.name = name
+        # Futures por (event loop, chave): cada loop só aguarda as próprias tarefas
+        self._calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._sync_calls: Dict[Hashable, _SyncCall] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Executa `fn()` ou aguarda a execução em andamento com a mesma chave."""
+        call_key = (id(asyncio.get_running_loop()), key)
+        future = self._calls.get(call_key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[call_key] = future
+            self.executed += 1
+            future.add_done_callback(lambda done: self._finish(call_key, done))
+        else:
+            self.shared += 1
+        # shield: o cancelamento de quem espera não cancela a chamada dos demais
+        return await asyncio.shield(future)
+
+    def _finish(self, call_key: Tuple[int, Hashable], future: asyncio.Future) -> None:
+        if self._calls.get(call_key) is future:
+            del self._calls[call_key]
+        if not future.cancelled():
+            # Marca a exceção como lida mesmo que todos os interessados tenham desistido
+            future.exception()
+
+    def do_sync(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Versão para código síncrono: threads com a mesma chave aguardam a primeira."""
+        with self._lock:
+            call = self._sync_calls.get(key)
+            leader = call is None
+            if leader:
+                call = _SyncCall()
+                self._sync_calls[key] = call
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._sync_calls.pop(key, None)
+            call.event.set()
+
+    def get_stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls) + len(self._sync_calls),
+            "executed": self.executed,
+            "shared": self.shared,
+        }
+
+
+# Instâncias globais por tipo de chamada
+embedding_flight = SingleFlight("embedding")
+retrieval_flight = SingleFlight("retrieval")
+llm_flight = SingleFlight("llm")
+
+
+def get_stats() -> dict:
+    return {flight.name: flight.get_stats() for flight in (embedding_flight, retrieval_flight, llm_flight)}
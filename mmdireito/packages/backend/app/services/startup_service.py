@@ -0,0 +1,165 @@
+# app/services/startup_service.py
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.embedding_service import embedding_service
+from app.services.local_vector_index import LocalVectorIndex, LocalVectorRetriever
+from app.services.rag_health_service import rag_health_service
+from app.services.retriever_service import retriever_service, ARTICLE_FUNCTION_NAME, MULTI_AREA_FUNCTION_NAME
+from app.services.schema_service import (
+    ARTICLES_SCHEMA_MIGRATION,
+    KNOWLEDGE_BASE_VERSIONS_MIGRATION,
+    area_match_function_migration,
+    area_match_function_name,
+    article_lookup_function_migration,
+    multi_area_function_migration,
+    schema_service,
+)
+from app.services.supabase_service import supabase_service
+
+# Áreas jurídicas com retriever configurado no boot
+LEGAL_AREAS = {
+    'civil': 'Código Civil Brasileiro',
+    'penal': 'Código Penal Brasileiro',
+    'processual_penal': 'Código de Processo Penal Brasileiro'
+}
+
+
+class StartupTimer:
+    """Mede a duração de cada etapa do boot e gera o relatório final."""
+
+    def __init__(self):
+        self.steps: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def report(self) -> dict:
+        return {
+            "total_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            "steps_ms": dict(self.steps),
+        }
+
+
+class StartupService:
+    """
+    Boot da aplicação: pool do Supabase, migrações pendentes e retrievers por área.
+
+    As funções SQL passam pelo registro versionado (DDL inalterado é pulado) e
+    os retrievers das áreas são configurados concorrentemente.
+    """
+
+    def __init__(self):
+        self.last_report: dict = {}
+
+    def _load_local_retriever(self, area: str):
+        """Retriever sobre o índice local da área, se houver um compatível com o modelo atual."""
+        if not settings.LOCAL_INDEX_ENABLED or not LocalVectorIndex.exists(settings.LOCAL_INDEX_DIR, area):
+            return None
+        try:
+            index = LocalVectorIndex.load(settings.LOCAL_INDEX_DIR, area)
+        except Exception as e:
+            logger.warning(f"Índice local de '{area}' ignorado: {e}")
+            return None
+        if index.model != embedding_service.model_name:
+            logger.warning(f"Índice local de '{area}' gerado com outro modelo ({index.model}); usando o Supabase")
+            return None
+        retriever_service.set_local_index(area, index)
+        logger.info(f"Índice local carregado para área: {area} ({len(index)} chunks)")
+        return LocalVectorRetriever(index=index, embeddings=embedding_service, k=10)
+
+    def _build_area_retriever(self, area: str):
+        local_retriever = self._load_local_retriever(area)
+        if local_retriever is not None:
+            return local_retriever
+
+        from langchain_community.vectorstores import SupabaseVectorStore
+
+        # Vector store apoiado na função SQL específica da área
+        vector_store = SupabaseVectorStore(
+            client=supabase_service.client,
+            embedding=embedding_service,
+            table_name="dir_knowledge_base_chunks",
+            query_name=area_match_function_name(area),
+            chunk_size=1000
+        )
+        return vector_store.as_retriever(
+            search_type="similarity",
+            search_kwargs={"k": 10}
+        )
+
+    async def _setup_area(self, area: str, timer: StartupTimer) -> None:
+        with timer.step(f"retriever:{area}"):
+            try:
+                retriever = await asyncio.to_thread(self._build_area_retriever, area)
+                if retriever_service.set_retriever(area, retriever):
+                    logger.success(f"Retriever configurado para área: {area}")
+                else:
+                    logger.warning(f"Falha ao configurar retriever para área: {area}")
+            except Exception as e:
+                logger.error(f"Erro ao configurar retriever para área {area}: {e}")
+                retriever_service.set_retriever(area, None)
+
+    async def startup(self) -> dict:
+        """Executa o boot completo e retorna o relatório de tempos por etapa."""
+        timer = StartupTimer()
+        logger.info("Servidor iniciando... Configurando retrievers por área jurídica")
+
+        try:
+            with timer.step("supabase"):
+                # Cria os clientes síncrono e assíncrono do pool compartilhado (usado por todos os serviços)
+                await supabase_service.startup()
+                logger.info("Cliente Supabase configurado com sucesso")
+
+            with timer.step("migrations"):
+                migrations = [area_match_function_migration(area) for area in LEGAL_AREAS]
+                migrations.append(multi_area_function_migration(MULTI_AREA_FUNCTION_NAME))
+                migrations.append(ARTICLES_SCHEMA_MIGRATION)
+                migrations.append(article_lookup_function_migration(ARTICLE_FUNCTION_NAME))
+                migrations.append(KNOWLEDGE_BASE_VERSIONS_MIGRATION)
+                try:
+                    result = await schema_service.aapply(migrations)
+                    logger.info("Migrações verificadas", context=result)
+                except Exception as e:
+                    logger.warning(f"Não foi possível verificar as migrações: {e}")
+
+            with timer.step("retrievers"):
+                await asyncio.gather(*(self._setup_area(area, timer) for area in LEGAL_AREAS))
+
+            # Log das áreas disponíveis
+            available_areas = retriever_service.list_available_areas()
+            logger.info(f"Áreas jurídicas disponíveis: {available_areas}")
+
+            # Manter compatibilidade com código existente
+            civil_retriever = retriever_service.get_retriever('civil')
+            retriever_service.set_civil_code_retriever(civil_retriever)
+
+            logger.success("Servidor pronto com retrievers multi-área configurados")
+
+            # Aquecimento e diagnóstico do RAG em segundo plano (resultado em /health/rag)
+            rag_health_service.start_warmup()
+
+        except Exception as e:
+            logger.opt(exception=True).error(f"Erro na inicialização dos retrievers: {e}")
+            # Fallback: configurar retrievers como None
+            for area in LEGAL_AREAS:
+                retriever_service.set_retriever(area, None)
+            logger.warning("Sistema funcionará sem RAG devido a erro na inicialização")
+
+        self.last_report = timer.report()
+        logger.info("Relatório de inicialização", context=self.last_report)
+        return self.last_report
+
+
+# Instância global do serviço
+startup_service = StartupService()
@@ -0,0 +1,32 @@
+# app/services/streaming.py
+"""
+Utilitários compartilhados pelos agentes para o modo de resposta em streaming.
+"""
+
+
+def chunk_to_text(chunk) -> str:
+    """
+    Extrai o texto de um fragmento emitido por `astream`.
+
+    Os fragmentos podem ser strings (cadeias com StrOutputParser), AIMessageChunk
+    com `content` em texto ou, no caso do Gemini, uma lista de partes.
+    """
+    if chunk is None:
+        return ""
+    if isinstance(chunk, str):
+        return chunk
+
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, str):
+                parts.append(part)
+            elif isinstance(part, dict) and part.get("type") == "text":
+                parts.append(part.get("text", ""))
+        return "".join(parts)
+    if isinstance(content, dict):
+        return str(content.get("answer", ""))
+    return ""
@@ -0,0 +1,161 @@
+# app/services/supabase_service.py
+import asyncio
+import threading
+from typing import Optional
+
+import httpx
+from supabase import AsyncClient, Client, acreate_client, create_client
+from supabase.lib.client_options import AsyncClientOptions, SyncClientOptions
+
+from app.config import settings
+from app.logger_config import logger
+
+
+def _pool_snapshot(http_client, request_count: int) -> dict:
+    """Lê o estado do pool de conexões do httpx (via httpcore)."""
+    if http_client is None:
+        return {"open": False}
+
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {
+        "open": not http_client.is_closed,
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "requests": request_count,
+    }
+
+
+class SupabaseService:
+    """
+    Camada única de acesso ao Supabase/PostgREST para toda a aplicação.
+
+    Mantém um cliente síncrono (usado pelo SupabaseVectorStore e pelos scripts de
+    ingestão) e um assíncrono (usado nos handlers), ambos sobre clientes httpx com
+    keep-alive e limites de pool configuráveis, evitando um novo handshake TLS a
+    cada requisição.
+    """
+
+    def __init__(
+        self,
+        url: str = settings.SUPABASE_URL,
+        key: str = settings.SUPABASE_SERVICE_KEY,
+        pool_size: int = settings.SUPABASE_POOL_SIZE,
+        max_keepalive: int = settings.SUPABASE_POOL_KEEPALIVE,
+        keepalive_expiry: float = settings.SUPABASE_KEEPALIVE_EXPIRY,
+        timeout: float = settings.SUPABASE_TIMEOUT,
+        connect_timeout: float = settings.SUPABASE_CONNECT_TIMEOUT,
+    ):
+        self._url = url
+        self._key = key
+        self._limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+
+        self._client: Optional[Client] = None
+        self._async_client: Optional[AsyncClient] = None
+        self._http_client: Optional[httpx.Client] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+
+        self._lock = threading.Lock()
+        self._async_lock: Optional[asyncio.Lock] = None
+        self._request_counts = {"sync": 0, "async": 0}
+
+    # --- Contadores de requisições (para as estatísticas do pool) --- #
+
+    def _count_sync_request(self, request: httpx.Request) -> None:
+        self._request_counts["sync"] += 1
+
+    async def _count_async_request(self, request: httpx.Request) -> None:
+        self._request_counts["async"] += 1
+
+    # --- Clientes --- #
+
+    @property
+    def client(self) -> Client:
+        """Cliente síncrono compartilhado, criado na primeira utilização."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._http_client = httpx.Client(
+                        limits=self._limits,
+                        timeout=self._timeout,
+                        http2=True,
+                        event_hooks={"request": [self._count_sync_request]},
+                    )
+                    self._client = create_client(
+                        self._url,
+                        self._key,
+                        options=SyncClientOptions(httpx_client=self._http_client),
+                    )
+                    logger.info("Cliente Supabase síncrono criado com pool compartilhado")
+        return self._client
+
+    async def get_async_client(self) -> AsyncClient:
+        """Cliente assíncrono compartilhado, criado na primeira utilização."""
+        if self._async_client is None:
+            if self._async_lock is None:
+                self._async_lock = asyncio.Lock()
+            async with self._async_lock:
+                if self._async_client is None:
+                    self._async_http_client = httpx.AsyncClient(
+                        limits=self._limits,
+                        timeout=self._timeout,
+                        http2=True,
+                        event_hooks={"request": [self._count_async_request]},
+                    )
+                    self._async_client = await acreate_client(
+                        self._url,
+                        self._key,
+                        options=AsyncClientOptions(httpx_client=self._async_http_client),
+                    )
+                    logger.info("Cliente Supabase assíncrono criado com pool compartilhado")
+        return self._async_client
+
+    # --- Ciclo de vida --- #
+
+    async def startup(self) -> None:
+        """Cria os clientes antecipadamente (chamado no lifespan da aplicação)."""
+        _ = self.client
+        await self.get_async_client()
+        logger.info(
+            "Pool Supabase pronto",
+            context={
+                "max_connections": self._limits.max_connections,
+                "max_keepalive": self._limits.max_keepalive_connections,
+                "timeout_s": self._timeout.read,
+            }
+        )
+
+    async def shutdown(self) -> None:
+        """Fecha os pools de conexão."""
+        logger.info("Encerrando pool Supabase", context=self.get_pool_stats())
+        if self._async_http_client is not None:
+            await self._async_http_client.aclose()
+        if self._http_client is not None:
+            self._http_client.close()
+        self._client = None
+        self._async_client = None
+        self._http_client = None
+        self._async_http_client = None
+
+    def get_pool_stats(self) -> dict:
+        """Estatísticas dos pools síncrono e assíncrono, para ajuste de capacidade."""
+        return {
+            "limits": {
+                "max_connections": self._limits.max_connections,
+                "max_keepalive_connections": self._limits.max_keepalive_connections,
+                "keepalive_expiry_s": self._limits.keepalive_expiry,
+            },
+            "sync": _pool_snapshot(self._http_client, self._request_counts["sync"]),
+            "async": _pool_snapshot(self._async_http_client, self._request_counts["async"]),
+        }
+
+
+# Instância global do serviço
+supabase_service = SupabaseService()
@@ -0,0 +1,109 @@
+# app/services/token_usage.py
+"""
+Contagem dos tokens do Gemini.
+
+O `get_openai_callback` do LangChain só reconhece modelos da OpenAI e devolvia
+zero para o Gemini. Este callback lê o `usage_metadata` das mensagens geradas
+(presente também no stream, agregado ao final), alimenta as métricas por agente
+e modelo e soma o uso no `TokenUsage` aberto com `track_token_usage()`, quando
+houver um.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.services.metrics import LLM_CALL_SECONDS, LLM_CALLS, LLM_TOKENS, current_agent
+
+
+class TokenUsage:
+    """Tokens acumulados no bloco de `track_token_usage()`."""
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.calls += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "llm_calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.total_tokens,
+        }
+
+
+_current_usage: contextvars.ContextVar[Optional[TokenUsage]] = contextvars.ContextVar("token_usage", default=None)
+
+
+@contextmanager
+def track_token_usage():
+    """Soma os tokens das chamadas ao LLM feitas dentro do bloco."""
+    usage = TokenUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+def _usage_of(response: LLMResult) -> tuple:
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    return input_tokens, output_tokens
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Registra os tokens de cada chamada do modelo de chat."""
+
+    # Executa no contexto da chamada, para ler o agente e o acumulador atuais
+    run_inline = True
+
+    def __init__(self):
+        # Modelo e início de cada chamada em andamento
+        self._runs: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs) -> None:
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("kwargs", {}).get("model", "unknown")
+        self._runs[run_id] = (str(model).removeprefix("models/"), time.perf_counter())
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        model, started = self._runs.pop(run_id, ("unknown", None))
+        input_tokens, output_tokens = _usage_of(response)
+        agent = current_agent.get()
+        if started is not None:
+            LLM_CALL_SECONDS.observe(time.perf_counter() - started, agent=agent, model=model)
+        LLM_CALLS.inc(agent=agent, model=model)
+        LLM_TOKENS.inc(input_tokens, agent=agent, model=model, type="input")
+        LLM_TOKENS.inc(output_tokens, agent=agent, model=model, type="output")
+        usage = _current_usage.get()
+        if usage is not None:
+            usage.add(input_tokens, output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._runs.pop(run_id, None)
+
+
+# Instância global do callback (passada aos clientes do Gemini)
+token_usage_callback = TokenUsageCallback()
@@ -0,0 +1,116 @@
+# app/services/upload_job_service.py
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.file_processing_service import extract_pages_from_bytes
+
+
+class UploadJob:
+    """Estado de um processamento de contrato em segundo plano."""
+
+    def __init__(self, session_id: str, filename: str):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.filename = filename
+        self.status = "queued"
+        self.stage = "Aguardando processamento"
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def update(self, status: str = None, stage: str = None, progress: float = None, error: str = None) -> None:
+        if status is not None:
+            self.status = status
+        if stage is not None:
+            self.stage = stage
+        if progress is not None:
+            self.progress = progress
+        if error is not None:
+            self.error = error
+        self.updated_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "session_id": self.session_id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 2),
+            "error": self.error,
+        }
+
+
+class UploadJobService:
+    """
+    Fila de processamento de contratos em segundo plano.
+
+    O endpoint de upload apenas valida e enfileira o arquivo; extração, divisão,
+    embeddings e construção do índice FAISS rodam em um pool de threads fora do
+    event loop. O retriever só é associado à sessão quando a indexação termina.
+    """
+
+    def __init__(self, max_workers: int = settings.UPLOAD_JOB_WORKERS, job_ttl: float = settings.UPLOAD_JOB_TTL_SECONDS):
+        self.job_ttl = job_ttl
+        self._jobs: Dict[str, UploadJob] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload-job")
+
+    def submit(self, session_id: str, filename: str, content: bytes, content_type: str) -> UploadJob:
+        """Registra um novo job e o coloca na fila de processamento."""
+        job = UploadJob(session_id, filename)
+        with self._lock:
+            self._prune_finished()
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, content, content_type)
+        logger.info(f"Job de upload {job.job_id} enfileirado para a sessão {session_id} ({filename})")
+        return job
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        """Retorna o job, se ainda estiver registrado."""
+        return self._jobs.get(job_id)
+
+    def _run(self, job: UploadJob, content: bytes, content_type: str) -> None:
+        started = time.perf_counter()
+        try:
+            job.update(status="processing", stage="Extraindo texto do arquivo", progress=0.1)
+            pages = extract_pages_from_bytes(content, content_type, job.filename)
+            text = "\n".join(page.text for page in pages)
+
+            job.update(stage="Indexando o contrato", progress=0.4)
+            # Importado aqui para manter o LangChain/FAISS fora do import da aplicação
+            from app.services.contract_chat_service import setup_retriever_for_session
+            setup_retriever_for_session(job.session_id, text)
+
+            job.update(status="completed", stage="Contrato pronto para análise", progress=1.0)
+            logger.bind(
+                context={"pages": len(pages), "elapsed_s": round(time.perf_counter() - started, 2)}
+            ).info(f"Job de upload {job.job_id} concluído para a sessão {job.session_id}")
+        except Exception as e:
+            logger.opt(exception=True).error(f"Job de upload {job.job_id} falhou para a sessão {job.session_id}: {e}")
+            job.update(status="failed", stage="Falha no processamento", error=str(e))
+
+    def _prune_finished(self) -> None:
+        # Remove jobs finalizados há mais de `job_ttl` segundos (chamado sob o lock)
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.updated_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        """Encerra o pool, aguardando os jobs em andamento."""
+        self._executor.shutdown(wait=True)
+
+
+# Instância global do serviço
+upload_job_service = UploadJobService()
@@ -0,0 +1,8 @@
+"""
+Benchmarks de carga offline.
+
+A aplicação roda contra substitutos locais e determinísticos do Gemini (chat e
+embeddings) e do Supabase (tabelas e funções de busca em memória), com latências
+configuráveis, então throughput e latência podem ser medidos sem consumir cota
+nem tocar no banco. Veja `benchmarks/load_test.py`.
+"""
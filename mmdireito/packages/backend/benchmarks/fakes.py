@@ -0,0 +1,603 @@
+# benchmarks/fakes.py
+"""
+Substitutos locais do Gemini e do Supabase para os benchmarks.
+
+- `FakeChatModel`: modelo de chat do LangChain com tempo até o primeiro token,
+  tempo por token e tamanho da resposta configuráveis; responde também em stream
+  e preenche o `usage_metadata`, como o Gemini.
+- `FakeEmbeddings`: embeddings determinísticos (bag-of-words com hashing), de
+  modo que perguntas parecidas recuperam os mesmos trechos.
+- `InMemorySupabase`: as tabelas usadas pela aplicação e as funções de busca
+  (`match_documents_*`) em memória, sobre um corpus sintético por área jurídica.
+
+As latências seguem uma log-normal em torno do valor base (semente fixa), para
+que a cauda exista e o hedging, os prazos e o controle de admissão trabalhem como
+em produção. `install()` coloca os substitutos no lugar dos clientes reais antes
+de os agentes serem importados.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, ClassVar, Dict, Iterator, List, Optional
+
+import httpx
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+EMBEDDING_DIMENSIONS = 768
+
+# Vocabulário do corpus sintético e das respostas
+AREA_VOCABULARY = {
+    "civil": (
+        "contrato obrigação posse propriedade prescrição decadência herança sucessão locação "
+        "usufruto servidão indenização dano responsabilidade civil família casamento divórcio "
+        "alimentos guarda doação compra venda empreitada mandato fiança penhor hipoteca"
+    ).split(),
+    "penal": (
+        "furto roubo homicídio lesão corporal estelionato receptação pena reclusão detenção "
+        "multa dolo culpa agravante atenuante tentativa consumação legítima defesa "
+        "prescrição punibilidade concurso crimes reincidência peculato corrupção"
+    ).split(),
+    "processual_penal": (
+        "inquérito denúncia queixa ação penal prisão preventiva flagrante temporária fiança "
+        "habeas corpus recurso apelação citação intimação prova testemunha perícia "
+        "competência jurisdição nulidade sentença júri audiência"
+    ).split(),
+}
+COMMON_VOCABULARY = (
+    "o a de do da que se no na por com para ser caso lei artigo parte juiz prazo "
+    "quando salvo hipótese disposto termos forma pessoa direito dever"
+).split()
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class FakeProfile:
+    """Latências e tamanhos usados pelos substitutos (todos em segundos ou tokens)."""
+
+    def __init__(
+        self,
+        llm_first_token_seconds: float = 0.6,
+        llm_token_seconds: float = 0.01,
+        llm_output_tokens: int = 250,
+        llm_chunk_tokens: int = 8,
+        embedding_seconds: float = 0.08,
+        embedding_item_seconds: float = 0.002,
+        db_seconds: float = 0.03,
+        jitter: float = 0.25,
+        corpus_articles: int = 300,
+        seed: int = 42,
+    ):
+        self.llm_first_token_seconds = llm_first_token_seconds
+        self.llm_token_seconds = llm_token_seconds
+        self.llm_output_tokens = llm_output_tokens
+        self.llm_chunk_tokens = llm_chunk_tokens
+        self.embedding_seconds = embedding_seconds
+        self.embedding_item_seconds = embedding_item_seconds
+        self.db_seconds = db_seconds
+        self.jitter = jitter
+        self.corpus_articles = corpus_articles
+        self.seed = seed
+        self._random = random.Random(seed)
+
+    # Opções de linha de comando (compartilhadas pelo servidor e pelo load test)
+    OPTIONS = {
+        "llm_first_token_seconds": (float, "Tempo até o primeiro token do LLM"),
+        "llm_token_seconds": (float, "Tempo por token gerado pelo LLM"),
+        "llm_output_tokens": (int, "Tokens de cada resposta do LLM"),
+        "llm_chunk_tokens": (int, "Tokens por pedaço no stream do LLM"),
+        "embedding_seconds": (float, "Latência de cada chamada de embedding"),
+        "embedding_item_seconds": (float, "Custo adicional por texto em embeddings em lote"),
+        "db_seconds": (float, "Latência de cada consulta ao Supabase"),
+        "jitter": (float, "Desvio da log-normal das latências (0 = latência fixa)"),
+        "corpus_articles": (int, "Artigos sintéticos por área jurídica"),
+        "seed": (int, "Semente das latências e do corpus"),
+    }
+
+    @classmethod
+    def add_arguments(cls, parser: argparse.ArgumentParser) -> None:
+        defaults = cls()
+        group = parser.add_argument_group("substitutos locais (Gemini/Supabase)")
+        for name, (kind, description) in cls.OPTIONS.items():
+            default = getattr(defaults, name)
+            group.add_argument(f"--{name.replace('_', '-')}", type=kind, default=default,
+                               help=f"{description} (padrão: {default})")
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "FakeProfile":
+        return cls(**{name: getattr(args, name) for name in cls.OPTIONS})
+
+    def to_argv(self) -> List[str]:
+        argv = []
+        for name in self.OPTIONS:
+            argv += [f"--{name.replace('_', '-')}", str(getattr(self, name))]
+        return argv
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.OPTIONS}
+
+    def sample(self, seconds: float) -> float:
+        """Latência sorteada em torno de `seconds`."""
+        if seconds <= 0 or self.jitter <= 0:
+            return max(0.0, seconds)
+        return seconds * self._random.lognormvariate(0.0, self.jitter)
+
+
+class FakeStats:
+    """Chamadas recebidas por cada substituto (expostas pelo servidor de benchmark)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return dict(sorted(self._counts.items()))
+
+
+# Instância global dos contadores
+fake_stats = FakeStats()
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_PATTERN.findall(text.lower())
+
+
+# --- Gemini (chat) --- #
+
+class FakeChatModel(BaseChatModel):
+    """Modelo de chat local no lugar do `ChatGoogleGenerativeAI`."""
+
+    model: str = "gemini-fake"
+    temperature: float = 0.0
+
+    profile: ClassVar[FakeProfile] = FakeProfile()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model}
+
+    def _get_ls_params(self, stop: Optional[List[str]] = None, **kwargs: Any):
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params["ls_model_name"] = self.model
+        return params
+
+    def _answer(self, messages: List[BaseMessage]) -> List[str]:
+        """Resposta determinística (em palavras) para a última mensagem."""
+        question = str(messages[-1].content) if messages else ""
+        seed = int.from_bytes(hashlib.blake2b(question.encode("utf-8"), digest_size=8).digest(), "big")
+        words = _words(question)[:12] or ["pergunta"]
+        vocabulary = [word for area in AREA_VOCABULARY.values() for word in area] + COMMON_VOCABULARY
+        filler = random.Random(seed).choices(vocabulary, k=max(0, self.profile.llm_output_tokens - len(words) - 4))
+        return ["Resposta", "simulada", "sobre:"] + words + ["-"] + filler
+
+    def _usage(self, messages: List[BaseMessage], output_tokens: int) -> dict:
+        input_tokens = sum(_estimate_tokens(str(message.content)) for message in messages)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _chunks(self, words: List[str]) -> List[str]:
+        size = max(1, self.profile.llm_chunk_tokens)
+        return [" ".join(words[start:start + size]) + " " for start in range(0, len(words), size)]
+
+    def _generation_seconds(self, words: List[str]) -> float:
+        return self.profile.sample(self.profile.llm_first_token_seconds) + len(words) * self.profile.llm_token_seconds
+
+    def _result(self, messages: List[BaseMessage], words: List[str]) -> ChatResult:
+        message = AIMessage(content=" ".join(words), usage_metadata=self._usage(messages, len(words)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        fake_stats.inc(f"llm:{self.model}")
+        words = self._answer(messages)
+        time.sleep(self._generation_seconds(words))
+        return self._result(messages, words)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        fake_stats.inc(f"llm:{self.model}")
+        words = self._answer(messages)
+        await asyncio.sleep(self._generation_seconds(words))
+        return self._result(messages, words)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        fake_stats.inc(f"llm:{self.model}")
+        words = self._answer(messages)
+        time.sleep(self.profile.sample(self.profile.llm_first_token_seconds))
+        for text in self._chunks(words):
+            time.sleep(len(text.split()) * self.profile.llm_token_seconds)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, len(words))))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        fake_stats.inc(f"llm:{self.model}")
+        words = self._answer(messages)
+        await asyncio.sleep(self.profile.sample(self.profile.llm_first_token_seconds))
+        for text in self._chunks(words):
+            await asyncio.sleep(len(text.split()) * self.profile.llm_token_seconds)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, len(words))))
+
+
+# --- Gemini (embeddings) --- #
+
+def hashed_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    """Vetor normalizado de um bag-of-words com hashing (textos parecidos, vetores próximos)."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _words(text):
+        digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+        vector[digest % dimensions] += 1.0 if (digest >> 32) & 1 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings locais no lugar do `GoogleGenerativeAIEmbeddings`."""
+
+    profile: FakeProfile = FakeProfile()
+
+    def __init__(self, *args, **kwargs):
+        # Aceita (e ignora) os parâmetros do cliente do Google
+        pass
+
+    def embed_query(self, text: str) -> List[float]:
+        fake_stats.inc("embedding:query")
+        time.sleep(self.profile.sample(self.profile.embedding_seconds))
+        return hashed_embedding(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        fake_stats.inc("embedding:documents")
+        fake_stats.inc("embedding:documents_texts", len(texts))
+        time.sleep(self.profile.sample(self.profile.embedding_seconds) + len(texts) * self.profile.embedding_item_seconds)
+        return [hashed_embedding(text) for text in texts]
+
+
+# --- Supabase --- #
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    """Subconjunto do query builder do PostgREST usado pela aplicação."""
+
+    def __init__(self, db: "InMemorySupabase", table: str):
+        self._db = db
+        self._table = table
+        self._operation = "select"
+        self._columns: Optional[List[str]] = None
+        self._payload = None
+        self._filters = []
+        self._order = None
+        self._limit: Optional[int] = None
+        self._range = None
+        self._conflict: Optional[str] = None
+
+    def select(self, columns: str = "*", **kwargs) -> "_Query":
+        self._operation = "select"
+        self._columns = None if columns.strip() == "*" else [column.strip() for column in columns.split(",")]
+        return self
+
+    def insert(self, payload, **kwargs) -> "_Query":
+        self._operation, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "", **kwargs) -> "_Query":
+        self._operation, self._payload = "upsert", payload
+        self._conflict = on_conflict or None
+        return self
+
+    def update(self, payload, **kwargs) -> "_Query":
+        self._operation, self._payload = "update", payload
+        return self
+
+    def delete(self, **kwargs) -> "_Query":
+        self._operation = "delete"
+        return self
+
+    def eq(self, column: str, value) -> "_Query":
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column: str, values) -> "_Query":
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def contains(self, column: str, values) -> "_Query":
+        self._filters.append(lambda row: set(values) <= set(row.get(column) or []))
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs) -> "_Query":
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count: int, **kwargs) -> "_Query":
+        self._limit = count
+        return self
+
+    def range(self, start: int, end: int, **kwargs) -> "_Query":
+        self._range = (start, end)
+        return self
+
+    def _run(self) -> _Response:
+        fake_stats.inc(f"db:{self._operation}:{self._table}")
+        return _Response(self._db.run_query(self))
+
+    def execute(self) -> _Response:
+        time.sleep(self._db.profile.sample(self._db.profile.db_seconds))
+        return self._run()
+
+
+class _AsyncQuery(_Query):
+    async def execute(self) -> _Response:
+        await asyncio.sleep(self._db.profile.sample(self._db.profile.db_seconds))
+        return self._run()
+
+
+class _Rpc:
+    """Chamada a uma função SQL; `params` segue a interface usada pelo SupabaseVectorStore."""
+
+    def __init__(self, db: "InMemorySupabase", name: str, arguments: dict):
+        self._db = db
+        self._name = name
+        self._arguments = arguments or {}
+        self.params = httpx.QueryParams()
+
+    def _run(self) -> _Response:
+        fake_stats.inc(f"rpc:{self._name}")
+        limit = self.params.get("limit")
+        return _Response(self._db.call(self._name, self._arguments, int(limit) if limit else None))
+
+    def execute(self) -> _Response:
+        time.sleep(self._db.profile.sample(self._db.profile.db_seconds))
+        return self._run()
+
+
+class _AsyncRpc(_Rpc):
+    async def execute(self) -> _Response:
+        await asyncio.sleep(self._db.profile.sample(self._db.profile.db_seconds))
+        return self._run()
+
+
+class InMemorySupabase:
+    """
+    Cliente Supabase em memória: tabelas como listas de dicionários e as funções
+    de busca vetorial/por artigo sobre uma matriz numpy do corpus sintético.
+    """
+
+    AREA_FUNCTION = re.compile(r"^match_documents_(?P<area>\w+)_area$")
+
+    def __init__(self, profile: FakeProfile, areas: Optional[List[str]] = None):
+        self.profile = profile
+        self.tables: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._build_corpus(areas or list(AREA_VOCABULARY))
+
+    # --- Corpus --- #
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _build_corpus(self, areas: List[str]) -> None:
+        rng = random.Random(self.profile.seed)
+        documents, chunks, vectors, chunk_areas = [], [], [], []
+        self._articles: Dict[str, List[int]] = {}
+        for area in areas:
+            vocabulary = AREA_VOCABULARY.get(area, []) + COMMON_VOCABULARY
+            document_id = self._new_id()
+            documents.append({"id": document_id, "title": f"Código sintético ({area})", "legal_area": area})
+            for number in range(1, self.profile.corpus_articles + 1):
+                articles = [str(number)]
+                text = f"Art. {number}. " + " ".join(rng.choices(vocabulary, k=rng.randint(40, 80))) + "."
+                if rng.random() < 0.4:
+                    articles.append(f"{number}§1")
+                    text += " § 1º " + " ".join(rng.choices(vocabulary, k=rng.randint(15, 30))) + "."
+                chunk = {
+                    "id": self._new_id(), "document_id": document_id, "chunk_index": number - 1,
+                    "content": text, "articles": articles,
+                }
+                for identifier in articles:
+                    self._articles.setdefault(identifier, []).append(len(chunks))
+                chunks.append(chunk)
+                vectors.append(hashed_embedding(text))
+                chunk_areas.append(area)
+        self.tables["dir_knowledge_base"] = documents
+        self.tables["dir_knowledge_base_chunks"] = chunks
+        self.tables["dir_knowledge_base_versions"] = [{"legal_area": area, "version": f"bench-{self.profile.seed}"} for area in areas]
+        self._chunks = chunks
+        self._matrix = np.asarray(vectors, dtype=np.float32)
+        self._chunk_areas = np.asarray(chunk_areas)
+
+    # --- Interface do cliente --- #
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _Rpc:
+        return _Rpc(self, name, params)
+
+    def run_query(self, query: _Query) -> List[dict]:
+        with self._lock:
+            rows = self.tables.setdefault(query._table, [])
+            if query._operation in ("insert", "upsert"):
+                return self._write(rows, query)
+            selected = [row for row in rows if all(check(row) for check in query._filters)]
+            if query._operation == "update":
+                for row in selected:
+                    row.update(query._payload)
+                return [dict(row) for row in selected]
+            if query._operation == "delete":
+                removed = {id(row) for row in selected}
+                rows[:] = [row for row in rows if id(row) not in removed]
+                return selected
+
+        if query._order:
+            column, desc = query._order
+            selected.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if query._range:
+            selected = selected[query._range[0]:query._range[1] + 1]
+        if query._limit is not None:
+            selected = selected[:query._limit]
+        if query._columns:
+            return [{column: row.get(column) for column in query._columns} for row in selected]
+        return [dict(row) for row in selected]
+
+    def _write(self, rows: List[dict], query: _Query) -> List[dict]:
+        payload = query._payload if isinstance(query._payload, list) else [query._payload]
+        written = []
+        for item in payload:
+            item = dict(item)
+            if query._operation == "upsert":
+                key = query._conflict or next((k for k in ("id", "name", "legal_area") if k in item), None)
+                existing = next((row for row in rows if key and row.get(key) == item.get(key)), None)
+                if existing is not None:
+                    existing.update(item)
+                    written.append(dict(existing))
+                    continue
+            item.setdefault("id", self._new_id())
+            rows.append(item)
+            written.append(dict(item))
+        return written
+
+    def call(self, name: str, arguments: dict, limit: Optional[int]) -> List[dict]:
+        if name == "exec_sql":
+            return []
+        if name == "match_documents_multi_area":
+            return self._search(arguments["query_embedding"], arguments.get("filter_areas") or [], arguments.get("match_count", 10))
+        if name == "match_documents_by_article":
+            return self._lookup(arguments.get("article_ids") or [], arguments.get("filter_areas") or [], arguments.get("match_count", 10))
+        match = self.AREA_FUNCTION.match(name)
+        if match:
+            rows = self._search(arguments["query_embedding"], [match.group("area")], limit or arguments.get("match_count", 10))
+            return [{key: row[key] for key in ("id", "content", "document_id", "chunk_index", "similarity")} for row in rows]
+        raise RuntimeError(f"Função '{name}' não existe no Supabase em memória")
+
+    def _search(self, query_embedding, areas: List[str], match_count: int) -> List[dict]:
+        mask = np.isin(self._chunk_areas, areas)
+        if not mask.any():
+            return []
+        positions = np.flatnonzero(mask)
+        scores = self._matrix[positions] @ np.asarray(query_embedding, dtype=np.float32)
+        count = min(match_count, len(positions))
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {
+                "id": self._chunks[positions[i]]["id"],
+                "content": self._chunks[positions[i]]["content"],
+                "legal_area": str(self._chunk_areas[positions[i]]),
+                "document_id": self._chunks[positions[i]]["document_id"],
+                "chunk_index": self._chunks[positions[i]]["chunk_index"],
+                "similarity": float(scores[i]),
+            }
+            for i in best
+        ]
+
+    def _lookup(self, identifiers: List[str], areas: List[str], match_count: int) -> List[dict]:
+        found = []
+        for identifier in identifiers:
+            for position in self._articles.get(identifier, []):
+                if self._chunk_areas[position] in areas and position not in found:
+                    found.append(position)
+        return [
+            {
+                "id": self._chunks[position]["id"],
+                "content": self._chunks[position]["content"],
+                "legal_area": str(self._chunk_areas[position]),
+                "articles": self._chunks[position]["articles"],
+                "document_id": self._chunks[position]["document_id"],
+                "chunk_index": self._chunks[position]["chunk_index"],
+                "similarity": 1.0,
+            }
+            for position in found[:match_count]
+        ]
+
+
+class AsyncInMemorySupabase:
+    """Interface assíncrona sobre o mesmo banco em memória."""
+
+    def __init__(self, db: InMemorySupabase):
+        self._db = db
+
+    def table(self, name: str) -> _AsyncQuery:
+        return _AsyncQuery(self._db, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _AsyncRpc:
+        return _AsyncRpc(self._db, name, params)
+
+
+def install(profile: FakeProfile) -> InMemorySupabase:
+    """
+    Substitui os clientes do Gemini e do Supabase pelos locais. Deve ser chamado
+    antes de o primeiro agente ser importado (os agentes criam o cliente de chat
+    no import).
+    """
+    import langchain_google_genai
+
+    FakeChatModel.profile = profile
+    FakeEmbeddings.profile = profile
+    langchain_google_genai.ChatGoogleGenerativeAI = FakeChatModel
+    langchain_google_genai.GoogleGenerativeAIEmbeddings = FakeEmbeddings
+
+    from app.services.embedding_service import embedding_service
+    from app.services.supabase_service import supabase_service
+
+    embedding_service._embeddings_model = FakeEmbeddings()
+    db = InMemorySupabase(profile)
+    supabase_service._client = db
+    supabase_service._async_client = AsyncInMemorySupabase(db)
+    return db
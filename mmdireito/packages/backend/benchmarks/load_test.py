@@ -0,0 +1,441 @@
+# benchmarks/load_test.py
+"""
+Teste de carga offline da API.
+
+Sobe `benchmarks/server.py` (a API com os substitutos locais do Gemini e do
+Supabase) em um processo separado e dispara requisições em `/agent/chat/{agent}`
+(ou na variante em stream) e em `/agent/upload-contract` com a concorrência
+pedida. Para cada agente relata latência p50/p95/p99, throughput, respostas
+por status, memória do servidor e as chamadas que chegaram aos substitutos.
+
+    python -m benchmarks.load_test --concurrency 16 --requests 200
+    python -m benchmarks.load_test --agents agente-penal --stream --save-baseline bench.json
+    python -m benchmarks.load_test --baseline bench.json --tolerance 0.15
+
+Com `--baseline`, sai com código 1 se p95 ou throughput piorarem além da
+tolerância, como o `scripts/benchmark_cold_start.py`.
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+# Adiciona o diretório raiz do projeto ao path para permitir importações de módulos da app
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import httpx
+
+from benchmarks.fakes import AREA_VOCABULARY, FakeProfile
+
+# Perguntas por agente; "{n}" vira um número de artigo e "{a}"/"{b}" termos do vocabulário
+QUESTION_TEMPLATES = {
+    "agente-penal": (
+        ["Qual a pena prevista no art. {n} do Código Penal?",
+         "Como a {a} influencia a dosimetria da pena em casos de {b}?",
+         "O que diz o artigo {n} do CPP sobre {a}?"],
+        AREA_VOCABULARY["penal"] + AREA_VOCABULARY["processual_penal"],
+    ),
+    "agente-civil": (
+        ["Quais são os requisitos de {a} no Código Civil?",
+         "Como funciona a {a} quando há {b} entre as partes?",
+         "O art. {n} do Código Civil se aplica à {a}?"],
+        AREA_VOCABULARY["civil"],
+    ),
+    "devil-advocate": (
+        ["Quais os pontos fracos da tese de {a} em um processo sobre {b}?",
+         "Como a outra parte contestaria um pedido de {a} fundado em {b}?"],
+        AREA_VOCABULARY["civil"] + AREA_VOCABULARY["penal"],
+    ),
+    "contract-analyzer": (
+        ["Quais os riscos de uma cláusula de {a} em um contrato de {b}?",
+         "Como redigir uma cláusula de {a} que proteja o contratante em caso de {b}?"],
+        AREA_VOCABULARY["civil"],
+    ),
+}
+
+TERMINAL_UPLOAD_STATUSES = ("completed", "failed")
+
+
+def question_pool(agent: str, size: int, rng: random.Random) -> List[str]:
+    """Perguntas distintas do agente; um pool pequeno simula perguntas repetidas (acertos de cache)."""
+    templates, vocabulary = QUESTION_TEMPLATES.get(agent, QUESTION_TEMPLATES["agente-civil"])
+    pool = []
+    for _ in range(size * 20):
+        if len(pool) >= size:
+            break
+        question = rng.choice(templates).format(
+            n=rng.randint(1, 300), a=rng.choice(vocabulary), b=rng.choice(vocabulary)
+        )
+        if question not in pool:
+            pool.append(question)
+    return pool
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def server_memory(pid: Optional[int]) -> Optional[dict]:
+    """RSS atual e pico do processo do servidor (Linux, via /proc)."""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    to_mb = lambda name: round(int(fields[name].split()[0]) / 1024, 1) if name in fields else None
+    return {"rss_mb": to_mb("VmRSS"), "peak_rss_mb": to_mb("VmHWM")}
+
+
+def memory_summary(before: Optional[dict], after: Optional[dict]) -> Optional[dict]:
+    if not before or not after:
+        return None
+    return {**after, "rss_delta_mb": round(after["rss_mb"] - before["rss_mb"], 1)}
+
+
+def calls_delta(before: dict, after: dict) -> dict:
+    return {name: count - before.get(name, 0) for name, count in after.items() if count != before.get(name, 0)}
+
+
+class ScenarioStats:
+    """Latências e status das requisições de um cenário."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.finished = self.started
+
+    def record(self, status: str, latency: float, first_token: Optional[float] = None) -> None:
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status == "200":
+            self.latencies.append(latency)
+            if first_token is not None:
+                self.first_token.append(first_token)
+
+    def summary(self) -> dict:
+        elapsed = max(self.finished - self.started, 1e-9)
+        total = sum(self.statuses.values())
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        summary = {
+            "requests": total,
+            "ok": len(self.latencies),
+            "statuses": dict(sorted(self.statuses.items())),
+            "error_rate": round(1 - len(self.latencies) / total, 4) if total else 0.0,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(self.latencies) / elapsed, 2),
+            "latency_ms": {
+                "p50": ms(percentile(self.latencies, 0.50)),
+                "p95": ms(percentile(self.latencies, 0.95)),
+                "p99": ms(percentile(self.latencies, 0.99)),
+                "max": ms(max(self.latencies) if self.latencies else None),
+            },
+        }
+        if self.first_token:
+            summary["first_token_ms"] = {
+                "p50": ms(percentile(self.first_token, 0.50)),
+                "p95": ms(percentile(self.first_token, 0.95)),
+                "p99": ms(percentile(self.first_token, 0.99)),
+            }
+        return summary
+
+
+# --- Chat --- #
+
+async def send_chat(client: httpx.AsyncClient, agent: str, session_id: str, message: str, stream: bool, stats: ScenarioStats) -> None:
+    payload = {"session_id": session_id, "message": message}
+    started = time.perf_counter()
+    try:
+        if not stream:
+            response = await client.post(f"/agent/chat/{agent}", json=payload)
+            stats.record(str(response.status_code), time.perf_counter() - started)
+            return
+
+        first_token = None
+        status = None
+        async with client.stream("POST", f"/agent/chat/{agent}/stream", json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                status = str(response.status_code)
+            else:
+                async for line in response.aiter_lines():
+                    if line == "event: token" and first_token is None:
+                        first_token = time.perf_counter() - started
+                    elif line == "event: error":
+                        status = "stream_error"
+        stats.record(status or "200", time.perf_counter() - started, first_token)
+    except httpx.HTTPError as e:
+        stats.record(type(e).__name__, time.perf_counter() - started)
+
+
+async def run_chat(client: httpx.AsyncClient, agent: str, args: argparse.Namespace, rng: random.Random) -> ScenarioStats:
+    """Usuários simultâneos; cada sessão envia `turns` mensagens em sequência."""
+    questions = question_pool(agent, args.question_pool, rng)
+    sessions = max(1, args.requests // args.turns)
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(sessions):
+        queue.put_nowait(f"bench-{agent}-{index}")
+
+    stats = ScenarioStats(agent)
+
+    async def user() -> None:
+        while not queue.empty():
+            session_id = queue.get_nowait()
+            for _ in range(args.turns):
+                await send_chat(client, agent, session_id, rng.choice(questions), args.stream, stats)
+
+    await asyncio.gather(*(user() for _ in range(args.concurrency)))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+# --- Upload de contratos --- #
+
+def build_contract(index: int, clauses: int) -> bytes:
+    """Contrato DOCX sintético; o índice muda as partes e o objeto, então cada arquivo é distinto."""
+    import docx
+
+    rng = random.Random(index)
+    vocabulary = AREA_VOCABULARY["civil"]
+    document = docx.Document()
+    document.add_heading(f"CONTRATO DE PRESTAÇÃO DE SERVIÇOS Nº {index}", level=1)
+    document.add_paragraph(
+        f"Contratante: Empresa Exemplo {index} Ltda. Contratada: Fornecedora {rng.randint(1, 10**6)} S.A."
+    )
+    for clause in range(1, clauses + 1):
+        document.add_paragraph(f"CLÁUSULA {clause}ª – DA {rng.choice(vocabulary).upper()}")
+        document.add_paragraph(" ".join(rng.choices(vocabulary, k=rng.randint(40, 90))).capitalize() + ".")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+async def upload_contract(client: httpx.AsyncClient, index: int, args: argparse.Namespace, stats: ScenarioStats) -> None:
+    """Envia o contrato e acompanha o job até o fim; a latência vai do envio à conclusão."""
+    content = build_contract(index, args.contract_clauses)
+    files = {"file": (f"contrato-{index}.docx", content,
+                      "application/vnd.openxmlformats-officedocument.wordprocessingml.document")}
+    started = time.perf_counter()
+    try:
+        response = await client.post("/agent/upload-contract", data={"session_id": f"bench-upload-{index}"}, files=files)
+        if response.status_code != 202:
+            stats.record(str(response.status_code), time.perf_counter() - started)
+            return
+        accepted = time.perf_counter() - started
+        job_id = response.json()["job_id"]
+        while True:
+            job = (await client.get(f"/agent/upload-contract/{job_id}")).json()
+            if job["status"] in TERMINAL_UPLOAD_STATUSES:
+                break
+            await asyncio.sleep(args.poll_interval)
+        status = "200" if job["status"] == "completed" else "job_failed"
+        # "first_token" aqui é o tempo até o 202 (o job segue em segundo plano)
+        stats.record(status, time.perf_counter() - started, accepted)
+    except httpx.HTTPError as e:
+        stats.record(type(e).__name__, time.perf_counter() - started)
+
+
+async def run_uploads(client: httpx.AsyncClient, args: argparse.Namespace) -> ScenarioStats:
+    stats = ScenarioStats("upload-contract")
+    semaphore = asyncio.Semaphore(args.upload_concurrency)
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            await upload_contract(client, index, args, stats)
+
+    await asyncio.gather(*(one(index) for index in range(args.uploads)))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+# --- Servidor --- #
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(profile: FakeProfile, port: int, log_file) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.server", "--port", str(port), *profile.to_argv()],
+        cwd=project_root,
+        env={**os.environ, "PYTHONPATH": project_root},
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, process: Optional[subprocess.Popen], timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"O servidor de benchmark terminou durante o boot (código {process.returncode})")
+        try:
+            if (await client.get("/health/startup")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"O servidor de benchmark não respondeu em {timeout:.0f}s")
+
+
+async def fake_calls(client: httpx.AsyncClient) -> dict:
+    try:
+        response = await client.get("/benchmark/fakes")
+        return response.json().get("calls", {}) if response.status_code == 200 else {}
+    except httpx.HTTPError:
+        return {}
+
+
+async def run(args: argparse.Namespace, base_url: str, pid: Optional[int], process: Optional[subprocess.Popen]) -> dict:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.upload_concurrency) + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        await wait_ready(client, process, args.ready_timeout)
+
+        # Primeira requisição de cada agente fora da medição (import do agente = cold start)
+        for agent in args.agents:
+            await send_chat(client, agent, f"bench-warmup-{agent}", "Olá, pode me ajudar?", False, ScenarioStats("warmup"))
+
+        scenarios = {}
+        for agent in args.agents:
+            calls_before, memory_before = await fake_calls(client), server_memory(pid)
+            stats = await run_chat(client, agent, args, rng)
+            scenarios[agent] = stats.summary()
+            scenarios[agent]["fake_calls"] = calls_delta(calls_before, await fake_calls(client))
+            scenarios[agent]["memory"] = memory_summary(memory_before, server_memory(pid))
+
+        if args.uploads:
+            calls_before, memory_before = await fake_calls(client), server_memory(pid)
+            stats = await run_uploads(client, args)
+            scenarios["upload-contract"] = stats.summary()
+            if "first_token_ms" in scenarios["upload-contract"]:
+                scenarios["upload-contract"]["accepted_ms"] = scenarios["upload-contract"].pop("first_token_ms")
+            scenarios["upload-contract"]["fake_calls"] = calls_delta(calls_before, await fake_calls(client))
+            scenarios["upload-contract"]["memory"] = memory_summary(memory_before, server_memory(pid))
+
+        if args.metrics_out:
+            with open(args.metrics_out, "w", encoding="utf-8") as f:
+                f.write((await client.get("/metrics")).text)
+
+    return {
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "turns": args.turns,
+            "stream": args.stream,
+            "question_pool": args.question_pool,
+            "uploads": args.uploads,
+            "upload_concurrency": args.upload_concurrency,
+            "profile": FakeProfile.from_args(args).to_dict(),
+        },
+        "scenarios": scenarios,
+    }
+
+
+def check(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lista as regressões de p95 e throughput em relação ao baseline."""
+    failures = []
+    limit = 1 + tolerance
+    for name, current in results["scenarios"].items():
+        reference = baseline.get("scenarios", {}).get(name)
+        if not reference:
+            continue
+        p95, reference_p95 = current["latency_ms"]["p95"], reference["latency_ms"]["p95"]
+        if p95 and reference_p95 and p95 > reference_p95 * limit:
+            failures.append(f"Regressão no p95 de '{name}': {p95} ms vs baseline {reference_p95} ms")
+        throughput, reference_throughput = current["throughput_rps"], reference["throughput_rps"]
+        if reference_throughput and throughput < reference_throughput / limit:
+            failures.append(f"Regressão no throughput de '{name}': {throughput} req/s vs baseline {reference_throughput} req/s")
+    return failures
+
+
+def main():
+    from app.services.service_registry import AGENT_NAMES
+
+    parser = argparse.ArgumentParser(description="Teste de carga offline da API (Gemini e Supabase substituídos localmente).")
+    parser.add_argument("--agents", nargs="*", default=AGENT_NAMES, help="Agentes a medir (padrão: todos)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Usuários simultâneos por agente (padrão: 8)")
+    parser.add_argument("--requests", type=int, default=100, help="Mensagens por agente (padrão: 100)")
+    parser.add_argument("--turns", type=int, default=1, help="Mensagens por sessão, em sequência (padrão: 1)")
+    parser.add_argument("--stream", action="store_true", help="Usa /agent/chat/{agent}/stream e mede o primeiro token")
+    parser.add_argument("--question-pool", type=int, default=50,
+                        help="Perguntas distintas por agente; menor = mais repetição e acertos de cache (padrão: 50)")
+    parser.add_argument("--uploads", type=int, default=10, help="Contratos enviados (0 desliga o cenário; padrão: 10)")
+    parser.add_argument("--upload-concurrency", type=int, default=2, help="Uploads simultâneos (padrão: 2)")
+    parser.add_argument("--contract-clauses", type=int, default=40, help="Cláusulas de cada contrato sintético (padrão: 40)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Intervalo de consulta do job de upload (padrão: 0.05 s)")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout de cada requisição (padrão: 120 s)")
+    parser.add_argument("--ready-timeout", type=float, default=120, help="Espera máxima pelo boot do servidor (padrão: 120 s)")
+    parser.add_argument("--url", type=str, default=None,
+                        help="Usa um servidor já em execução (ex.: benchmarks/server.py) em vez de subir um; sem medição de memória")
+    parser.add_argument("--metrics-out", type=str, default=None, help="Grava o /metrics do servidor ao final neste arquivo")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Arquivo JSON com uma medição anterior, para detectar regressões")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Regressão tolerada em relação ao baseline (padrão: 0.25 = 25%%)")
+    parser.add_argument("--save-baseline", type=str, default=None,
+                        help="Grava a medição atual como baseline neste arquivo")
+    FakeProfile.add_arguments(parser)
+    args = parser.parse_args()
+
+    process = None
+    with tempfile.TemporaryFile(mode="w+") as server_log:
+        if args.url:
+            base_url, pid = args.url, None
+        else:
+            port = free_port()
+            process = start_server(FakeProfile.from_args(args), port, server_log)
+            base_url, pid = f"http://127.0.0.1:{port}", process.pid
+
+        try:
+            results = asyncio.run(run(args, base_url, pid, process))
+        except Exception:
+            server_log.seek(0)
+            print(server_log.read()[-4000:], file=sys.stderr)
+            raise
+        finally:
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failures = check(results, baseline, args.tolerance) if baseline else []
+    for failure in failures:
+        print(f"FALHA: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
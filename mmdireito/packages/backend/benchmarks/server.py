@@ -0,0 +1,69 @@
+# benchmarks/server.py
+"""
+Sobe a API com os substitutos locais do Gemini e do Supabase.
+
+Normalmente é iniciado pelo `benchmarks/load_test.py`, mas pode rodar sozinho
+para medições manuais ou com outro gerador de carga:
+
+    python -m benchmarks.server --port 8765 --llm-first-token-seconds 1.0
+"""
+import os
+import sys
+import atexit
+import argparse
+import shutil
+import tempfile
+
+# Adiciona o diretório raiz do projeto ao path para permitir importações de módulos da app
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+# Ambiente isolado: nada é lido nem gravado nos caches, índices e sessões reais.
+# Precisa vir antes do import da app (as configurações são lidas no import).
+BENCHMARK_DIR = tempfile.mkdtemp(prefix="mmdireito-bench-")
+atexit.register(shutil.rmtree, BENCHMARK_DIR, ignore_errors=True)
+BENCHMARK_ENV = {
+    "GOOGLE_API_KEY": "offline-benchmark",
+    "SUPABASE_URL": "http://supabase.invalid",
+    "SUPABASE_SERVICE_KEY": "offline-benchmark",
+    "LOG_LEVEL": "WARNING",
+    "LOCAL_INDEX_ENABLED": "false",
+    "SESSION_BACKEND": "none",
+    "EMBEDDING_CACHE_DISK_PATH": "",
+    "CONTRACT_INDEX_CACHE_DIR": os.path.join(BENCHMARK_DIR, "contract_indexes"),
+}
+for name, value in BENCHMARK_ENV.items():
+    os.environ.setdefault(name, value)
+
+from benchmarks.fakes import FakeProfile, fake_stats, install
+
+
+def create_app(profile: FakeProfile):
+    """Instala os substitutos e devolve a aplicação, com uma rota extra de contadores."""
+    install(profile)
+
+    from main import app
+
+    @app.get("/benchmark/fakes", include_in_schema=False)
+    async def fake_calls():
+        """Chamadas recebidas pelos substitutos (LLM, embeddings, banco) desde o início."""
+        return {"profile": profile.to_dict(), "calls": fake_stats.to_dict()}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API com substitutos locais do Gemini e do Supabase.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Endereço (padrão: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Porta (padrão: 8765)")
+    FakeProfile.add_arguments(parser)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(FakeProfile.from_args(args))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == '__main__':
+    main()
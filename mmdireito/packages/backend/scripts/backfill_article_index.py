@@ -0,0 +1,31 @@
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+# Adiciona o diretório raiz do projeto ao path para permitir importações de módulos da app
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.logger_config import logger
+from app.services.knowledge_base_service import knowledge_base_service
+
+def main(legal_area: str = None) -> int:
+    """Preenche os identificadores de artigos dos chunks já gravados."""
+    try:
+        knowledge_base_service.backfill_article_index(legal_area)
+        return 0
+    except Exception as e:
+        logger.error(f"Falha no backfill do índice de artigos: {e}")
+        return 1
+
+if __name__ == '__main__':
+    # Garante que as variáveis de ambiente sejam carregadas antes de qualquer outra coisa
+    load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+    parser = argparse.ArgumentParser(description="Preenche o índice de artigos dos chunks já existentes na base de conhecimento.")
+    parser.add_argument("--legal-area", type=str, default=None,
+                        help="Restringe o backfill a uma área jurídica (padrão: todas)")
+    args = parser.parse_args()
+
+    sys.exit(main(args.legal_area))
@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Adiciona o diretório raiz do projeto ao path para permitir importações de módulos da app
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+# Módulos que não devem ser carregados pelo simples import da aplicação web
+FORBIDDEN_AT_IMPORT = [
+    "langchain_google_genai",
+    "faiss",
+    "langchain.chains",
+    "app.services.knowledge_base_service",
+    "app.services.contract_chat_service",
+    "app.services.civil_agent_service",
+    "app.services.devil_advocate_service",
+    "app.services.penal_agent_service",
+]
+
+# Executado em um interpretador novo a cada medição, para simular um cold start
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "import_ms": elapsed * 1000,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+FIRST_USE_PROBE = """
+import json, time
+import main
+from app.services.service_registry import services
+started = time.perf_counter()
+services.get(%r)
+print(json.dumps({"first_use_ms": (time.perf_counter() - started) * 1000}))
+"""
+
+
+def run_probe(code: str) -> dict:
+    """Executa o trecho em um processo Python novo e retorna o JSON impresso."""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=project_root,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": project_root},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha ao executar a medição:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(runs: int, agents: list) -> dict:
+    """Mediana do tempo de import e do primeiro uso de cada agente."""
+    import_samples = []
+    loaded = set()
+    for _ in range(runs):
+        probe = run_probe(IMPORT_PROBE % FORBIDDEN_AT_IMPORT)
+        import_samples.append(probe["import_ms"])
+        loaded.update(probe["loaded"])
+
+    first_use = {}
+    for agent in agents:
+        samples = [run_probe(FIRST_USE_PROBE % agent)["first_use_ms"] for _ in range(runs)]
+        first_use[agent] = round(statistics.median(samples), 1)
+
+    return {
+        "import_ms": round(statistics.median(import_samples), 1),
+        "first_use_ms": first_use,
+        "forbidden_loaded": sorted(loaded),
+    }
+
+
+def check(results: dict, import_budget: float, first_use_budget: float, baseline: dict, tolerance: float) -> list:
+    """Lista as violações de orçamento (e de regressão, se houver baseline)."""
+    failures = []
+    if results["forbidden_loaded"]:
+        failures.append(f"Módulos pesados carregados no import: {', '.join(results['forbidden_loaded'])}")
+    if results["import_ms"] > import_budget:
+        failures.append(f"Import da aplicação levou {results['import_ms']} ms (orçamento: {import_budget} ms)")
+    for agent, elapsed in results["first_use_ms"].items():
+        if elapsed > first_use_budget:
+            failures.append(f"Primeiro uso de '{agent}' levou {elapsed} ms (orçamento: {first_use_budget} ms)")
+
+    if baseline:
+        limit = 1 + tolerance
+        if results["import_ms"] > baseline.get("import_ms", float("inf")) * limit:
+            failures.append(f"Regressão no import: {results['import_ms']} ms vs baseline {baseline['import_ms']} ms")
+        for agent, elapsed in results["first_use_ms"].items():
+            reference = baseline.get("first_use_ms", {}).get(agent)
+            if reference and elapsed > reference * limit:
+                failures.append(f"Regressão no primeiro uso de '{agent}': {elapsed} ms vs baseline {reference} ms")
+    return failures
+
+
+def main():
+    from app.services.service_registry import AGENT_NAMES
+
+    parser = argparse.ArgumentParser(description="Mede o cold start da API (import + primeiro uso de cada agente).")
+    parser.add_argument("--runs", type=int, default=3, help="Medições por cenário; usa a mediana (padrão: 3)")
+    parser.add_argument("--agents", nargs="*", default=AGENT_NAMES, help="Agentes a medir (padrão: todos)")
+    parser.add_argument("--import-budget-ms", type=float, default=2000,
+                        help="Tempo máximo para importar a aplicação (padrão: 2000 ms)")
+    parser.add_argument("--first-use-budget-ms", type=float, default=3000,
+                        help="Tempo máximo para instanciar cada agente (padrão: 3000 ms)")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Arquivo JSON com uma medição anterior, para detectar regressões")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Regressão tolerada em relação ao baseline (padrão: 0.25 = 25%%)")
+    parser.add_argument("--save-baseline", type=str, default=None,
+                        help="Grava a medição atual como baseline neste arquivo")
+    args = parser.parse_args()
+
+    results = measure(args.runs, args.agents)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failures = check(results, args.import_budget_ms, args.first_use_budget_ms, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FALHA: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    # Garante que as variáveis de ambiente sejam carregadas antes de qualquer outra coisa
+    load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+    main()
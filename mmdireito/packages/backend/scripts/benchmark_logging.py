@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+# Adiciona o diretório raiz do projeto ao path para permitir importações de módulos da app
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.logger_config import configure_logging, formatter, logger
+
+MESSAGE = "Qual a pena para o crime de furto qualificado com rompimento de obstáculo? " * 3
+
+
+class SlowStream:
+    """Arquivo com latência fixa por escrita (disco lento, volume de rede, coletor remoto)."""
+
+    def __init__(self, stream, latency_seconds: float):
+        self.stream = stream
+        self.latency_seconds = latency_seconds
+
+    def write(self, message: str) -> None:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        self.stream.write(message)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def simulate_request(request_id: str) -> None:
+    """Logs emitidos por uma requisição típica de chat (rota + serviço + etapas)."""
+    with logger.contextualize(request_id=request_id, debug_sampled=True):
+        logger.bind(context=f'message="{MESSAGE[:50]}..."').info(
+            "Recebida requisição de chat para o agente 'penal' na sessão: s-1"
+        )
+        logger.bind(context=f'query="{MESSAGE[:50]}..."').debug("Buscando documentos para sessão s-1")
+        logger.debug("Encontrados 8 documentos relevantes")
+        logger.info("[SIMPLE RAG] Contexto preparado: 6 trechos, ~1800 tokens")
+        logger.bind(context={"seconds": 1.234, "tokens": 512}).debug("Etapa 'llm' concluída")
+        logger.bind(context='response="..."').info("Resposta gerada com sucesso para a sessão s-1")
+
+
+def legacy_handler(stream) -> int:
+    """Configuração anterior: DEBUG, escrita síncrona, cores e diagnose."""
+    logger.remove()
+    return logger.add(stream, format=formatter, level="DEBUG", colorize=True, backtrace=True, diagnose=True)
+
+
+def measure(name: str, setup, requests: int, runs: int, latency_seconds: float) -> dict:
+    """
+    Tempo por requisição de uma configuração, escrevendo em um arquivo de verdade.
+
+    `us_per_request` é o que a thread da requisição paga; `us_per_request_drained`
+    inclui esperar a fila do sink esvaziar (vazão do escritor).
+    """
+    samples = []
+    drained = []
+    dropped = 0
+    written = 0
+    with tempfile.TemporaryDirectory(prefix="benchmark-logging-") as directory:
+        for run in range(runs):
+            path = os.path.join(directory, f"run-{run}.log")
+            with open(path, "w", encoding="utf-8") as file:
+                sink = setup(SlowStream(file, latency_seconds))
+                started = time.perf_counter()
+                for index in range(requests):
+                    simulate_request(f"req-{index}")
+                samples.append((time.perf_counter() - started) / requests * 1e6)
+                if sink is not None:
+                    # A escrita em si acontece na thread do sink
+                    sink.join()
+                    dropped += sink.dropped
+                drained.append((time.perf_counter() - started) / requests * 1e6)
+                logger.remove()
+            written += os.path.getsize(path)
+    return {
+        "config": name,
+        "us_per_request": round(statistics.median(samples), 1),
+        "us_per_request_drained": round(statistics.median(drained), 1),
+        "bytes_per_request": round(written / (requests * runs)),
+        "dropped": dropped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o custo do logging por requisição em cada configuração.")
+    parser.add_argument("--requests", type=int, default=2000, help="Requisições simuladas por medição (padrão: 2000)")
+    parser.add_argument("--runs", type=int, default=5, help="Medições por configuração; usa a mediana (padrão: 5)")
+    parser.add_argument(
+        "--sink-latency-ms", type=float, default=0.05,
+        help="Latência de cada escrita no arquivo, simulando disco lento ou coletor remoto (padrão: 0.05; 0 = arquivo puro)"
+    )
+    args = parser.parse_args()
+
+    scenarios = [
+        ("legado (DEBUG, síncrono)", lambda stream: legacy_handler(stream) and None),
+        ("texto (INFO, fila)", lambda stream: configure_logging("INFO", "text", True, stream)[1]),
+        ("json (INFO, fila)", lambda stream: configure_logging("INFO", "json", True, stream)[1]),
+        ("json (DEBUG, fila)", lambda stream: configure_logging("DEBUG", "json", True, stream)[1]),
+        ("texto (INFO, síncrono)", lambda stream: configure_logging("INFO", "text", False, stream)[1]),
+    ]
+    latency_seconds = args.sink_latency_ms / 1000
+    results = [measure(name, setup, args.requests, args.runs, latency_seconds) for name, setup in scenarios]
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
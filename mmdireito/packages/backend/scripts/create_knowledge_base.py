@@ -10,14 +10,20 @@ sys.path.insert(0, project_root)
 from app.services.knowledge_base_service import knowledge_base_service
 from app.logger_config import logger
 
-def main(pdf_path: str, title: str, legal_area: str = 'civil'):
+def main(pdf_path: str, title: str, legal_area: str = 'civil', batch_size: int = None,
+         concurrency: int = None, incremental: bool = True):
     """Função principal que utiliza o KnowledgeBaseService para indexar um PDF."""
     if not os.path.exists(pdf_path):
         logger.error(f"Arquivo não encontrado: {pdf_path}")
         return
 
+    if batch_size:
+        knowledge_base_service.batch_size = batch_size
+    if concurrency:
+        knowledge_base_service.concurrency = concurrency
+
     try:
-        knowledge_base_service.process_and_save_pdf(pdf_path, title, legal_area)
+        knowledge_base_service.process_and_save_pdf(pdf_path, title, legal_area, incremental=incremental)
     except Exception as e:
         logger.error(f"Ocorreu um erro inesperado durante a indexação: {e}")
 
@@ -31,7 +37,13 @@ if __name__ == '__main__':
     parser.add_argument("--legal-area", type=str, default="civil", 
                        choices=["civil", "penal", "processual_penal", "trabalhista", "tributario", "empresarial", "constitucional"],
                        help="Área jurídica do documento (padrão: civil)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                       help="Quantidade de chunks por lote de embedding/gravação (padrão: INGEST_BATCH_SIZE)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                       help="Lotes de embedding processados em paralelo (padrão: INGEST_EMBED_CONCURRENCY)")
+    parser.add_argument("--full-reindex", action="store_true",
+                       help="Cria um novo documento em vez de atualizar incrementalmente o de mesmo título e área")
     
     args = parser.parse_args()
     
-    main(args.pdf_file, args.title, args.legal_area)
+    main(args.pdf_file, args.title, args.legal_area, args.batch_size, args.concurrency, not args.full_reindex)
@@ -0,0 +1,45 @@
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+# Adiciona o diretório raiz do projeto ao path para permitir importações de módulos da app
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.embedding_service import embedding_service
+from app.services.local_vector_index import build_from_supabase
+from app.services.supabase_service import supabase_service
+
+DEFAULT_AREAS = ["civil", "penal", "processual_penal"]
+
+def main(legal_areas: list, output_dir: str) -> int:
+    """Exporta os chunks e embeddings de cada área do Supabase para o índice local."""
+    failures = 0
+    for area in legal_areas:
+        try:
+            index = build_from_supabase(supabase_service.client, area, embedding_service.model_name)
+            if index is None:
+                failures += 1
+                continue
+            index.save(output_dir)
+            logger.success(f"Índice local de '{area}' atualizado em {output_dir} ({len(index)} chunks)")
+        except Exception as e:
+            failures += 1
+            logger.error(f"Falha ao sincronizar o índice local de '{area}': {e}")
+    return failures
+
+if __name__ == '__main__':
+    # Garante que as variáveis de ambiente sejam carregadas antes de qualquer outra coisa
+    load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+    parser = argparse.ArgumentParser(description="Sincroniza o índice vetorial local dos códigos a partir do Supabase.")
+    parser.add_argument("--legal-area", nargs="*", default=DEFAULT_AREAS,
+                        help="Áreas a exportar (padrão: civil penal processual_penal)")
+    parser.add_argument("--output-dir", type=str, default=settings.LOCAL_INDEX_DIR,
+                        help="Diretório do índice local (padrão: LOCAL_INDEX_DIR)")
+    args = parser.parse_args()
+
+    sys.exit(1 if main(args.legal_area, args.output_dir) else 0)